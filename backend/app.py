@@ -1,21 +1,49 @@
-
+import logging
 import os
-from flask import Flask, request, jsonify, send_from_directory
+import time
+
+# Configured before the pipeline modules are imported so that their startup
+# messages are logged too
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+logging.basicConfig(level=LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger(__name__)
+
+from flask import Flask, Response, g, request, jsonify, send_file
 from flask_cors import CORS
-import pytesseract
-from pdf2image import convert_from_bytes
 from PIL import Image
 # cv2 and numpy are optional - imported when needed
 import io
-from utils.pii_detector import detect_pii
-import re
-# presidio-analyzer is optional - only used if available
-try:
-    from presidio_analyzer import AnalyzerEngine
-    PRESIDIO_AVAILABLE = True
-except ImportError:
-    PRESIDIO_AVAILABLE = False
-    print("⚠️ presidio-analyzer not available - using regex-only PII detection")
+import json
+import threading
+from functools import partial
+from ocr import tesseract_available
+from utils.pii_detector import LEVELS_ORDER, detect_spans, filter_spans_by_level, redact_spans, spans_to_dict
+from utils.artifacts import ArtifactStore
+from utils.batch import BATCH_MAX_DOCUMENTS, BatchError, archive_documents, write_batch_zip
+from utils.cache import content_hash, get_result_cache
+from utils.jobs import JOB_RETRY_AFTER_SECONDS, JobManager, QueueFullError
+from utils.live_detection import DetectionSession
+from utils import metrics
+from utils.models import MODEL_PRELOAD, model_registry
+from utils.pdf_writer import ChunkStream
+from utils.text_stream import iter_text, redact_records, redact_text_stream
+from utils.pipeline import (
+    PDF_DPI,
+    PII_SPAN_BYTES,
+    OCRError,
+    analyses_size,
+    detect_pages,
+    document_redactions,
+    engine_fingerprint,
+    level_value_index,
+    map_pages,
+    mask_spans,
+    ocr_page,
+    output_fingerprint,
+    process_pdf,
+    redact_document_text,
+    redact_page_text,
+)
 
 # winsound is Windows-only, make it optional
 try:
@@ -24,34 +52,15 @@ try:
 except ImportError:
     WINSOUND_AVAILABLE = False
 
-# Check if Tesseract is installed
-TESSERACT_AVAILABLE = False
+# Flask-SocketIO is optional - live detection sessions need it
 try:
-    pytesseract.get_tesseract_version()
-    TESSERACT_AVAILABLE = True
-    print("✅ Tesseract OCR is available")
-except Exception as e:
-    print(f"⚠️ Tesseract OCR not found in PATH: {e}")
-    # Try to find tesseract in common Windows locations
-    common_paths = [
-        r"C:\Program Files\Tesseract-OCR\tesseract.exe",
-        r"C:\Program Files (x86)\Tesseract-OCR\tesseract.exe",
-    ]
-    for path in common_paths:
-        if os.path.exists(path):
-            pytesseract.pytesseract.tesseract_cmd = path
-            try:
-                # Verify it works
-                pytesseract.get_tesseract_version()
-                TESSERACT_AVAILABLE = True
-                print(f"✅ Found and configured Tesseract at: {path}")
-                break
-            except:
-                continue
-    
-    if not TESSERACT_AVAILABLE:
-        print("❌ Tesseract OCR not found. Please install from: https://github.com/UB-Mannheim/tesseract/wiki")
-        print("   Or run: winget install --id UB-Mannheim.TesseractOCR")
+    from flask_socketio import SocketIO, emit
+    SOCKETIO_AVAILABLE = True
+except ImportError:
+    SOCKETIO_AVAILABLE = False
+    logger.warning("Flask-SocketIO not available - live detection sessions are disabled")
+
+LIVE_DETECTION = os.getenv("LIVE_DETECTION", "true").lower() == "true"
 
 app = Flask(__name__)
 
@@ -60,6 +69,35 @@ app = Flask(__name__)
 cors_origins = os.getenv("CORS_ORIGINS", "*").split(",")
 CORS(app, origins=cors_origins, supports_credentials=True)
 
+socketio = None
+if SOCKETIO_AVAILABLE and LIVE_DETECTION:
+    socketio = SocketIO(
+        app,
+        cors_allowed_origins=cors_origins,
+        async_mode=os.getenv("SOCKETIO_ASYNC_MODE", "threading"),
+    )
+
+
+@app.before_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    metrics.start_request()
+
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.get("request_started")
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    metrics.REQUESTS.inc(endpoint=endpoint, method=request.method, status=str(response.status_code))
+    metrics.REQUEST_SECONDS.observe(elapsed, endpoint=endpoint)
+    timings = metrics.request_timings()
+    if metrics.METRICS_TIMING_HEADERS and timings is not None:
+        response.headers["Server-Timing"] = metrics.server_timing(timings, elapsed)
+    return response
+
 
 # POPPLER_PATH - Auto-detect Poppler installation
 POPPLER_PATH = None
@@ -76,30 +114,33 @@ for path in poppler_paths:
         pdftoppm_path = os.path.join(path, "pdftoppm.exe")
         if os.path.exists(pdftoppm_path):
             POPPLER_PATH = path
-            print(f"✅ Found Poppler at: {POPPLER_PATH}")
+            logger.info("Found Poppler at: %s", POPPLER_PATH)
             break
 
 if POPPLER_PATH is None:
-    print("⚠️ Poppler not found. PDF processing may not work.")
-    print("   Download from: https://github.com/oschwartz10612/poppler-windows/releases/")
+    logger.warning(
+        "Poppler not found. PDF processing may not work. "
+        "Download from: https://github.com/oschwartz10612/poppler-windows/releases/"
+    )
 
 
 REDACTED_FOLDER = "redacted_documents"
 os.makedirs(REDACTED_FOLDER, exist_ok=True)
 
+# WSGI environ key of a threading.Event set when the client disconnects (asgi.py)
+DISCONNECTED_ENVIRON_KEY = "pii_redaction.disconnected"
+
+# Redacted output, one artifact per request (see /download)
+artifact_store = ArtifactStore(os.path.join(REDACTED_FOLDER, "artifacts"))
+
+# Background jobs for large documents (see /jobs)
+job_manager = JobManager(os.path.join(REDACTED_FOLDER, "jobs"))
+
+
+# Load every model now instead of on first use (see gunicorn_config.py)
+if MODEL_PRELOAD:
+    model_registry.preload()
 
-# Initialize AnalyzerEngine (optional - only if presidio is available)
-# Using regex-only detection to save memory
-analyzer = None
-if PRESIDIO_AVAILABLE:
-    try:
-        analyzer = AnalyzerEngine()
-        print("✅ Presidio AnalyzerEngine available")
-    except Exception as e:
-        print(f"⚠️ Presidio initialization failed: {e}")
-        analyzer = None
-else:
-    print("ℹ️ Using regex-only PII detection (presidio-analyzer not installed)")
 
 def play_alert_sound():
     """Play alert sound if available (Windows only)"""
@@ -115,309 +156,537 @@ def play_alert_sound():
 
 
 
-CONTEXT_REFERENCES = {
-    "CREDIT_CARD_NUMBER": [
-        "my credit card number is", 
-        "here is my credit card", 
-        "this is my card number", 
-        "use this card for payment",
-        "enter my credit card details"
-    ],
-    "DEBIT_CARD_NUMBER": [
-        "my debit card number is", 
-        "here is my debit card", 
-        "this is my ATM card number", 
-        "use this for the transaction"
-    ],
-    "AADHAAR_NUMBER": [
-        "my Aadhaar card number is", 
-        "Aadhaar number is", 
-        "this is my UIDAI number", 
-        "provide my Aadhaar"
-    ],
-    "PAN_NUMBER": [
-        "my PAN number is", 
-        "here is my PAN", 
-        "this is my tax ID"
-    ],
-    "PASSPORT_NUMBER": [
-        "my passport number is", 
-        "passport details are", 
-        "this is my travel document number"
-    ],
-    "DRIVING_LICENSE": [
-        "my driving license number is", 
-        "license details are", 
-        "this is my DL number"
-    ],
-    "BANK_ACCOUNT_NUMBER": [
-        "my bank account number is", 
-        "account number is", 
-        "deposit it in this account",
-        "transfer money to this account"
-    ],
-    "IFSC_CODE": [
-        "the IFSC code is", 
-        "use this bank IFSC", 
-        "branch IFSC is"
-    ],
-    "UPI_ID": [
-        "send money to this UPI", 
-        "my UPI ID is", 
-        "pay me at this UPI handle"
-    ],
-    "PHONE_NUMBER": [
-        "my phone number is", 
-        "here is my contact number", 
-        "call me at this number"
-    ],
-    "EMAIL_ADDRESS": [
-        "my email address is", 
-        "send it to my email", 
-        "contact me at this email"
-    ]
-}
-
-
-PII_CATEGORIES = {
-    "AADHAAR_NUMBER": r"\b\d{4}\s\d{4}\s\d{4}\b",
-    "PAN_NUMBER": r"\b[A-Z]{5}[0-9]{4}[A-Z]{1}\b",
-    "PASSPORT_NUMBER": r"\b[A-Z]{1}[0-9]{7}\b",
-    "DRIVING_LICENSE": r"\b[A-Z]{2}\d{2}\s\d{4}\s\d{7}\b",
-    "CREDIT_CARD_NUMBER": r"\b\d{4}[-\s]?\d{4}[-\s]?\d{4}[-\s]?\d{4}\b",
-    "DEBIT_CARD_NUMBER": r"\b\d{4}[-\s]?\d{4}[-\s]?\d{4}[-\s]?\d{4}\b",
-    "BANK_ACCOUNT_NUMBER": r"\b\d{9,18}\b",
-    "IFSC_CODE": r"\b[A-Z]{4}0[A-Z0-9]{6}\b",
-    "UPI_ID": r"\b[a-zA-Z0-9.\-_]{2,}@[a-zA-Z]{2,}\b",
-    "PHONE_NUMBER": r"\b\d{10}\b",
-    "EMAIL_ADDRESS": r"\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b"
-}
-
-
-
-def preprocess_image(image):
+def render_document(file_bytes, filename, redaction_level, progress=None, on_page=None, output_format="file",
+                    on_analysis=None):
     """
-    Preprocess the image to improve OCR accuracy.
+    Run the full redaction pipeline on an uploaded file.
+
+    ``progress(pages_done, pages_total, stage)`` is called as pages are
+    analysed and masked (see process_pdf),
+    ``on_analysis(page, pages_total, text, spans)`` as soon as each page's
+    PII is detected, and ``on_page(page, pages_total, text, spans,
+    masked_image)`` with each masked page (neither for results served from
+    the cache).
+    Returns ``(result, status_code)``. On success the result holds the JSON
+    ``response`` (without a download URL), the redacted ``artifact`` bytes
+    and its ``extension``; otherwise it is the JSON error payload.
+
+    With ``output_format="boxes"`` no pixels are masked or encoded: the
+    artifact is None and the response lists the redaction boxes of each page
+    under ``redactions`` instead.
     """
-    try:
-        import cv2
-        import numpy as np
-        gray = cv2.cvtColor(np.array(image), cv2.COLOR_BGR2GRAY)
-        blurred = cv2.GaussianBlur(gray, (5, 5), 0)
-        _, thresholded = cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-        return Image.fromarray(thresholded)
-    except (ImportError, NameError):
-        # If OpenCV or numpy is not available, return image as-is
-        return image
-
-
-def redact_text(text, detected_pii):
+    vector = output_format == "boxes"
+    # Identical uploads are served from the cache; a new redaction level
+    # for a known file reuses its OCR, and its detection results when they
+    # were made for the same level or a higher one
+    cache = get_result_cache()
+    cache_key = f"{content_hash(file_bytes)}:{engine_fingerprint()}"
+    result_key = f"result:{cache_key}:{redaction_level}:{output_format}:{output_fingerprint()}"
+    page_analyses = None
+    # Level the detection results in the cache cover, or None to store them
+    analyses_level = None
+    if cache is not None:
+        cached_result = cache.get(result_key)
+        if cached_result is not None:
+            metrics.RESULT_CACHE_LOOKUPS.inc(result="hit")
+            return cached_result, 200
+        cached_analyses = cache.get(f"ocr:{cache_key}")
+        metrics.RESULT_CACHE_LOOKUPS.inc(result="miss" if cached_analyses is None else "ocr_hit")
+        if cached_analyses is not None:
+            analyses_level, page_analyses = cached_analyses
+            if LEVELS_ORDER.index(analyses_level) < LEVELS_ORDER.index(redaction_level):
+                page_analyses = detect_pages(page_analyses, redaction_level)
+                analyses_level = None
+
+    
+    if filename.lower().endswith(".pdf"):
+        try:
+            extension = "pdf"
+            # Pages are rasterized in bounded windows and processed in parallel
+            try:
+                output = None if vector else io.BytesIO()
+                text, filtered_pii, filtered_spans, analyses = process_pdf(
+                    file_bytes, redaction_level, output, poppler_path=POPPLER_PATH,
+                    page_analyses=page_analyses, progress=progress, on_page=on_page,
+                    on_analysis=on_analysis,
+                )
+            except OCRError as ocr_error:
+                logger.error("OCR error: %s", ocr_error)
+                return {"error": f"OCR processing failed: {str(ocr_error)}. Please ensure Tesseract OCR is properly installed."}, 500
+            artifact = None if vector else output.getvalue()
+        except Exception as e:
+            logger.exception("Error processing PDF")
+            return {"error": f"Error processing PDF: {str(e)}"}, 500
+
+    else:
+        try:
+            image = Image.open(io.BytesIO(file_bytes))
+            if page_analyses is not None:
+                extracted_text, spans, ocr_result = page_analyses[0]
+            else:
+                try:
+                    with metrics.stage("ocr"):
+                        ocr_result = map_pages(ocr_page, [image])[0]
+                except Exception as ocr_error:
+                    logger.error("OCR error: %s", ocr_error)
+                    return {"error": f"OCR processing failed: {str(ocr_error)}. Please ensure Tesseract OCR is properly installed."}, 500
+                metrics.PAGES.inc(source="ocr")
+                metrics.WORDS.inc(len(ocr_result))
+                extracted_text = ocr_result.text
+                with metrics.stage("detection"):
+                    spans = detect_spans(extracted_text, redaction_level=redaction_level)
+            analyses = [(extracted_text, spans, ocr_result)]
+            text = extracted_text
+
+            filtered_spans = filter_spans_by_level(spans, redaction_level)
+            filtered_pii = spans_to_dict(extracted_text, filtered_spans)
+            if progress is not None:
+                progress(1, 1, "analysis")
+            if on_analysis is not None:
+                on_analysis(0, 1, extracted_text, filtered_spans)
+
+            extension = "png"
+            artifact = None
+            if not vector:
+                with metrics.stage("masking"):
+                    masked_image = map_pages(mask_spans, [image], [filtered_spans], [ocr_result])[0]
+                output = io.BytesIO()
+                with metrics.stage("encode"):
+                    masked_image.save(output, format="PNG")
+                artifact = output.getvalue()
+                if progress is not None:
+                    progress(1, 1, "masking")
+                if on_page is not None:
+                    on_page(0, 1, extracted_text, filtered_spans, masked_image)
+        except Exception as e:
+            logger.exception("Error processing image")
+            return {"error": f"Cannot process file: {str(e)}"}, 400
+
+    for pii_type, values in filtered_pii.items():
+        metrics.PII_HITS.inc(len(values), pii_type=pii_type)
+    # Every value masked on the page images is redacted from the text too
+    if extension == "pdf":
+        redacted_text = redact_document_text(analyses, filtered_pii, redaction_level)
+    else:
+        redacted_text = redact_page_text(
+            text, filtered_spans, analyses[0][2], level_value_index(filtered_pii, redaction_level)
+        )
+
+    result = {
+        "extension": extension,
+        "artifact": artifact,
+        "response": {
+            "text": text,
+            "redacted_text": redacted_text,
+            "detected_pii": filtered_pii,
+        },
+    }
+    if vector:
+        result["response"]["redactions"] = document_redactions(analyses, filtered_pii, redaction_level)
+        if extension == "pdf":
+            # Boxes are in pixels of the pages rendered at this resolution
+            result["response"]["dpi"] = PDF_DPI
+    if cache is not None:
+        if analyses_level is None:
+            cache.set(f"ocr:{cache_key}", (redaction_level, analyses), analyses_size(analyses))
+        cache.set(result_key, result, result_size(result))
+    return result, 200
+
+
+def result_size(result):
     """
-    Redact sensitive information in the text.
+    Return the approximate size in bytes of a render_document result: its
+    artifact, texts and redaction boxes.
     """
-    for pii_type, values in detected_pii.items():
-        for value in values:
-            text = text.replace(value, "[REDACTED]")
-    return text
+    response = result["response"]
+    return (
+        len(result["artifact"] or b"")
+        + len(response["text"]) + len(response["redacted_text"])
+        + PII_SPAN_BYTES * sum(len(page["boxes"]) for page in response.get("redactions", ()))
+        + sum(len(value) for values in response["detected_pii"].values() for value in values)
+    )
 
 
-def mask_image(image, detected_pii, redaction_level):
+def redact_document(file_bytes, filename, redaction_level, progress=None, on_page=None, output_format="file",
+                    on_analysis=None):
+    """
+    Redact an uploaded file and store the redacted artifact for /download.
+
+    Returns ``(payload, status_code)`` where payload is the JSON response.
+    """
+    result, status_code = render_document(
+        file_bytes, filename, redaction_level, progress, on_page, output_format, on_analysis
+    )
+    if status_code != 200:
+        return result, status_code
+    if result["artifact"] is None:
+        return result["response"], 200
+    artifact_id = artifact_store.save_bytes(result["artifact"], result["extension"])
+    return dict(result["response"], redacted_file_url=artifact_store.url(artifact_id)), 200
+
+
+def parse_redaction_level(value):
     """
-    Mask sensitive information in the image based on the selected redaction level.
+    Return the requested redaction level, or "basic" if it is unknown.
     """
-    from utils.pii_detector import PII_LEVEL_MAPPING
+    redaction_level = (value or "basic").lower()
+    if redaction_level not in ["basic", "intermediate", "critical"]:
+        redaction_level = "basic"
+    return redaction_level
 
-    
-    levels_order = ['basic', 'intermediate', 'critical']
 
-    try:
-        import cv2
-        import numpy as np
-        image_cv = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
-    except (ImportError, NameError):
-        # If OpenCV or numpy is not available, return image as-is
-        return image
+def read_upload():
+    """
+    Validate the uploaded file and redaction level of the current request.
 
+    Returns ``(file_bytes, filename, redaction_level, None)``, or an error
+    response as the last item.
+    """
+    # Check if Tesseract is available
+    if not tesseract_available():
+        return None, None, None, (jsonify({"error": "Tesseract OCR is not installed. Please install Tesseract OCR to process documents."}), 500)
     
-    custom_config = r"--oem 3 --psm 6"
-    try:
-        data = pytesseract.image_to_data(
-            image, output_type=pytesseract.Output.DICT, config=custom_config
-        )
-    except Exception as e:
-        print(f"OCR Error in mask_image: {str(e)}")
-        # Return original image if OCR fails
-        return image
-    print(data)
-    
-    for i in range(len(data["text"])):
-        text = data["text"][i].strip()  
-        if text:  
-            for pii_type, values in detected_pii.items():
-                
-                if PII_LEVEL_MAPPING.get(pii_type, "basic") in levels_order[: levels_order.index(redaction_level) + 1]:
-                    for value in values:
-                        
-                        if value.strip() in text:
-                            
-                            x, y, w, h = (
-                                data["left"][i],
-                                data["top"][i],
-                                data["width"][i],
-                                data["height"][i],
-                            )
-                            
-                            try:
-                                import cv2
-                                cv2.rectangle(
-                                    image_cv, (x, y), (x + w, y + h), (0, 0, 0), -1
-                                )
-                            except ImportError:
-                                pass
+    if "file" not in request.files:
+        return None, None, None, (jsonify({"error": "No file uploaded"}), 400)
 
-    try:
-        import cv2
-        import numpy as np
-        return Image.fromarray(cv2.cvtColor(image_cv, cv2.COLOR_BGR2RGB))
-    except (ImportError, NameError):
-        return image
+    file = request.files["file"]
+    if file.filename == "":
+        return None, None, None, (jsonify({"error": "No file selected"}), 400)
+
+    redaction_level = parse_redaction_level(request.form.get("redaction_level"))
+    return file.read(), file.filename, redaction_level, None
 
 
 @app.route("/upload", methods=["POST"])
 def upload_document():
     try:
-        # Check if Tesseract is available
-        if not TESSERACT_AVAILABLE:
-            return jsonify({"error": "Tesseract OCR is not installed. Please install Tesseract OCR to process documents."}), 500
-        
-        if "file" not in request.files:
-            return jsonify({"error": "No file uploaded"}), 400
-
-        file = request.files["file"]
-        if file.filename == "":
-            return jsonify({"error": "No file selected"}), 400
-
-        
-        redaction_level = request.form.get("redaction_level", "basic").lower()
-        levels_order = ["basic", "intermediate", "critical"]
-        if redaction_level not in levels_order:
-            redaction_level = "basic"  
-
-        
-        file_bytes = file.read()
-
-        
-        if file.filename.lower().endswith(".pdf"):
-            try:
-                poppler_kwarg = {"poppler_path": POPPLER_PATH} if POPPLER_PATH else {}
-                images = convert_from_bytes(file_bytes, **poppler_kwarg)
-                text = ""
-                all_detected_pii = {}  
-                redacted_images = []
-
-                for image in images:
-                    try:
-                        processed_image = preprocess_image(image)
-                        custom_config = r"--oem 3 --psm 6"
-                        try:
-                            extracted_text = pytesseract.image_to_string(processed_image, config=custom_config)
-                        except Exception as ocr_error:
-                            print(f"OCR Error: {str(ocr_error)}")
-                            return jsonify({"error": f"OCR processing failed: {str(ocr_error)}. Please ensure Tesseract OCR is properly installed."}), 500
-                        text += extracted_text + "\n"
-
-                        print("Extracted Text from Page:", extracted_text)
-                        detected_pii = detect_pii(extracted_text)
-
-                        for pii_type, values in detected_pii.items():
-                            if pii_type in all_detected_pii:
-                                all_detected_pii[pii_type].extend(v for v in values if v not in all_detected_pii[pii_type])
-                            else:
-                                all_detected_pii[pii_type] = values.copy()
-                    except Exception as e:
-                        print(f"Error processing PDF page: {str(e)}")
-                        continue
-
-                from utils.pii_detector import PII_LEVEL_MAPPING
-                filtered_pii = {
-                    pii_type: values
-                    for pii_type, values in all_detected_pii.items()
-                    if levels_order.index(PII_LEVEL_MAPPING.get(pii_type, "basic")) <= levels_order.index(redaction_level)
-                }
-
-                for image in images:
-                    masked_image = mask_image(image, filtered_pii, redaction_level)  
-                    redacted_images.append(masked_image)
-
-                from fpdf import FPDF
-                pdf = FPDF()
-                for redacted_image in redacted_images:
-                    redacted_image_path = os.path.join(REDACTED_FOLDER, "temp.png")
-                    redacted_image.save(redacted_image_path)
-                    pdf.add_page()
-                    pdf.image(redacted_image_path, x=10, y=10, w=190)
-                    os.remove(redacted_image_path)  
-                redacted_pdf_path = os.path.join(REDACTED_FOLDER, "redacted_document.pdf")
-                pdf.output(redacted_pdf_path)
-                redacted_file_url = f"/download/{os.path.basename(redacted_pdf_path)}"
-            except Exception as e:
-                print(f"Error processing PDF: {str(e)}")
-                return jsonify({"error": f"Error processing PDF: {str(e)}"}), 500
-
-        else:
-            try:
-                image = Image.open(io.BytesIO(file_bytes))
-                processed_image = preprocess_image(image)
-                custom_config = r"--oem 3 --psm 6"
-                try:
-                    extracted_text = pytesseract.image_to_string(processed_image, config=custom_config)
-                except Exception as ocr_error:
-                    print(f"OCR Error: {str(ocr_error)}")
-                    return jsonify({"error": f"OCR processing failed: {str(ocr_error)}. Please ensure Tesseract OCR is properly installed."}), 500
-                text = extracted_text
-
-                detected_pii = detect_pii(extracted_text)
-
-                from utils.pii_detector import PII_LEVEL_MAPPING
-                filtered_pii = {
-                    pii_type: values
-                    for pii_type, values in detected_pii.items()
-                    if levels_order.index(PII_LEVEL_MAPPING.get(pii_type, "basic")) <= levels_order.index(redaction_level)
-                }
-
-                masked_image = mask_image(image, filtered_pii, redaction_level)  
-                redacted_image_path = os.path.join(REDACTED_FOLDER, "redacted_image.png")
-                masked_image.save(redacted_image_path)
-                redacted_file_url = f"/download/{os.path.basename(redacted_image_path)}"
-            except Exception as e:
-                print(f"Error processing image: {str(e)}")
-                return jsonify({"error": f"Cannot process file: {str(e)}"}), 400
-
-        redacted_text = redact_text(text, filtered_pii)
-
-        return jsonify(
-            {
-                "text": text,
-                "redacted_text": redacted_text,
-                "detected_pii": filtered_pii,
-                "redacted_file_url": redacted_file_url,  
-            }
-        )
+        file_bytes, filename, redaction_level, error = read_upload()
+        if error is not None:
+            return error
+
+        # "boxes" returns redaction coordinates instead of a redacted file
+        output_format = "boxes" if request.form.get("output", "").lower() == "boxes" else "file"
+        payload, status_code = redact_document(file_bytes, filename, redaction_level, output_format=output_format)
+        return jsonify(payload), status_code
     except Exception as e:
-        print(f"Upload error: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Upload error")
         return jsonify({"error": f"Upload failed: {str(e)}"}), 500
 
 
-@app.route("/download/<filename>", methods=["GET"])
-def download_file(filename):
-    return send_from_directory(REDACTED_FOLDER, filename, as_attachment=True)
+def stream_response(stream, **kwargs):
+    """
+    Return a response that sends what is written to a ChunkStream, stopping
+    the producer when the response is closed, even before it was read.
+    """
+    # Under asgi.py the response is only closed once it has been sent in
+    # full, so the client going away is checked between chunks as well
+    disconnected = request.environ.get(DISCONNECTED_ENVIRON_KEY)
+
+    # Iterate over a generator rather than the stream itself so that
+    # closing the response does not call the producer's close()
+    def relay():
+        for chunk in stream:
+            if disconnected is not None and disconnected.is_set():
+                stream.cancel()
+                return
+            yield chunk
+
+    response = Response(relay(), **kwargs)
+    response.call_on_close(stream.cancel)
+    return response
+
+
+def format_event(event, payload, sse):
+    """
+    Encode one streamed result as an NDJSON line or a server-sent event.
+    """
+    if sse:
+        return f"event: {event}\ndata: {json.dumps(payload)}\n\n".encode()
+    return (json.dumps(dict(payload, event=event)) + "\n").encode()
+
+
+@app.route("/upload/stream", methods=["POST"])
+def upload_document_stream():
+    """
+    Redact an upload and stream each page's result as soon as it is ready
+
+    Sends a ``page`` event per page (text, redacted text and detected PII)
+    as soon as its detection finishes, a ``masked_page`` event with a link
+    to each page once it is masked, and a final ``done`` event with the same
+    fields as /upload, as NDJSON or, with ``Accept: text/event-stream``, as
+    server-sent events.
+    """
+    file_bytes, filename, redaction_level, error = read_upload()
+    if error is not None:
+        return error
+    sse = request.accept_mimetypes.best_match(["application/x-ndjson", "text/event-stream"]) == "text/event-stream"
+
+    stream = ChunkStream()
+
+    def send_analysis(page, pages_total, text, spans):
+        stream.write(format_event("page", {
+            "page": page + 1,
+            "pages_total": pages_total,
+            "text": text,
+            "redacted_text": redact_spans(text, spans),
+            "detected_pii": spans_to_dict(text, spans),
+        }, sse))
+
+    def send_page(page, pages_total, text, spans, masked_image):
+        output = io.BytesIO()
+        with metrics.stage("encode"):
+            masked_image.save(output, format="PNG")
+        artifact_id = artifact_store.save_bytes(output.getvalue(), "png")
+        stream.write(format_event("masked_page", {
+            "page": page + 1,
+            "pages_total": pages_total,
+            "masked_page_url": artifact_store.url(artifact_id),
+        }, sse))
+
+    def run():
+        try:
+            payload, status_code = redact_document(
+                file_bytes, filename, redaction_level, on_page=send_page, on_analysis=send_analysis
+            )
+            if status_code == 200:
+                stream.write(format_event("done", payload, sse))
+            else:
+                stream.write(format_event("error", dict(payload, status=status_code), sse))
+        except BrokenPipeError:
+            pass
+        except Exception as e:
+            logger.exception("Error streaming upload")
+            try:
+                stream.write(format_event("error", {"error": f"Upload failed: {str(e)}", "status": 500}, sse))
+            except BrokenPipeError:
+                pass
+        finally:
+            stream.close()
+
+    threading.Thread(target=run, name="upload-stream", daemon=True).start()
+    return stream_response(
+        stream,
+        mimetype="text/event-stream" if sse else "application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.route("/redact/pdf", methods=["POST"])
+def redact_pdf_stream():
+    """Stream the masked PDF back while later pages are still being processed"""
+    file_bytes, filename, redaction_level, error = read_upload()
+    if error is not None:
+        return error
+    if not filename.lower().endswith(".pdf"):
+        return jsonify({"error": "Only PDF files can be streamed"}), 400
+
+    stream = ChunkStream()
+
+    def write_pdf():
+        try:
+            process_pdf(file_bytes, redaction_level, stream, poppler_path=POPPLER_PATH)
+        except BrokenPipeError:
+            pass
+        except Exception:
+            # The status line has already been sent, so the client sees a
+            # truncated PDF
+            logger.exception("Error streaming PDF")
+        finally:
+            stream.close()
+
+    threading.Thread(target=write_pdf, name="pdf-stream", daemon=True).start()
+    return stream_response(
+        stream,
+        mimetype="application/pdf",
+        headers={"Content-Disposition": 'attachment; filename="redacted_document.pdf"'},
+    )
+
+
+@app.route("/redact/text", methods=["POST"])
+def redact_text():
+    """
+    Redact a raw text body, or NDJSON records, streaming the result back.
+
+    ``redaction_level`` and ``ner`` (true/false) are query parameters since
+    the body is the text itself.
+    """
+    redaction_level = parse_redaction_level(request.args.get("redaction_level"))
+    ner = request.args.get("ner", "true").lower() == "true"
+    # Read lazily while the response is written, so the body never has to
+    # fit in memory
+    stream = request.stream
+
+    if request.mimetype in ("application/x-ndjson", "application/jsonl"):
+        return Response(redact_records(stream, redaction_level, ner), mimetype="application/x-ndjson")
+    return Response(
+        redact_text_stream(iter_text(stream), redaction_level, ner),
+        content_type="text/plain; charset=utf-8",
+    )
+
+
+@app.route("/redact/batch", methods=["POST"])
+def redact_batch():
+    """
+    Redact a ZIP archive or several uploaded files, streaming back a ZIP of
+    the redacted documents and a combined report.json
+    """
+    if not tesseract_available():
+        return jsonify({"error": "Tesseract OCR is not installed. Please install Tesseract OCR to process documents."}), 500
+
+    uploads = [f for f in request.files.getlist("files") + request.files.getlist("file") if f.filename]
+    if not uploads:
+        return jsonify({"error": "No files uploaded"}), 400
+    redaction_level = parse_redaction_level(request.form.get("redaction_level"))
+
+    # Uploads are read now: the request's files are closed once the
+    # streamed response starts
+    documents = []
+    try:
+        for upload in uploads:
+            if upload.filename.lower().endswith(".zip"):
+                documents.extend(archive_documents(upload.read()))
+            else:
+                documents.append((upload.filename, partial(bytes, upload.read())))
+    except BatchError as e:
+        return jsonify({"error": str(e)}), 400
+    if len(documents) > BATCH_MAX_DOCUMENTS:
+        return jsonify({"error": f"At most {BATCH_MAX_DOCUMENTS} documents can be sent in one batch"}), 400
+
+    stream = ChunkStream()
+
+    def write_zip():
+        try:
+            write_batch_zip(documents, partial(render_document, redaction_level=redaction_level), stream)
+        except BrokenPipeError:
+            pass
+        except Exception:
+            logger.exception("Error streaming batch")
+        finally:
+            stream.close()
+
+    threading.Thread(target=write_zip, name="batch-stream", daemon=True).start()
+    return stream_response(
+        stream,
+        mimetype="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="redacted_documents.zip"'},
+    )
+
+
+@app.route("/jobs", methods=["POST"])
+def submit_job():
+    """Queue a document for background redaction and return its job ID"""
+    file_bytes, filename, redaction_level, error = read_upload()
+    if error is not None:
+        return error
+
+    try:
+        job_id = job_manager.submit(redact_document, file_bytes, filename, redaction_level)
+    except QueueFullError as e:
+        response = jsonify({"error": str(e)})
+        response.headers["Retry-After"] = str(JOB_RETRY_AFTER_SECONDS)
+        return response, 503
+
+    return jsonify(
+        {
+            "job_id": job_id,
+            "status_url": f"/jobs/{job_id}",
+            "result_url": f"/jobs/{job_id}/result",
+        }
+    ), 202
+
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    """Report a job's state and page progress"""
+    status = job_manager.status(job_id)
+    if status is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(status), 200
+
+
+@app.route("/jobs/<job_id>/result", methods=["GET"])
+def job_result(job_id):
+    """Return a finished job's redaction result"""
+    status = job_manager.status(job_id)
+    if status is None:
+        return jsonify({"error": "Job not found"}), 404
+    if status["status"] not in ("done", "failed"):
+        return jsonify(status), 409
+
+    payload, status_code = job_manager.result(job_id)
+    return jsonify(payload), status_code
+
+
+@app.route("/download/<artifact_id>", methods=["GET"])
+def download_file(artifact_id):
+    artifact = artifact_store.open(artifact_id)
+    if artifact is None:
+        return jsonify({"error": "File not found or expired"}), 404
+    file, download_name = artifact
+    return send_file(file, as_attachment=True, download_name=download_name)
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """Request, stage and detection metrics in the Prometheus text format"""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
 
 @app.route("/health", methods=["GET"])
 def health_check():
-    """Health check endpoint for deployment"""
-    return jsonify({"status": "healthy", "service": "PII Redaction API"}), 200
+    """Health check endpoint for deployment; 503 until the required models load"""
+    ready = model_registry.ready()
+    return jsonify({
+        "status": "healthy" if ready else "unavailable",
+        "service": "PII Redaction API",
+        "ready": ready,
+        "models": model_registry.status(),
+    }), 200 if ready else 503
+
+# Live detection sessions by Socket.IO connection
+live_sessions = {}
+
+if socketio is not None:
+    @socketio.on("start_transcription")
+    def start_transcription(data=None):
+        """Start a live detection session on this connection"""
+        data = data if isinstance(data, dict) else {}
+        live_sessions[request.sid] = DetectionSession(
+            parse_redaction_level(data.get("redaction_level")),
+            separator=data.get("separator", " "),
+        )
+        return {"status": "started"}
+
+    @socketio.on("transcription_chunk")
+    def transcription_chunk(data):
+        """Scan the next chunk of the transcript and alert on the PII it completes"""
+        session = live_sessions.get(request.sid)
+        if session is None:
+            return {"error": "No transcription in progress"}
+        text = data.get("text", "") if isinstance(data, dict) else str(data or "")
+        if not text:
+            return {"alerts": 0}
+
+        alerts = session.push(text)
+        emit("transcription_update", {"text": text})
+        for alert in alerts:
+            emit("pii_alert", alert)
+        return {"alerts": len(alerts)}
+
+    @socketio.on("stop_transcription")
+    def stop_transcription(data=None):
+        """End the live detection session on this connection"""
+        session = live_sessions.pop(request.sid, None)
+        if session is not None:
+            # Values at the very end of the transcript were held back
+            for alert in session.flush():
+                emit("pii_alert", alert)
+            emit("transcription_complete", {})
+        return {"status": "stopped"}
+
+    @socketio.on("disconnect")
+    def end_live_session(*args):
+        live_sessions.pop(request.sid, None)
+
 
 if __name__ == "__main__":
     # Development mode only
@@ -425,6 +694,9 @@ if __name__ == "__main__":
     port = int(os.getenv("FLASK_PORT", "5000"))
     debug = os.getenv("FLASK_ENV", "production") == "development"
     
-    print(f"Starting Flask server in DEVELOPMENT mode on http://{host}:{port}")
-    print("⚠️  For production, use: gunicorn --worker-class sync --threads 4 -w 1 --bind 0.0.0.0:5000 wsgi:app")
-    app.run(host=host, port=port, debug=debug)  
\ No newline at end of file
+    logger.info("Starting Flask server in DEVELOPMENT mode on http://%s:%s", host, port)
+    logger.warning("For production, use: gunicorn --worker-class sync --threads 4 -w 1 --bind 0.0.0.0:5000 wsgi:app")
+    if socketio is not None:
+        socketio.run(app, host=host, port=port, debug=debug, allow_unsafe_werkzeug=True)
+    else:
+        app.run(host=host, port=port, debug=debug)  
\ No newline at end of file
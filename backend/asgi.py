@@ -0,0 +1,95 @@
+"""
+ASGI entry point for the PII Redaction WebApp
+Use with: GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker gunicorn --config gunicorn_config.py asgi:application
+      or: uvicorn asgi:application --host 0.0.0.0 --port 5000
+
+Connections are handled on an event loop by a2wsgi's WSGIMiddleware: the
+view reads the request body from the loop as it needs it (so /redact/text
+redacts an upload while it is still arriving) and its response is sent as
+it is produced, so a slow client holds a coroutine instead of a thread.
+
+Views run on ASGI_THREADS threads, one per core by default. OCR, regex
+detection and masking go to the page process pool, but views still do some
+CPU work themselves (spaCy NER over a document's pages, text-layer reads,
+PDF/PNG encoding, cache pickling) in this process, under the same GIL as
+the event loop; more view threads than cores would only starve the I/O.
+
+WebSocket connections are refused, so Socket.IO live detection falls back
+to long polling; serve app.py through wsgi.py for WebSocket transport.
+"""
+import asyncio
+import logging
+import os
+import threading
+
+from a2wsgi import WSGIMiddleware
+
+# Single images go to the page pool too, keeping OCR off the view threads
+os.environ.setdefault("PAGE_POOL_MIN_PAGES", "1")
+
+from app import DISCONNECTED_ENVIRON_KEY, app
+
+logger = logging.getLogger(__name__)
+
+# Views running at the same time; their own CPU work competes with the event loop
+ASGI_THREADS = int(os.getenv("ASGI_THREADS", str(os.cpu_count() or 1)))
+# Response chunks a view may produce ahead of a slow client
+ASGI_RESPONSE_BUFFER = int(os.getenv("ASGI_RESPONSE_BUFFER", "64"))
+
+
+def wsgi_app(environ, start_response):
+    """
+    Pass the client's disconnect event (see DisconnectWatch) on to the app.
+    """
+    # The body ends where the ASGI messages end, with or without a length
+    environ["wsgi.input_terminated"] = True
+    environ[DISCONNECTED_ENVIRON_KEY] = environ["asgi.scope"][DISCONNECTED_ENVIRON_KEY]
+    return app(environ, start_response)
+
+
+class DisconnectWatch:
+    """
+    Put a threading.Event in the scope of each HTTP request that is set
+    once the client goes away, so that streaming views can stop early.
+
+    Once the request body has been received nothing else reads from the
+    connection, so a task waits for the disconnect message from then on.
+    """
+
+    def __init__(self, asgi_app):
+        self.asgi_app = asgi_app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.asgi_app(scope, receive, send)
+            return
+
+        disconnected = threading.Event()
+        watcher = None
+
+        async def watch():
+            while (await receive())["type"] != "http.disconnect":
+                pass
+            disconnected.set()
+
+        async def receive_body():
+            nonlocal watcher
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                disconnected.set()
+            elif not message.get("more_body", False) and watcher is None:
+                watcher = asyncio.ensure_future(watch())
+            return message
+
+        try:
+            await self.asgi_app(dict(scope, **{DISCONNECTED_ENVIRON_KEY: disconnected}), receive_body, send)
+        finally:
+            if watcher is not None:
+                watcher.cancel()
+
+
+application = DisconnectWatch(
+    WSGIMiddleware(wsgi_app, workers=ASGI_THREADS, send_queue_size=ASGI_RESPONSE_BUFFER)
+)
+
+logger.info("ASGI application loaded with %d view threads", ASGI_THREADS)
@@ -0,0 +1,459 @@
+"""
+Benchmark the redaction pipeline on a synthetic document corpus.
+
+    python benchmark.py --documents 6 --pages 3 --repeat 3 --output results.json
+
+Documents are generated locally from a fixed seed: A4 pages with filler text
+and planted values for every pattern in PII_PATTERNS, saved as PNG images
+and multi-page PDFs. Each page is timed through the pipeline stages
+(rasterize, preprocess, OCR, detect, mask, encode) and, when Tesseract is
+available, end to end through POST /upload.
+
+Without Tesseract, OCR is replaced by an "oracle" built from the drawn word
+boxes, so detection, masking and encoding can still be measured. The stages
+after rasterization run on the generated page images.
+
+The JSON report holds per-stage latency percentiles, throughput, peak RSS,
+detection precision/recall, the share of planted values that were masked,
+and the environment (package versions, settings, git commit) so that runs
+can be compared.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import string
+import subprocess
+import sys
+import time
+from importlib import metadata
+
+# Every upload must do the full work, not hit the result cache
+os.environ["RESULT_CACHE"] = "none"
+
+from PIL import Image, ImageDraw, ImageFont
+
+from ocr import TESSERACT_CONFIG, OCRResult, ocr_backend, run_ocr, run_ocr_regions
+from utils.pdf_writer import PDFWriter
+from utils.pii_detector import detect_spans, filter_spans_by_level, spans_to_dict
+from utils.pipeline import PDF_DPI, engine_fingerprint, mask_image
+from utils.preprocessing import boxes_to_original, find_text_regions, preprocess
+
+# A4 at the PDF rasterization resolution
+PAGE_SIZE = (round(8.27 * PDF_DPI), round(11.69 * PDF_DPI))
+MARGIN = PAGE_SIZE[0] // 14
+FONT_SIZE = PDF_DPI // 7
+LINE_HEIGHT = FONT_SIZE * 7 // 4
+
+STAGES = ("rasterize", "preprocess", "ocr", "detect", "mask", "encode", "upload")
+
+# A box counts as masked when this share of its pixels is filled black
+MASKED_FILL_RATIO = 0.95
+
+FILLER_WORDS = (
+    "statement", "summary", "period", "balance", "opening", "closing", "branch",
+    "customer", "details", "transaction", "reference", "description", "amount",
+    "remarks", "service", "charges", "interest", "credited", "debited", "office",
+    "please", "review", "records", "notice", "update", "annual", "report",
+)
+
+# Settings that change what the pipeline does, recorded with the results
+RECORDED_SETTINGS = (
+    "PAGE_WORKERS", "PDF_DPI", "PDF_STREAMING", "PDF_MAX_INFLIGHT_PAGES", "PDF_IMAGE_FORMAT",
+    "PDF_TEXT_LAYER", "OCR_BACKEND", "OCR_REGIONS", "OCR_REGION_WORKERS", "PREPROCESS_STEPS",
+    "SPACY_BATCH_SIZE", "SPACY_N_PROCESS",
+)
+RECORDED_PACKAGES = (
+    "Pillow", "numpy", "opencv-python", "opencv-python-headless", "pytesseract", "tesserocr",
+    "pdf2image", "PyMuPDF", "spacy", "Flask",
+)
+
+
+def _digits(rng, count):
+    return "".join(rng.choice(string.digits) for _ in range(count))
+
+
+def _letters(rng, count):
+    return "".join(rng.choice(string.ascii_uppercase) for _ in range(count))
+
+
+# One generator per PII type (debit_card shares credit_card's pattern)
+VALUE_GENERATORS = {
+    "aadhaar": lambda rng: f"{rng.randint(2, 9)}{_digits(rng, 3)} {_digits(rng, 4)} {_digits(rng, 4)}",
+    "pan": lambda rng: f"{_letters(rng, 5)}{_digits(rng, 4)}{_letters(rng, 1)}",
+    "voter_id": lambda rng: f"{_letters(rng, 3)}{_digits(rng, 7)}",
+    "driving_license": lambda rng: f"{_letters(rng, 2)}{_digits(rng, 2)} {_digits(rng, 4)} {_digits(rng, 7)}",
+    "passport": lambda rng: f"{_letters(rng, 1)}{_digits(rng, 7)}",
+    "credit_card": lambda rng: " ".join(_digits(rng, 4) for _ in range(4)),
+    "bank_account": lambda rng: f"{rng.randint(1, 5)}{_digits(rng, 11)}",
+    "ifsc": lambda rng: f"{_letters(rng, 4)}0{_letters(rng, 3)}{_digits(rng, 3)}",
+    "upi_id": lambda rng: f"{rng.choice(FILLER_WORDS)}{_digits(rng, 2)}@{rng.choice(('upi', 'ybl', 'paytm', 'oksbi'))}",
+    "phone": lambda rng: f"{rng.choice('6789')}{_digits(rng, 9)}",
+    "email": lambda rng: f"{rng.choice(FILLER_WORDS)}.{rng.choice(FILLER_WORDS)}@example.com",
+    "pincode": lambda rng: f"{rng.randint(1, 9)}{_digits(rng, 5)}",
+    "gst": lambda rng: f"{_digits(rng, 2)}{_letters(rng, 5)}{_digits(rng, 4)}{_letters(rng, 1)}1Z{_digits(rng, 1)}",
+    "cin": lambda rng: f"{rng.choice('LU')}{_digits(rng, 5)}{_letters(rng, 2)}{_digits(rng, 4)}{_letters(rng, 3)}{_digits(rng, 6)}",
+    "esic": lambda rng: f"{_digits(rng, 2)}-{_digits(rng, 3)}-{_digits(rng, 6)}-{_digits(rng, 1)}",
+    "pf": lambda rng: f"{_letters(rng, 2)}/{_digits(rng, 5)}/{_digits(rng, 7)}",
+    "social_security": lambda rng: f"{_letters(rng, 2)}{_digits(rng, 6)}{_letters(rng, 1)}",
+    "tin": lambda rng: f"{rng.randint(1, 9)}{_digits(rng, 10)}",
+    "vehicle_registration": lambda rng: f"{_letters(rng, 2)}-{_digits(rng, 2)}-{_letters(rng, 2)}-{_digits(rng, 4)}",
+    "dob": lambda rng: f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/{rng.randint(1950, 2005)}",
+}
+
+LABELS = {
+    "aadhaar": "Aadhaar", "pan": "PAN", "voter_id": "Voter ID", "driving_license": "DL No",
+    "passport": "Passport No", "credit_card": "Credit Card", "bank_account": "Account No",
+    "ifsc": "IFSC Code", "upi_id": "UPI ID", "phone": "Mobile", "email": "Email",
+    "pincode": "Pincode", "gst": "GSTIN", "cin": "CIN", "esic": "ESIC", "pf": "PF",
+    "social_security": "SSN", "tin": "TIN", "vehicle_registration": "RC No", "dob": "Date of Birth",
+}
+
+
+def _load_font():
+    try:
+        return ImageFont.load_default(size=FONT_SIZE)
+    except TypeError:
+        # Pillow < 10.1 has a single fixed-size bitmap font
+        return ImageFont.load_default()
+
+
+def render_page(rng, font, pii_per_page):
+    """
+    Draw one page of filler text with planted PII.
+
+    Returns ``(image, planted, ocr_data)``: ``planted`` lists
+    ``(pii_type, value, boxes)`` and ``ocr_data`` describes every drawn word
+    in the format of pytesseract's image_to_data.
+    """
+    image = Image.new("RGB", PAGE_SIZE, "white")
+    draw = ImageDraw.Draw(image)
+    space = draw.textlength(" ", font=font)
+    line_count = (PAGE_SIZE[1] - 2 * MARGIN) // LINE_HEIGHT
+    pii_lines = set(rng.sample(range(line_count), min(pii_per_page, line_count)))
+    pii_types = sorted(VALUE_GENERATORS)
+
+    planted = []
+    ocr_data = {key: [] for key in ("text", "block_num", "par_num", "line_num", "left", "top", "width", "height", "conf")}
+    for line in range(line_count):
+        y = MARGIN + line * LINE_HEIGHT
+        if line in pii_lines:
+            pii_type = rng.choice(pii_types)
+            value = VALUE_GENERATORS[pii_type](rng)
+            prefix = f"{LABELS[pii_type]}:".split()
+            value_words = value.split()
+        else:
+            pii_type = None
+            prefix = [rng.choice(FILLER_WORDS).capitalize()]
+            prefix += [rng.choice(FILLER_WORDS) for _ in range(rng.randint(4, 9))]
+            value_words = []
+
+        x = MARGIN
+        value_boxes = []
+        for index, word in enumerate(prefix + value_words):
+            left, top, right, bottom = draw.textbbox((x, y), word, font=font)
+            draw.text((x, y), word, fill="black", font=font)
+            ocr_data["text"].append(word)
+            ocr_data["block_num"].append(1)
+            ocr_data["par_num"].append(1)
+            ocr_data["line_num"].append(line + 1)
+            ocr_data["left"].append(left)
+            ocr_data["top"].append(top)
+            ocr_data["width"].append(right - left)
+            ocr_data["height"].append(bottom - top)
+            ocr_data["conf"].append(100.0)
+            if index >= len(prefix):
+                value_boxes.append((left, top, right - left, bottom - top))
+            x = right + space
+        if pii_type is not None:
+            planted.append((pii_type, value, value_boxes))
+    return image, planted, ocr_data
+
+
+def build_corpus(seed, documents, pages, pii_per_page):
+    """
+    Generate the documents; even-numbered ones are single-page PNG images,
+    the others multi-page PDFs.
+    """
+    rng = random.Random(seed)
+    font = _load_font()
+    corpus = []
+    for index in range(documents):
+        kind = "image" if index % 2 == 0 else "pdf"
+        page_count = 1 if kind == "image" else pages
+        document_pages = [render_page(rng, font, pii_per_page) for _ in range(page_count)]
+
+        output = io.BytesIO()
+        if kind == "image":
+            document_pages[0][0].save(output, format="PNG")
+        else:
+            writer = PDFWriter(output, image_format="flate")
+            for image, _, _ in document_pages:
+                writer.add_page(image)
+            writer.close()
+        corpus.append({"kind": kind, "file_bytes": output.getvalue(), "pages": document_pages})
+    return corpus
+
+
+def tesseract_available():
+    if ocr_backend() == "tesserocr":
+        return True
+    try:
+        import pytesseract
+
+        pytesseract.get_tesseract_version()
+        return True
+    except Exception:
+        return False
+
+
+class Timer:
+    """
+    Collect per-stage durations.
+    """
+
+    def __init__(self):
+        self.samples = {stage: [] for stage in STAGES}
+
+    def time(self, stage, fn, *args, **kwargs):
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        self.samples[stage].append(time.perf_counter() - start)
+        return result
+
+    def summary(self):
+        summary = {}
+        for stage, samples in self.samples.items():
+            if not samples:
+                summary[stage] = None
+                continue
+            ordered = sorted(samples)
+            summary[stage] = {
+                "count": len(samples),
+                "mean_ms": round(statistics.fmean(samples) * 1000, 3),
+                "median_ms": round(statistics.median(samples) * 1000, 3),
+                "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 3),
+                "total_s": round(sum(samples), 4),
+            }
+        return summary
+
+
+def _ocr(processed_image, ocr_data, use_tesseract):
+    if not use_tesseract:
+        return OCRResult(ocr_data)
+    regions = find_text_regions(processed_image)
+    if regions is None:
+        return run_ocr(processed_image, TESSERACT_CONFIG)
+    return run_ocr_regions(processed_image, regions, TESSERACT_CONFIG)
+
+
+def _rasterize(file_bytes):
+    from pdf2image import convert_from_bytes
+
+    return convert_from_bytes(file_bytes, dpi=PDF_DPI)
+
+
+def _masked(image, boxes):
+    gray = image.convert("L")
+    for left, top, width, height in boxes:
+        crop = gray.crop((left, top, left + width, top + height))
+        histogram = crop.histogram()
+        if histogram[0] < MASKED_FILL_RATIO * width * height:
+            return False
+    return True
+
+
+def run_document(document, timer, level, use_tesseract, can_rasterize, client):
+    """
+    Time one document through every stage and return its detection and
+    masking outcome as ``(planted, detected, masked)``.
+    """
+    if document["kind"] == "pdf" and can_rasterize:
+        timer.time("rasterize", _rasterize, document["file_bytes"])
+
+    planted, detected, masked = [], set(), []
+    masked_images = []
+    detected_pii = {}
+    for page, (image, page_planted, ocr_data) in enumerate(document["pages"]):
+        preprocessed = timer.time("preprocess", preprocess, image)
+        ocr_result = timer.time("ocr", _ocr, preprocessed[0], ocr_data, use_tesseract)
+        ocr_result.boxes = boxes_to_original(ocr_result.boxes, preprocessed[1], image.size)
+
+        spans = timer.time("detect", detect_spans, ocr_result.text, page)
+        spans = filter_spans_by_level(spans, level)
+        page_pii = spans_to_dict(ocr_result.text, spans)
+        for pii_type, values in page_pii.items():
+            detected_pii.setdefault(pii_type, [])
+            detected_pii[pii_type].extend(v for v in values if v not in detected_pii[pii_type])
+            detected.update(values)
+
+        masked_image = timer.time("mask", mask_image, image, detected_pii, level, ocr_result, spans)
+        masked_images.append(masked_image)
+        planted.extend(page_planted)
+        masked.extend(_masked(masked_image, boxes) for _, _, boxes in page_planted)
+
+    def encode():
+        output = io.BytesIO()
+        if document["kind"] == "image":
+            masked_images[0].save(output, format="PNG")
+        else:
+            writer = PDFWriter(output)
+            for masked_image in masked_images:
+                writer.add_page(masked_image)
+            writer.close()
+        return output
+
+    timer.time("encode", encode)
+
+    if client is not None and (document["kind"] == "image" or can_rasterize):
+        filename = "document.png" if document["kind"] == "image" else "document.pdf"
+        response = timer.time(
+            "upload", client.post, "/upload",
+            data={"file": (io.BytesIO(document["file_bytes"]), filename), "redaction_level": level},
+            content_type="multipart/form-data",
+        )
+        if response.status_code != 200:
+            print(f"⚠️ /upload returned {response.status_code}: {response.get_data(as_text=True)[:200]}", file=sys.stderr)
+    return planted, detected, masked
+
+
+def detection_report(planted, detected):
+    planted_values = {value for _, value, _ in planted}
+    true_positives = planted_values & detected
+    per_type = {}
+    for pii_type, value, _ in planted:
+        entry = per_type.setdefault(pii_type, {"planted": 0, "found": 0})
+        entry["planted"] += 1
+        entry["found"] += value in detected
+    for entry in per_type.values():
+        entry["recall"] = round(entry["found"] / entry["planted"], 4)
+    return {
+        "planted_values": len(planted_values),
+        "detected_values": len(detected),
+        "precision": round(len(true_positives) / len(detected), 4) if detected else None,
+        "recall": round(len(true_positives) / len(planted_values), 4) if planted_values else None,
+        "per_type": dict(sorted(per_type.items())),
+    }
+
+
+def peak_rss_mb():
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    usage = {
+        "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    }
+    return {key: round(value / scale, 1) for key, value in usage.items()}
+
+
+def environment():
+    packages = {}
+    for package in RECORDED_PACKAGES:
+        try:
+            packages[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            pass
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "git_commit": commit,
+        "engine_fingerprint": engine_fingerprint(),
+        "ocr_backend": ocr_backend(),
+        "packages": packages,
+        "settings": {name: os.environ[name] for name in RECORDED_SETTINGS if name in os.environ},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--documents", type=int, default=6, help="documents in the corpus")
+    parser.add_argument("--pages", type=int, default=3, help="pages per PDF document")
+    parser.add_argument("--pii-per-page", type=int, default=8, help="planted values per page")
+    parser.add_argument("--repeat", type=int, default=3, help="measured runs over the corpus")
+    parser.add_argument("--warmup", type=int, default=1, help="unmeasured runs before timing")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--level", default="critical", choices=("basic", "intermediate", "critical"))
+    parser.add_argument("--ocr", default="auto", choices=("auto", "tesseract", "oracle"))
+    parser.add_argument("--no-upload", action="store_true", help="skip the end-to-end /upload timing")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    use_tesseract = args.ocr == "tesseract" or (args.ocr == "auto" and tesseract_available())
+    try:
+        _rasterize(build_corpus(args.seed, 2, 1, 0)[1]["file_bytes"])
+        can_rasterize = True
+    except Exception as e:
+        print(f"⚠️ PDF rasterization unavailable, skipping that stage: {e}", file=sys.stderr)
+        can_rasterize = False
+
+    client = None
+    if use_tesseract and not args.no_upload:
+        from app import app
+
+        client = app.test_client()
+
+    corpus = build_corpus(args.seed, args.documents, args.pages, args.pii_per_page)
+    page_count = sum(len(document["pages"]) for document in corpus)
+
+    for _ in range(args.warmup):
+        for document in corpus:
+            run_document(document, Timer(), args.level, use_tesseract, can_rasterize, client)
+
+    timer = Timer()
+    outcome = None
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        planted, detected, masked = [], set(), []
+        for document in corpus:
+            document_planted, document_detected, document_masked = run_document(
+                document, timer, args.level, use_tesseract, can_rasterize, client
+            )
+            planted.extend(document_planted)
+            detected.update(document_detected)
+            masked.extend(document_masked)
+        outcome = outcome or (planted, detected, masked)
+    wall_seconds = time.perf_counter() - start
+
+    planted, detected, masked = outcome
+    pipeline_seconds = sum(
+        sum(timer.samples[stage]) for stage in STAGES if stage != "upload"
+    )
+    report = {
+        "benchmark": "redaction-pipeline",
+        "config": dict(vars(args), ocr=("tesseract" if use_tesseract else "oracle")),
+        "environment": environment(),
+        "corpus": {"documents": len(corpus), "pages": page_count, "planted_values": len(planted)},
+        "stages": timer.summary(),
+        "throughput": {
+            "wall_seconds": round(wall_seconds, 4),
+            "pipeline_pages_per_second": round(page_count * args.repeat / pipeline_seconds, 3) if pipeline_seconds else None,
+        },
+        "memory": {"peak_rss_mb": peak_rss_mb()},
+        "detection": detection_report(planted, detected),
+        "masking": {
+            "masked_values": round(sum(masked) / len(masked), 4) if masked else None,
+        },
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -14,10 +14,26 @@ backlog = 2048
 print(f"🚀 Starting server on {bind}")
 
 # Worker processes
-workers = 2  # Can use multiple workers without SocketIO
-worker_class = "sync"
-threads = 2  # Use threads for concurrency
+# Each request writes its own artifact, so workers and threads can be raised
+# freely (keep GUNICORN_WORKERS=1 with ARTIFACT_STORAGE=memory)
+# Live detection sessions (Socket.IO) are held by the worker that started
+# them: with several workers, clients must use the websocket transport or
+# the load balancer must keep sessions sticky
+workers = int(os.getenv("GUNICORN_WORKERS", "2"))
+# Set GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker and serve
+# asgi:application for the ASGI mode, where connections live on an event loop
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "sync")
+threads = int(os.getenv("GUNICORN_THREADS", "4"))  # Use threads for concurrency
+# PDF pages are fanned out to a per-worker process pool sized by PAGE_WORKERS
+# (defaults to the CPU count; set PAGE_WORKERS=1 to process pages in-thread)
+# /metrics reports the counters of the worker that answers the scrape
 timeout = 120
+
+# Import the app, and load its models, once in the master before forking so
+# workers start instantly and share the model memory copy-on-write
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() == "true"
+if preload_app:
+    os.environ.setdefault("MODEL_PRELOAD", "true")
 keepalive = 5
 
 # Logging
@@ -1,8 +1,299 @@
 """
 OCR Processing for Document Uploads
+
+Two backends are supported: tesserocr keeps a Tesseract engine loaded per
+thread and takes images in memory, while pytesseract (the fallback) starts
+a tesseract process and writes a temp image for every call.
 """
+import logging
+import os
+import re
+import threading
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+
 import pytesseract
 from PIL import Image
 
+from utils.models import model_registry
+
+logger = logging.getLogger(__name__)
+
+# tesserocr is optional - without it every OCR call goes through pytesseract
+try:
+    import tesserocr
+    TESSEROCR_AVAILABLE = True
+except ImportError:
+    TESSEROCR_AVAILABLE = False
+
+# Tesseract settings shared by every OCR call on an uploaded page
+TESSERACT_CONFIG = r"--oem 3 --psm 6"
+
+# "auto" uses tesserocr when it is installed, otherwise pytesseract
+OCR_BACKEND = os.getenv("OCR_BACKEND", "auto").lower()
+# Threads used to OCR the text regions of one page
+OCR_REGION_WORKERS = int(os.getenv("OCR_REGION_WORKERS", "1"))
+
+# Columns of Tesseract's TSV output, as returned by image_to_data
+_TSV_COLUMNS = (
+    "level", "page_num", "block_num", "par_num", "line_num", "word_num",
+    "left", "top", "width", "height", "conf", "text",
+)
+
+# Install locations tried when tesseract is not on the PATH (Windows)
+TESSERACT_WINDOWS_PATHS = (
+    r"C:\Program Files\Tesseract-OCR\tesseract.exe",
+    r"C:\Program Files (x86)\Tesseract-OCR\tesseract.exe",
+)
+
+# One engine per thread and config; tesserocr engines are not thread-safe
+_engines = threading.local()
+_tesserocr_failed = False
+
+# Region OCR threads live as long as the process so that each keeps its
+# resident engine between pages
+_region_executor = None
+_region_executor_pid = None
+_region_executor_lock = threading.Lock()
+
+
+class OCRResult:
+    """
+    Word-level OCR output for a single page.
+
+    Produced once per page and shared by text extraction, PII detection
+    and masking so that a page is only sent through Tesseract once.
+    """
+
+    def __init__(self, data):
+        self.words = []
+        self.boxes = []  # (left, top, width, height) per word
+        self.confidences = []
+        self.lines = []  # (block_num, par_num, line_num) per word
+        self.offsets = []  # (start, end) of each word in self.text
+
+        parts = []
+        length = 0
+        previous_line = None
+        for i in range(len(data["text"])):
+            word = str(data["text"][i]).strip()
+            if not word:
+                continue
+
+            line = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+            if previous_line is not None:
+                if line == previous_line:
+                    separator = " "
+                elif line[:2] == previous_line[:2]:
+                    separator = "\n"
+                else:
+                    separator = "\n\n"
+                parts.append(separator)
+                length += len(separator)
+            previous_line = line
+
+            self.words.append(word)
+            self.boxes.append(
+                (data["left"][i], data["top"][i], data["width"][i], data["height"][i])
+            )
+            self.confidences.append(float(data["conf"][i]))
+            self.lines.append(line)
+            self.offsets.append((length, length + len(word)))
+            parts.append(word)
+            length += len(word)
+
+        self.text = "".join(parts) + "\n" if parts else ""
+
+    def __len__(self):
+        return len(self.words)
+
+    def word_indices(self, start, end):
+        """
+        Return the indices of the words overlapping text[start:end].
+        """
+        indices = []
+        i = bisect_right(self.offsets, start, key=lambda offset: offset[1])
+        while i < len(self.offsets) and self.offsets[i][0] < end:
+            indices.append(i)
+            i += 1
+        return indices
+
+
+def ocr_backend():
+    """
+    Return the OCR backend in use, "tesserocr" or "pytesseract".
+    """
+    if OCR_BACKEND == "pytesseract" or not TESSEROCR_AVAILABLE or _tesserocr_failed:
+        return "pytesseract"
+    return "tesserocr"
+
+
+def _load_tesseract():
+    """
+    Check that Tesseract can run, configuring a Windows install if it is not
+    on the PATH, and return its version.
+    """
+    logger.info("OCR backend: %s", ocr_backend())
+    if ocr_backend() == "tesserocr":
+        # tesserocr links libtesseract directly and needs no tesseract binary
+        return tesserocr.tesseract_version()
+    try:
+        return str(pytesseract.get_tesseract_version())
+    except Exception as e:
+        logger.warning("Tesseract OCR not found in PATH: %s", e)
+    for path in TESSERACT_WINDOWS_PATHS:
+        if os.path.exists(path):
+            pytesseract.pytesseract.tesseract_cmd = path
+            try:
+                version = str(pytesseract.get_tesseract_version())
+            except Exception:
+                continue
+            logger.info("Found and configured Tesseract at: %s", path)
+            return version
+    raise RuntimeError(
+        "Tesseract OCR not found. Please install from: https://github.com/UB-Mannheim/tesseract/wiki "
+        "or run: winget install --id UB-Mannheim.TesseractOCR"
+    )
+
+
+model_registry.register("tesseract", _load_tesseract, required=True)
+
+
+def tesseract_available():
+    """
+    Return True if Tesseract can be used (checked once, on first call).
+    """
+    return model_registry.available("tesseract")
+
+
+def _engine_options(config):
+    options = dict(re.findall(r"--(psm|oem)\s+(\d+)", config))
+    lang = re.search(r"(?:^|\s)-l\s+(\S+)", config)
+    return {
+        "lang": lang.group(1) if lang else "eng",
+        "psm": int(options.get("psm", tesserocr.PSM.AUTO)),
+        "oem": int(options.get("oem", tesserocr.OEM.DEFAULT)),
+    }
+
+
+def _get_engine(config):
+    """
+    Return this thread's resident tesserocr engine for ``config``.
+    """
+    # Engines inherited from a parent process through fork are not reused
+    if getattr(_engines, "pid", None) != os.getpid():
+        _engines.pid = os.getpid()
+        _engines.apis = {}
+    api = _engines.apis.get(config)
+    if api is None:
+        api = tesserocr.PyTessBaseAPI(**_engine_options(config))
+        _engines.apis[config] = api
+    return api
+
+
+def _parse_tsv(tsv):
+    data = {column: [] for column in _TSV_COLUMNS}
+    for row in tsv.splitlines():
+        fields = row.split("\t", len(_TSV_COLUMNS) - 1)
+        if len(fields) < len(_TSV_COLUMNS):
+            continue
+        for column, value in zip(_TSV_COLUMNS, fields):
+            if column == "text":
+                data[column].append(value)
+            elif column == "conf":
+                data[column].append(float(value))
+            else:
+                data[column].append(int(value))
+    return data
+
+
+def _run_tesserocr(image, config, output):
+    global _tesserocr_failed
+    try:
+        api = _get_engine(config)
+    except Exception as e:
+        # Usually missing language data; stay on pytesseract from now on
+        _tesserocr_failed = True
+        logger.warning("tesserocr engine could not start, using pytesseract: %s", e)
+        return None
+    try:
+        api.SetImage(image)
+        if output == "text":
+            return api.GetUTF8Text()
+        api.Recognize()
+        return _parse_tsv(api.GetTSVText(0))
+    finally:
+        api.Clear()
+
+
+def ocr_data(image, config=TESSERACT_CONFIG):
+    """
+    Run Tesseract once on the image and return its word data as a dict of
+    columns, like pytesseract's image_to_data.
+    """
+    if ocr_backend() == "tesserocr":
+        data = _run_tesserocr(image, config, "data")
+        if data is not None:
+            return data
+    return pytesseract.image_to_data(
+        image, output_type=pytesseract.Output.DICT, config=config
+    )
+
+
+def run_ocr(image, config=TESSERACT_CONFIG):
+    """
+    Run Tesseract once on the image and return an OCRResult.
+    """
+    return OCRResult(ocr_data(image, config))
+
+
+def _get_region_executor():
+    """
+    Return this process's region OCR thread pool, creating it on first use.
+    """
+    global _region_executor, _region_executor_pid
+    with _region_executor_lock:
+        # Threads do not survive a fork, so a pool inherited from the parent is unusable
+        if _region_executor is None or _region_executor_pid != os.getpid():
+            _region_executor = ThreadPoolExecutor(max_workers=OCR_REGION_WORKERS, thread_name_prefix="ocr-region")
+            _region_executor_pid = os.getpid()
+        return _region_executor
+
+
+def run_ocr_regions(image, regions, config=TESSERACT_CONFIG):
+    """
+    OCR only the given ``(left, top, width, height)`` regions of the image,
+    in order, and return a single OCRResult in image coordinates.
+    """
+    crops = [image.crop((left, top, left + width, top + height)) for left, top, width, height in regions]
+    if OCR_REGION_WORKERS > 1 and len(crops) > 1:
+        results = list(_get_region_executor().map(ocr_data, crops, [config] * len(crops)))
+    else:
+        results = [ocr_data(crop, config) for crop in crops]
+
+    merged = {
+        column: []
+        for column in ("text", "block_num", "par_num", "line_num", "left", "top", "width", "height", "conf")
+    }
+    for index, ((left, top, _, _), data) in enumerate(zip(regions, results)):
+        for i in range(len(data["text"])):
+            merged["text"].append(data["text"][i])
+            # Keep the blocks of different regions apart
+            merged["block_num"].append(index * 1000 + int(data["block_num"][i]))
+            merged["par_num"].append(data["par_num"][i])
+            merged["line_num"].append(data["line_num"][i])
+            merged["left"].append(left + int(data["left"][i]))
+            merged["top"].append(top + int(data["top"][i]))
+            merged["width"].append(data["width"][i])
+            merged["height"].append(data["height"][i])
+            merged["conf"].append(data["conf"][i])
+    return OCRResult(merged)
+
+
 def extract_text(image_path):
-    return pytesseract.image_to_string(Image.open(image_path))
+    image = Image.open(image_path)
+    if ocr_backend() == "tesserocr":
+        text = _run_tesserocr(image, "", "text")
+        if text is not None:
+            return text
+    return pytesseract.image_to_string(image)
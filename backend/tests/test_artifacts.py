@@ -0,0 +1,69 @@
+import os
+import time
+
+import pytest
+
+from utils.artifacts import ArtifactStore
+
+
+@pytest.fixture(params=["disk", "memory"])
+def store(request, tmp_path):
+    return ArtifactStore(str(tmp_path / "artifacts"), storage=request.param, ttl=60)
+
+
+def test_every_artifact_gets_its_own_id(store):
+    first = store.save_bytes(b"first", "pdf")
+    second = store.save_bytes(b"second", "pdf")
+    assert first != second
+    assert store.url(first) == f"/download/{first}"
+
+    file, download_name = store.open(first)
+    with file:
+        assert file.read() == b"first"
+    assert download_name == "redacted_document.pdf"
+    assert store.open(second)[1] == "redacted_document.pdf"
+
+
+def test_streamed_artifact_is_stored_on_close(store):
+    artifact_id, f = store.create("png")
+    with f:
+        f.write(b"page")
+    file, download_name = store.open(artifact_id)
+    with file:
+        assert file.read() == b"page"
+    assert download_name == "redacted_image.png"
+
+
+@pytest.mark.parametrize("artifact_id", [
+    "../app.py",
+    "0123456789abcdef0123456789abcdef.exe",
+    "0123456789ABCDEF0123456789ABCDEF.pdf",
+    "redacted_document.pdf",
+])
+def test_invalid_ids_are_rejected(store, artifact_id):
+    assert store.open(artifact_id) is None
+
+
+def test_missing_artifact(store):
+    assert store.open(store.new_id("pdf")) is None
+
+
+def test_expired_artifacts_are_hidden_and_removed(tmp_path):
+    store = ArtifactStore(str(tmp_path), storage="disk", ttl=60)
+    artifact_id = store.save_bytes(b"old", "pdf")
+    path = os.path.join(str(tmp_path), artifact_id)
+    past = time.time() - 120
+    os.utime(path, (past, past))
+
+    assert store.open(artifact_id) is None
+    store.cleanup(force=True)
+    assert not os.path.exists(path)
+
+
+def test_memory_store_evicts_oldest_over_budget(tmp_path):
+    store = ArtifactStore(str(tmp_path), storage="memory", max_memory_bytes=10)
+    first = store.save_bytes(b"123456", "pdf")
+    second = store.save_bytes(b"abcdef", "pdf")
+    assert store.open(first) is None
+    assert store.open(second) is not None
+    assert store.memory_size == 6
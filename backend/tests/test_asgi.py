@@ -0,0 +1,157 @@
+import asyncio
+import io
+import json
+import threading
+
+import pytest
+from PIL import Image
+
+pytest.importorskip("a2wsgi")
+asgi = pytest.importorskip("asgi")
+import app as app_module
+from ocr import OCRResult
+from utils import pipeline
+
+HTTP_SCOPE = {
+    "type": "http",
+    "http_version": "1.1",
+    "scheme": "http",
+    "server": ("testserver", 80),
+    "client": ("127.0.0.1", 1234),
+    "query_string": b"",
+    "headers": [],
+}
+
+
+def fake_ocr(image, config=None):
+    return OCRResult({
+        "text": ["Email:", "john@example.com"],
+        "block_num": [1, 1],
+        "par_num": [1, 1],
+        "line_num": [1, 1],
+        "left": [10, 80],
+        "top": [10, 10],
+        "width": [60, 100],
+        "height": [20, 20],
+        "conf": [90, 90],
+    })
+
+
+def call(method, path, chunks=(b"",), headers=(), query=b""):
+    """
+    Run one request through the ASGI application and return its status,
+    body and a log of the messages received and sent, in order.
+    """
+    log = []
+
+    async def run():
+        pending = list(chunks)
+        done = asyncio.Event()
+
+        async def receive():
+            if pending:
+                await asyncio.sleep(0.001)
+                body = pending.pop(0)
+                log.append(("receive", len(body)))
+                return {"type": "http.request", "body": body, "more_body": bool(pending)}
+            await done.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            log.append(("send", message))
+
+        scope = dict(
+            HTTP_SCOPE,
+            method=method,
+            path=path,
+            query_string=query,
+            headers=[(name.encode(), value.encode()) for name, value in headers],
+        )
+        try:
+            await asyncio.wait_for(asgi.application(scope, receive, send), 30)
+        finally:
+            done.set()
+
+    asyncio.run(run())
+    sent = [message for kind, message in log if kind == "send"]
+    body = b"".join(message.get("body", b"") for message in sent[1:])
+    return sent[0]["status"], body, log
+
+
+def test_health():
+    status, body, _ = call("GET", "/health")
+
+    assert status in (200, 503)
+    assert "status" in json.loads(body)
+
+
+def test_text_upload_is_redacted_while_it_arrives():
+    # No Content-Length: the body ends with the last ASGI message
+    chunks = [b"mail john@example.com now " * 10000] * 4
+    status, body, log = call(
+        "POST", "/redact/text", chunks, headers=[("content-type", "text/plain")], query=b"ner=false",
+    )
+
+    assert status == 200
+    assert body.decode() == "mail [REDACTED] now " * 40000
+    first_body = next(
+        i for i, (kind, message) in enumerate(log) if kind == "send" and message.get("body")
+    )
+    last_receive = max(i for i, (kind, _) in enumerate(log) if kind == "receive")
+    assert first_body < last_receive
+
+
+def test_websocket_is_closed():
+    sent = []
+
+    async def receive():
+        return {"type": "websocket.connect"}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(asgi.application({"type": "websocket", "path": "/socket.io/"}, receive, send))
+
+    assert sent[-1]["type"] == "websocket.close"
+
+
+def test_lifespan():
+    messages = [{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message["type"])
+
+    asyncio.run(asgi.application({"type": "lifespan"}, receive, send))
+
+    assert sent == ["lifespan.startup.complete", "lifespan.shutdown.complete"]
+
+
+def test_streamed_response_stops_when_client_disconnects(monkeypatch):
+    pages = [Image.new("RGB", (300, 200), "white") for _ in range(3)]
+
+    def iter_pdf_windows(file_bytes, window, dpi=None, poppler_path=None):
+        for first_page in range(0, len(pages), window):
+            yield len(pages), pages[first_page:first_page + window]
+
+    monkeypatch.setattr(pipeline, "run_ocr", fake_ocr)
+    monkeypatch.setattr(pipeline, "iter_pdf_windows", iter_pdf_windows)
+    monkeypatch.setattr(pipeline, "PDF_MAX_INFLIGHT_PAGES", 1)
+    monkeypatch.setattr(pipeline, "PAGE_WORKERS", 1)
+    monkeypatch.setattr(app_module, "tesseract_available", lambda: True)
+    monkeypatch.setattr(app_module, "get_result_cache", lambda: None)
+
+    disconnected = threading.Event()
+    disconnected.set()
+    client = app_module.app.test_client()
+    response = client.post(
+        "/upload/stream",
+        data={"file": (io.BytesIO(b"%PDF-1.4"), "statement.pdf"), "redaction_level": "basic"},
+        content_type="multipart/form-data",
+        environ_base={app_module.DISCONNECTED_ENVIRON_KEY: disconnected},
+    )
+
+    assert response.get_data() == b""
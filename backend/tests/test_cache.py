@@ -0,0 +1,94 @@
+import os
+import stat
+import time
+
+import pytest
+
+from utils import cache, pdf_writer, pipeline
+from utils.cache import DiskCache, MemoryCache, content_hash
+
+
+def test_content_hash_is_sha256():
+    assert content_hash(b"abc") == "ba7816bf8f01cfea414140de5dae2223b00361a396177a9cb410ff61f20015ad"
+
+
+def test_memory_cache_evicts_least_recently_used(monkeypatch):
+    def no_pickle(*args, **kwargs):
+        raise AssertionError("values are sized by the caller, not pickled")
+
+    monkeypatch.setattr(cache.pickle, "dumps", no_pickle)
+    memory = MemoryCache(max_bytes=100, ttl=60)
+    memory.set("a", "first", 40)
+    memory.set("b", "second", 40)
+    assert memory.get("a") == "first"
+    memory.set("c", "third", 40)
+
+    assert memory.get("b") is None
+    assert memory.get("a") == "first"
+    assert memory.get("c") == "third"
+    assert memory.size == 80
+    memory.set("too big", "x", 101)
+    assert memory.get("too big") is None
+
+
+def test_memory_cache_entries_expire(monkeypatch):
+    memory = MemoryCache(max_bytes=100, ttl=60)
+    memory.set("a", "value", 10)
+    now = time.time()
+    monkeypatch.setattr(cache.time, "time", lambda: now + 61)
+    assert memory.get("a") is None
+    assert memory.size == 0
+
+
+def test_disk_cache_is_private(tmp_path):
+    directory = str(tmp_path / "cache")
+    os.makedirs(directory, mode=0o755)
+    disk = DiskCache(directory, max_bytes=10_000, ttl=60)
+    disk.set("ocr:key", ("basic", [("Email: john@example.com", [], None)]))
+
+    assert stat.S_IMODE(os.stat(directory).st_mode) == 0o700
+    (name,) = os.listdir(directory)
+    assert stat.S_IMODE(os.stat(os.path.join(directory, name)).st_mode) & 0o077 == 0
+    assert disk.get("ocr:key") == ("basic", [("Email: john@example.com", [], None)])
+
+
+def test_disk_cache_ttl_and_budget(tmp_path):
+    disk = DiskCache(str(tmp_path), max_bytes=400, ttl=60)
+    disk.set("old", "x" * 100)
+    past = time.time() - 120
+    os.utime(disk._path("old"), (past, past))
+    assert disk.get("old") is None
+
+    for key in ("a", "b", "c", "d"):
+        disk.set(key, key * 150)
+        time.sleep(0.01)
+    assert disk.get("a") is None
+    assert disk.get("d") == "d" * 150
+
+
+@pytest.mark.parametrize("setting, value", [
+    ("PDF_IMAGE_FORMAT", "flate"),
+    ("PDF_JPEG_QUALITY", 50),
+])
+def test_output_fingerprint_covers_the_pdf_encoder(monkeypatch, setting, value):
+    before = pipeline.output_fingerprint()
+    monkeypatch.setattr(pdf_writer, setting, value)
+    assert pipeline.output_fingerprint() != before
+
+
+def test_output_fingerprint_covers_streaming_windows(monkeypatch):
+    monkeypatch.setattr(pipeline, "PDF_STREAMING", False)
+    document = pipeline.output_fingerprint()
+    monkeypatch.setattr(pipeline, "PDF_STREAMING", True)
+    streaming = pipeline.output_fingerprint()
+    monkeypatch.setattr(pipeline, "PDF_MAX_INFLIGHT_PAGES", pipeline.PDF_MAX_INFLIGHT_PAGES + 1)
+    assert len({document, streaming, pipeline.output_fingerprint()}) == 3
+
+
+def test_analyses_size_grows_with_words():
+    from test_redaction_text import ocr_result
+
+    small = pipeline.analyses_size([("a b", [], ocr_result("a b"))])
+    large = pipeline.analyses_size([("a b c d", [], ocr_result("a b c d"))])
+    assert 0 < small < large
+    assert pipeline.analyses_size([(None, [], None)]) == 0
@@ -0,0 +1,142 @@
+import pytest
+
+from utils import metrics
+from utils.pii_detector import (
+    LEVELS_ORDER,
+    PII_LEVEL_MAPPING,
+    PIISpan,
+    PRESIDIO_ENABLED,
+    Detector,
+    DetectorRegistry,
+    detect_spans,
+    detector_registry,
+    filter_spans_by_level,
+)
+
+from test_pii_detector import sample_text
+
+
+def plan_names(plan):
+    return [detector.name for detector, _ in plan]
+
+
+def span_set(spans):
+    return {(span.pii_type, span.start, span.end, span.source) for span in spans}
+
+
+def test_plan_runs_cheapest_detectors_first():
+    costs = [detector.cost for detector, _ in detector_registry.plan()]
+    assert costs == sorted(costs)
+    assert plan_names(detector_registry.plan(ner=False))[:2] == ["regex", "contextual"]
+
+
+@pytest.mark.parametrize("level", LEVELS_ORDER)
+def test_plan_only_asks_for_types_of_the_level(level):
+    allowed = LEVELS_ORDER[: LEVELS_ORDER.index(level) + 1]
+    for _, pii_types in detector_registry.plan(level):
+        assert pii_types
+        assert all(PII_LEVEL_MAPPING.get(pii_type, "basic") in allowed for pii_type in pii_types)
+
+
+@pytest.mark.skipif(PRESIDIO_ENABLED, reason="Presidio is enabled")
+def test_disabled_model_detectors_are_not_planned():
+    assert "presidio" not in plan_names(detector_registry.plan())
+    assert "presidio" not in dict(detector_registry.fingerprint())
+
+
+def test_ner_and_rules_select_detectors():
+    assert all(not detector.ner for detector, _ in detector_registry.plan(ner=False))
+    assert all(detector.ner for detector, _ in detector_registry.plan(rules=False))
+
+
+@pytest.mark.parametrize("level", LEVELS_ORDER)
+@pytest.mark.parametrize("seed", range(3))
+def test_level_restricted_detection_matches_filtered_full_detection(seed, level):
+    text = sample_text(seed)
+    restricted = detect_spans(text, ner=False, redaction_level=level)
+    full = filter_spans_by_level(detect_spans(text, ner=False), level)
+    assert span_set(restricted) == span_set(full)
+
+
+def test_each_detector_is_timed_as_a_stage():
+    metrics.start_request()
+    detect_spans("mail john@example.com, Aadhaar 1234 5678 9012", ner=False)
+    timings = metrics.request_timings()
+    assert "detector_regex" in timings
+    assert "detector_contextual" in timings
+
+
+def test_custom_detectors():
+    calls = []
+
+    def find_word(word, pii_type):
+        def detect(texts, pages, pii_types, **options):
+            calls.append((word, tuple(pii_types), options))
+            return [
+                [PIISpan(pii_type, text.find(word), text.find(word) + len(word), page, word)]
+                if word in text else []
+                for text, page in zip(texts, pages)
+            ]
+        return detect
+
+    registry = DetectorRegistry()
+    registry.register(Detector("cards", find_word("4111", "credit_card"), ["credit_card"], cost=5))
+    registry.register(Detector("names", find_word("Asha", "PERSON"), ["PERSON"], cost=50, ner=True))
+    registry.register(Detector("mails", find_word("a@b.in", "email"), ["email"], cost=1))
+
+    assert plan_names(registry.plan()) == ["mails", "cards", "names"]
+    assert plan_names(registry.plan("basic")) == ["mails"]
+    assert plan_names(registry.plan("intermediate", ner=False)) == ["mails"]
+
+    results = registry.detect(["Asha 4111", "a@b.in"], pages=[3, 4], redaction_level="critical", limit=1)
+    assert span_set(results[0]) == {("credit_card", 5, 9, "4111"), ("PERSON", 0, 4, "Asha")}
+    assert span_set(results[1]) == {("email", 0, 6, "a@b.in")}
+    assert {span.page for span in results[0]} == {3}
+    assert all(options == {"limit": 1} for _, _, options in calls)
+    assert registry.detect([]) == []
+
+
+def test_detector_timings_from_page_workers_reach_the_request(monkeypatch):
+    from test_redaction_text import ocr_result
+    from utils import pipeline
+
+    monkeypatch.setattr(pipeline, "PAGE_WORKERS", 2)
+    monkeypatch.setattr(pipeline, "PAGE_POOL_MIN_PAGES", 1)
+    monkeypatch.setattr(pipeline, "_page_pool", None)
+    pages = [ocr_result("mail john@example.com"), ocr_result("PAN ABCDE1234F")]
+    pool = pipeline.get_page_pool()
+    try:
+        metrics.start_request()
+        results = pipeline.map_pages(
+            pipeline.process_page_timed, [None, None], [0, 1], [False, False], pages, ["critical", "critical"]
+        )
+        # Timed in the worker, nothing recorded on this side yet
+        assert "detector_regex" not in metrics.request_timings()
+        assert all("detector_regex" in timings for _, timings in results)
+        assert results[0][0][1][0].pii_type == "email"
+    finally:
+        pool.shutdown()
+
+
+def test_pool_page_timings_are_recorded_once(monkeypatch):
+    from test_redaction_text import ocr_result
+    from utils import pipeline
+
+    worker_timings = {"detector_regex": 0.25, "detector_contextual": 0.5}
+
+    def process_page_timed(image, page, ner, ocr, redaction_level):
+        # Stand-in for a worker: its own timings are not seen by this process
+        with metrics.collect_stages():
+            result = pipeline.process_page(image, page, ner, ocr, redaction_level)
+        return result, dict(worker_timings)
+
+    monkeypatch.setattr(pipeline, "process_page_timed", process_page_timed)
+    monkeypatch.setattr(pipeline, "ocr_page", lambda image: ocr_result("mail john@example.com"))
+    monkeypatch.setattr(pipeline, "PAGE_WORKERS", 1)
+
+    metrics.start_request()
+    results = pipeline.process_pages([None, None], redaction_level="basic")
+    assert [len(spans) for _, spans, _ in results] == [1, 1]
+    timings = metrics.request_timings()
+    assert timings["detector_contextual"] == pytest.approx(1.0)
+    assert timings["detector_regex"] == pytest.approx(0.5)
@@ -0,0 +1,99 @@
+import os
+import threading
+import time
+
+import pytest
+
+from utils.jobs import JobManager, QueueFullError
+
+
+def wait_for(manager, job_id, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = manager.status(job_id)
+        if status["status"] in ("done", "failed"):
+            return status
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+@pytest.fixture
+def manager(tmp_path):
+    return JobManager(str(tmp_path), workers=1, queue_size=1)
+
+
+def test_job_lifecycle(manager):
+    started = threading.Event()
+    release = threading.Event()
+
+    def work(name, progress):
+        progress(0, 2, "analysis")
+        started.set()
+        release.wait(5)
+        progress(1, 2, "masking")
+        return {"name": name}, 200
+
+    job_id = manager.submit(work, "statement.pdf")
+    assert started.wait(5)
+    status = manager.status(job_id)
+    assert status["status"] == "running"
+    assert (status["stage"], status["pages_done"], status["pages_total"]) == ("analysis", 0, 2)
+    assert manager.result(job_id)[1] == 404
+
+    release.set()
+    status = wait_for(manager, job_id)
+    assert status["status"] == "done"
+    assert (status["stage"], status["pages_done"]) == ("masking", 1)
+    assert manager.result(job_id) == ({"name": "statement.pdf"}, 200)
+
+
+def test_failed_jobs_keep_their_error(manager):
+    def crash(progress):
+        raise ValueError("broken page")
+
+    def refuse(progress):
+        return {"error": "bad file"}, 400
+
+    crashed = manager.submit(crash)
+    assert wait_for(manager, crashed)["status"] == "failed"
+    payload, status_code = manager.result(crashed)
+    assert status_code == 500 and "broken page" in payload["error"]
+
+    refused = manager.submit(refuse)
+    assert wait_for(manager, refused)["status"] == "failed"
+    assert manager.result(refused) == ({"error": "bad file"}, 400)
+
+
+def test_full_queue_refuses_jobs(manager):
+    release = threading.Event()
+
+    def block(progress):
+        release.wait(5)
+        return {}, 200
+
+    first = manager.submit(block)
+    second = manager.submit(block)
+    with pytest.raises(QueueFullError):
+        manager.submit(block)
+    release.set()
+    wait_for(manager, first)
+    wait_for(manager, second)
+    assert manager.pending == 0
+    wait_for(manager, manager.submit(block))
+
+
+@pytest.mark.parametrize("job_id", ["../status", "0" * 31, "G" * 32])
+def test_unknown_or_invalid_ids(manager, job_id):
+    assert manager.status(job_id) is None
+    assert manager.result(job_id)[1] == 404
+
+
+def test_prune_removes_expired_jobs(tmp_path):
+    manager = JobManager(str(tmp_path), ttl=60)
+    job_id = manager.submit(lambda progress: ({}, 200))
+    wait_for(manager, job_id)
+    for name in os.listdir(str(tmp_path)):
+        path = os.path.join(str(tmp_path), name)
+        os.utime(path, (time.time() - 120, time.time() - 120))
+    manager.prune()
+    assert manager.status(job_id) is None
@@ -0,0 +1,46 @@
+from utils.live_detection import DetectionSession
+
+
+def alerts(session, *chunks):
+    found = []
+    for chunk in chunks:
+        found.extend((alert["type"], alert["value"], alert["start"]) for alert in session.push(chunk))
+    return found
+
+
+def flushed(session):
+    return [(alert["type"], alert["value"], alert["start"]) for alert in session.flush()]
+
+
+def test_value_continued_by_the_next_chunk_is_not_alerted_early():
+    session = DetectionSession("basic", ner=False)
+    assert alerts(session, "call me on 987654") == []
+    assert alerts(session, "3210 thanks") == [("phone", "9876543210", 11)]
+    assert flushed(session) == []
+
+
+def test_value_at_the_end_is_alerted_with_the_next_chunk():
+    session = DetectionSession("basic", ner=False)
+    assert alerts(session, "my pin is 560001") == []
+    assert alerts(session, " and more") == [("pincode", "560001", 10)]
+
+
+def test_value_at_the_end_is_flushed_when_the_session_stops():
+    session = DetectionSession("basic", ner=False)
+    assert alerts(session, "mail john@example.com") == []
+    assert flushed(session) == [("email", "john@example.com", 5)]
+    assert flushed(session) == []
+
+
+def test_values_are_alerted_once_across_chunks():
+    session = DetectionSession("basic", ner=False)
+    found = alerts(session, "email is john.doe@exa", "mple.com thanks ", "call 9876543210 now ", "bye")
+    assert found == [("email", "john.doe@example.com", 9), ("phone", "9876543210", 42)]
+
+
+def test_tail_stays_bounded():
+    session = DetectionSession("basic", ner=False, overlap=64, separator=" ")
+    for i in range(500):
+        session.push(f"sentence {i} with a few filler words")
+    assert len(session.tail) <= 64 + 40
+    assert flushed(session) == []
@@ -0,0 +1,25 @@
+import os
+
+from utils import pipeline
+
+
+def worker_pid(page):
+    return page, os.getpid()
+
+
+def test_pages_run_in_forkserver_or_spawned_workers(monkeypatch):
+    monkeypatch.setattr(pipeline, "PAGE_WORKERS", 2)
+    monkeypatch.setattr(pipeline, "PAGE_POOL_MIN_PAGES", 1)
+    monkeypatch.setattr(pipeline, "_page_pool", None)
+    pool = pipeline.get_page_pool()
+    try:
+        assert pool._mp_context.get_start_method() == pipeline.PAGE_POOL_START_METHOD
+        assert pipeline.PAGE_POOL_START_METHOD in ("forkserver", "spawn")
+
+        done = []
+        results = pipeline.map_pages(worker_pid, range(4), on_result=done.append)
+        assert results == done
+        assert [page for page, _ in results] == [0, 1, 2, 3]
+        assert os.getpid() not in {pid for _, pid in results}
+    finally:
+        pool.shutdown()
@@ -0,0 +1,151 @@
+import io
+
+import pytest
+from PIL import Image
+
+from utils import pipeline
+
+pymupdf = pytest.importorskip("pymupdf")
+
+PAGE_LINES = [
+    ["Statement for the month of March", "Customer reference details follow"],
+    ["Transactions and balances", "Nothing sensitive on this page"],
+    ["Contact us at john@example.com", "or call 9876543210 for help"],
+]
+
+
+def make_pdf(pages):
+    document = pymupdf.open()
+    for lines in pages:
+        page = document.new_page()
+        for i, line in enumerate(lines):
+            page.insert_text((72, 72 + 20 * i), line)
+    data = document.tobytes()
+    document.close()
+    return data
+
+
+@pytest.fixture
+def windows(monkeypatch):
+    """
+    Render windows with PyMuPDF instead of poppler, recording each window.
+    """
+    rendered = []
+
+    def iter_pdf_windows(file_bytes, window, dpi=pipeline.PDF_DPI, poppler_path=None):
+        document = pymupdf.open(stream=file_bytes, filetype="pdf")
+        for first_page in range(0, document.page_count, window):
+            images = []
+            for page in range(first_page, min(first_page + window, document.page_count)):
+                pixmap = document[page].get_pixmap(dpi=50)
+                images.append(Image.frombytes("RGB", (pixmap.width, pixmap.height), pixmap.samples))
+            rendered.append(len(images))
+            yield document.page_count, images
+
+    monkeypatch.setattr(pipeline, "iter_pdf_windows", iter_pdf_windows)
+    monkeypatch.setattr(pipeline, "PDF_MAX_INFLIGHT_PAGES", 2)
+    return rendered
+
+
+@pytest.fixture
+def masked_with(monkeypatch):
+    """
+    Record the PII each window is masked with, as it is at masking time.
+    """
+    calls = []
+    mask_pages = pipeline.mask_pages
+
+    def record(images, page_spans, ocr_results, detected_pii, *args):
+        calls.append({pii_type: list(values) for pii_type, values in detected_pii.items()})
+        return mask_pages(images, page_spans, ocr_results, detected_pii, *args)
+
+    monkeypatch.setattr(pipeline, "mask_pages", record)
+    return calls
+
+
+def test_every_window_is_masked_with_the_whole_document_pii(windows, masked_with):
+    output = io.BytesIO()
+    text, detected_pii, _, analyses = pipeline.process_pdf(make_pdf(PAGE_LINES), "basic", output, streaming=False)
+
+    assert detected_pii["email"] == ["john@example.com"]
+    assert "john@example.com" in text
+    assert len(analyses) == 3
+    # Two passes of two windows each, never more than two pages at a time
+    assert windows == [2, 1, 2, 1]
+    assert len(masked_with) == 2
+    assert all(pii == detected_pii for pii in masked_with)
+    assert pymupdf.open(stream=output.getvalue(), filetype="pdf").page_count == 3
+
+
+def test_streaming_masks_with_the_pii_found_so_far(windows, masked_with):
+    output = io.BytesIO()
+    _, detected_pii, _, _ = pipeline.process_pdf(make_pdf(PAGE_LINES), "basic", output, streaming=True)
+
+    assert windows == [2, 1]
+    assert masked_with[0] == {}
+    assert masked_with[1] == detected_pii
+    assert pymupdf.open(stream=output.getvalue(), filetype="pdf").page_count == 3
+
+
+def test_cached_analyses_skip_detection(windows, masked_with, monkeypatch):
+    pdf = make_pdf(PAGE_LINES)
+    expected = pipeline.process_pdf(pdf, "critical", None)
+    analyses = expected[3]
+
+    def fail(*args, **kwargs):
+        raise AssertionError("pages were analysed again")
+
+    monkeypatch.setattr(pipeline, "process_pages", fail)
+    windows.clear()
+    text, detected_pii, spans, _ = pipeline.process_pdf(pdf, "critical", None, page_analyses=analyses)
+    assert (text, detected_pii) == expected[:2]
+    assert [(span.pii_type, span.start, span.end) for span in spans] == [
+        (span.pii_type, span.start, span.end) for span in expected[2]
+    ]
+    assert windows == []
+
+    output = io.BytesIO()
+    pipeline.process_pdf(pdf, "critical", output, page_analyses=analyses)
+    assert windows == [2, 1]
+    assert masked_with[-1] == expected[1]
+
+
+def test_pages_are_reported_as_soon_as_their_window_is_analysed(windows, monkeypatch):
+    events = []
+    process_pages = pipeline.process_pages
+    mask_pages = pipeline.mask_pages
+
+    def analyse(images, first_page, *args):
+        events.append(("analyse", first_page))
+        return process_pages(images, first_page, *args)
+
+    def mask(images, *args):
+        events.append(("mask", len(images)))
+        return mask_pages(images, *args)
+
+    monkeypatch.setattr(pipeline, "process_pages", analyse)
+    monkeypatch.setattr(pipeline, "mask_pages", mask)
+    pipeline.process_pdf(
+        make_pdf(PAGE_LINES), "basic", io.BytesIO(),
+        on_analysis=lambda page, pages_total, text, spans: events.append(("page", page, len(spans))),
+        on_page=lambda page, pages_total, text, spans, image: events.append(("masked", page)),
+    )
+    assert events == [
+        ("analyse", 0), ("page", 0, 0), ("page", 1, 0),
+        ("analyse", 2), ("page", 2, 2),
+        ("mask", 2), ("masked", 0), ("masked", 1),
+        ("mask", 1), ("masked", 2),
+    ]
+
+
+def test_progress_is_reported_per_page(windows):
+    reports = []
+    pipeline.process_pdf(
+        make_pdf(PAGE_LINES), "basic", io.BytesIO(),
+        progress=lambda pages_done, pages_total, stage: reports.append((stage, pages_done, pages_total)),
+    )
+    # The page count comes from the text layer before any page is rendered
+    assert reports == [
+        ("analysis", 0, 3), ("analysis", 1, 3), ("analysis", 2, 3), ("analysis", 3, 3),
+        ("masking", 0, 3), ("masking", 1, 3), ("masking", 2, 3), ("masking", 3, 3),
+    ]
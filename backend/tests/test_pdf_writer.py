@@ -0,0 +1,84 @@
+import io
+import re
+import threading
+
+import pytest
+from PIL import Image, ImageDraw
+
+from utils.pdf_writer import ChunkStream, PDFWriter
+
+
+def page_image(number, mode="RGB"):
+    image = Image.new(mode, (400, 560), "white")
+    ImageDraw.Draw(image).rectangle((40, 40 + 20 * number, 200, 60 + 20 * number), fill="black")
+    return image
+
+
+def write_pdf(images, image_format="jpeg"):
+    output = io.BytesIO()
+    writer = PDFWriter(output, image_format=image_format)
+    for image in images:
+        writer.add_page(image)
+    writer.close()
+    return output.getvalue()
+
+
+@pytest.mark.parametrize("image_format", ["jpeg", "flate", "ccitt"])
+def test_pdf_reopens_with_every_page(image_format):
+    pymupdf = pytest.importorskip("pymupdf")
+    images = [page_image(i) for i in range(3)] + [page_image(3, "L")]
+    document = pymupdf.open(stream=write_pdf(images, image_format), filetype="pdf")
+    assert document.page_count == 4
+    for page in document:
+        assert len(page.get_images()) == 1
+        # The page image keeps its redaction (the black box) after encoding
+        pixmap = page.get_pixmap(dpi=36, colorspace=pymupdf.csGRAY)
+        assert min(pixmap.samples) < 64
+
+
+def test_xref_offsets_point_at_objects():
+    data = write_pdf([page_image(i) for i in range(2)])
+    xref = int(re.search(rb"startxref\n(\d+)\n%%EOF\n$", data).group(1))
+    assert data[xref:].startswith(b"xref\n0 ")
+    entries = re.findall(rb"(\d{10}) 00000 n ", data[xref:])
+    for object_id, offset in enumerate(entries, start=1):
+        assert data[int(offset):].startswith(f"{object_id} 0 obj\n".encode())
+
+
+def test_chunk_stream_hands_over_everything_written():
+    stream = ChunkStream(max_chunks=2)
+
+    def produce():
+        writer = PDFWriter(stream)
+        for i in range(3):
+            writer.add_page(page_image(i))
+        writer.close()
+        stream.close()
+
+    threading.Thread(target=produce).start()
+    assert b"".join(stream) == write_pdf([page_image(i) for i in range(3)])
+
+
+def test_chunk_stream_cancel_before_reading_stops_the_producer():
+    stream = ChunkStream(max_chunks=1)
+    stopped = threading.Event()
+
+    def produce():
+        try:
+            while True:
+                stream.write(b"x")
+        except BrokenPipeError:
+            stopped.set()
+        finally:
+            stream.close()
+
+    threading.Thread(target=produce, daemon=True).start()
+    stream.cancel()
+    assert stopped.wait(5)
+
+
+def test_chunk_stream_write_times_out_without_a_reader():
+    stream = ChunkStream(max_chunks=1, write_timeout=0.2)
+    stream.write(b"x")
+    with pytest.raises(BrokenPipeError):
+        stream.write(b"y")
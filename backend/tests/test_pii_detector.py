@@ -0,0 +1,89 @@
+import random
+import re
+
+import pytest
+
+from utils.pii_detector import CONTEXTUAL_KEYWORDS, PII_PATTERNS, PIIDetector, pii_detector
+
+VALUES = {
+    "aadhaar": "1234 5678 9012",
+    "pan": "ABCDE1234F",
+    "voter_id": "ABC1234567",
+    "driving_license": "KA01 2020 1234567",
+    "passport": "A1234567",
+    "credit_card": "4111 1111 1111 1111",
+    "bank_account": "123456789012",
+    "ifsc": "SBIN0001234",
+    "upi_id": "john.doe@ybl",
+    "phone": "9876543210",
+    "email": "john@example.com",
+    "pincode": "560001",
+    "gst": "29ABCDE1234F1Z5",
+    "cin": "L12345MH2020PLC123456",
+    "esic": "12-345-678901-2",
+    "pf": "MH/12345/1234567",
+    "social_security": "AB123456C",
+    "tin": "12345678901",
+    "vehicle_registration": "KA-01-AB-1234",
+    "dob": "12/03/1990",
+}
+FILLER = ["the", "of", "statement", "and", "Customer", "details", "to", "page", "2023", "Rs."]
+
+
+def baseline_spans(text):
+    """
+    The detection the detector replaced: every pattern over the whole text,
+    then every contextual keyword pattern, one type at a time.
+    """
+    spans = set()
+    for pii_type, pattern in PII_PATTERNS.items():
+        spans.update((pii_type, m.start(), m.end()) for m in re.finditer(pattern, text))
+        for keyword in CONTEXTUAL_KEYWORDS[pii_type]:
+            for m in re.finditer(rf"{keyword}[:\s]*({pattern})", text, re.IGNORECASE):
+                spans.add((pii_type, m.start(1), m.end(1)))
+    return spans
+
+
+def detector_spans(detector, text):
+    return {(span.pii_type, span.start, span.end) for span in detector.detect_spans(text)}
+
+
+def sample_text(seed, words=3000):
+    rng = random.Random(seed)
+    keywords = [keyword for keywords in CONTEXTUAL_KEYWORDS.values() for keyword in keywords]
+    parts = []
+    for _ in range(words):
+        roll = rng.random()
+        if roll < 0.1:
+            parts.append(rng.choice(list(VALUES.values())))
+        elif roll < 0.15:
+            parts.append(rng.choice(keywords) + rng.choice([": ", " ", ":"]))
+        else:
+            parts.append(rng.choice(FILLER))
+        parts.append(rng.choice([" ", " ", " ", "\n", "\t"]))
+    return "".join(parts)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_detector_matches_baseline_patterns(seed):
+    text = sample_text(seed)
+    expected = baseline_spans(text)
+    assert expected
+    assert detector_spans(pii_detector, text) == expected
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_candidate_regions_do_not_change_results(seed):
+    text = sample_text(seed) + " " + "x" * 1000 + " " + sample_text(seed + 100)
+    assert detector_spans(pii_detector, text) == detector_spans(PIIDetector(anchor_chars=None), text)
+
+
+@pytest.mark.parametrize("pii_type", sorted(VALUES))
+def test_each_type_is_detected(pii_type):
+    text = f"Customer details: {VALUES[pii_type]} on file"
+    assert VALUES[pii_type] in pii_detector.detect(text).get(pii_type, [])
+
+
+def test_contextual_keyword_is_case_insensitive():
+    text = "Pan: abcde1234f"
+    assert pii_detector.detect(text).get("pan") == ["abcde1234f"]
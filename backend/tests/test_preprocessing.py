@@ -0,0 +1,78 @@
+import pytest
+from PIL import Image, ImageDraw
+
+cv2 = pytest.importorskip("cv2")
+import numpy as np
+
+from utils import preprocessing
+from utils.preprocessing import boxes_to_original, estimate_skew, preprocess
+
+
+def text_page(size=(1200, 800), angle=0):
+    image = Image.new("L", size, 255)
+    draw = ImageDraw.Draw(image)
+    for y in range(100, size[1] - 100, 40):
+        draw.rectangle((100, y, size[0] - 100, y + 12), fill=0)
+    return image.rotate(angle, fillcolor=255) if angle else image
+
+
+def test_steps_run_in_order_on_a_grayscale_copy():
+    image = Image.new("RGB", (200, 100), (120, 120, 120))
+    image.paste((20, 20, 20), (50, 30, 150, 70))
+
+    processed, matrix = preprocess(image, steps=("blur", "otsu"))
+
+    assert processed.mode == "L"
+    assert processed.size == image.size
+    assert set(np.unique(np.asarray(processed))) == {0, 255}
+    assert matrix is None
+    assert image.getpixel((0, 0)) == (120, 120, 120)
+
+
+def test_unknown_step():
+    with pytest.raises(ValueError):
+        preprocess(Image.new("L", (10, 10)), steps=("sharpen",))
+
+
+def test_downscale_maps_boxes_back(monkeypatch):
+    # A4 at 100 DPI is 1169 pixels long, half the width of the image
+    monkeypatch.setattr(preprocessing, "PREPROCESS_TARGET_DPI", 100)
+    image = Image.new("L", (2338, 1600), 255)
+
+    processed, matrix = preprocess(image, steps=("downscale",))
+
+    assert processed.size == (1169, 800)
+    assert boxes_to_original([(100, 50, 20, 10)], matrix, image.size) == [(200, 100, 40, 20)]
+
+
+def test_small_images_are_not_downscaled():
+    processed, matrix = preprocess(Image.new("L", (600, 400), 255), steps=("downscale",))
+
+    assert processed.size == (600, 400)
+    assert matrix is None
+
+
+def test_deskew_finds_the_angle_and_maps_boxes_back():
+    image = text_page(angle=3)
+
+    assert estimate_skew(np.asarray(image)) == pytest.approx(-3, abs=0.5)
+
+    processed, matrix = preprocess(image, steps=("deskew",))
+    # Where the corners of a box on the original end up on the straightened page
+    corners = np.array([[500, 300, 1], [700, 300, 1], [500, 340, 1], [700, 340, 1]]) @ matrix.T
+    x0, y0 = corners[:, :2].min(axis=0)
+    x1, y1 = corners[:, :2].max(axis=0)
+    # Mapping the box found there back covers the original box
+    left, top, width, height = boxes_to_original([(x0, y0, x1 - x0, y1 - y0)], matrix, image.size)[0]
+    assert left <= 500 and top <= 300
+    assert left + width >= 700 and top + height >= 340
+
+
+def test_boxes_are_clipped_to_the_original():
+    matrix = np.array([[0.5, 0, 0], [0, 0.5, 0], [0, 0, 1]])
+
+    assert boxes_to_original([(90, 40, 30, 30)], matrix, (200, 100)) == [(180, 80, 20, 20)]
+
+
+def test_boxes_without_transform_are_unchanged():
+    assert boxes_to_original([(1, 2, 3, 4)], None, (10, 10)) == [(1, 2, 3, 4)]
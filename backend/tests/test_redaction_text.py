@@ -0,0 +1,79 @@
+import random
+
+import pytest
+
+from ocr import OCRResult
+from utils.pii_detector import PIISpan, detect_spans, filter_spans_by_level, redact_spans, spans_to_dict
+from utils.pipeline import page_redactions, redact_document_text
+
+from test_pii_detector import FILLER, VALUES
+
+
+def ocr_result(text):
+    words = text.split()
+    count = len(words)
+    return OCRResult({
+        "text": words,
+        "block_num": [1] * count,
+        "par_num": [1] * count,
+        "line_num": [1] * count,
+        "left": [20 * i for i in range(count)],
+        "top": [0] * count,
+        "width": [10] * count,
+        "height": [10] * count,
+        "conf": [90] * count,
+    })
+
+
+def value_replace(text, detected_pii):
+    """
+    The redaction spans replaced: every detected value replaced wherever it
+    occurs.
+    """
+    for values in detected_pii.values():
+        for value in sorted(values, key=len, reverse=True):
+            text = text.replace(value, "[REDACTED]")
+    return text
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_span_redaction_matches_value_replace(seed):
+    # Values whose detections never overlap, so each is one replacement
+    values = [VALUES[pii_type] for pii_type in ("email", "phone", "pan", "ifsc", "upi_id", "dob", "passport")]
+    rng = random.Random(seed)
+    text = " ".join(rng.choice(values) if rng.random() < 0.2 else rng.choice(FILLER) for _ in range(500))
+    spans = filter_spans_by_level(detect_spans(text, ner=False), "critical")
+    redacted = redact_spans(text, spans)
+    assert "[REDACTED]" in redacted
+    assert redacted == value_replace(text, spans_to_dict(text, spans))
+
+
+def test_overlapping_spans_are_merged():
+    text = "card 4111 1111 1111 1111 end"
+    spans = [PIISpan("credit_card", 5, 24), PIISpan("bank_account", 10, 19)]
+    assert redact_spans(text, spans) == "card [REDACTED] end"
+
+
+def test_values_found_on_other_pages_are_redacted():
+    pages = [ocr_result("PAN abcde1234f issued"), ocr_result("copy: (abcde1234f) again")]
+    analyses = [(page.text, detect_spans(page.text, ner=False), page) for page in pages]
+    detected_pii = {}
+    for text, spans, _ in analyses:
+        for pii_type, values in spans_to_dict(text, filter_spans_by_level(spans, "intermediate")).items():
+            detected_pii.setdefault(pii_type, []).extend(values)
+
+    assert detected_pii == {"pan": ["abcde1234f"]}
+    # Only the first page has a contextual hit; the second is redacted through
+    # the document's value index, like its image
+    assert analyses[1][1] == []
+    assert redact_document_text(analyses, detected_pii, "intermediate") == (
+        "PAN [REDACTED] issued\n\ncopy: [REDACTED] again\n\n"
+    )
+    assert len(page_redactions(pages[1], detected_pii, "intermediate")) == 1
+
+
+def test_values_above_the_level_are_kept():
+    page = ocr_result("PAN ABCDE1234F email john@example.com")
+    analyses = [(page.text, detect_spans(page.text, ner=False), page)]
+    detected_pii = spans_to_dict(page.text, filter_spans_by_level(analyses[0][1], "basic"))
+    assert redact_document_text(analyses, detected_pii, "basic") == "PAN ABCDE1234F email [REDACTED]\n\n"
@@ -0,0 +1,80 @@
+import threading
+
+import pytest
+from PIL import Image, ImageDraw
+
+import ocr
+from utils import preprocessing
+
+
+def fake_ocr_data(crop, config):
+    # One word per region, placed 5 pixels into the crop
+    return {
+        "text": [f"{crop.width}x{crop.height}"],
+        "block_num": [1],
+        "par_num": [1],
+        "line_num": [1],
+        "left": [5],
+        "top": [5],
+        "width": [10],
+        "height": [10],
+        "conf": [90.0],
+        "thread": threading.get_ident(),
+    }
+
+
+def test_region_results_are_merged_in_page_coordinates(monkeypatch):
+    monkeypatch.setattr(ocr, "ocr_data", fake_ocr_data)
+    image = Image.new("L", (400, 300), 255)
+    result = ocr.run_ocr_regions(image, [(10, 20, 100, 30), (50, 200, 60, 40)])
+
+    assert result.words == ["100x30", "60x40"]
+    assert result.boxes == [(15, 25, 10, 10), (55, 205, 10, 10)]
+    # Words of different regions never share a block
+    assert result.text == "100x30\n\n60x40\n"
+
+
+def test_region_threads_are_reused_across_pages(monkeypatch):
+    threads = set()
+
+    def record(crop, config):
+        data = fake_ocr_data(crop, config)
+        threads.add(data["thread"])
+        return data
+
+    monkeypatch.setattr(ocr, "ocr_data", record)
+    monkeypatch.setattr(ocr, "OCR_REGION_WORKERS", 2)
+    monkeypatch.setattr(ocr, "_region_executor", None)
+    image = Image.new("L", (400, 300), 255)
+    regions = [(0, 0, 50, 50), (100, 100, 50, 50), (200, 200, 50, 50)]
+
+    executor = ocr._get_region_executor()
+    for _ in range(5):
+        ocr.run_ocr_regions(image, regions)
+    assert ocr._get_region_executor() is executor
+    # Each pool thread keeps its own engine, so no more than the pool size ever OCR
+    assert 1 <= len(threads) <= 2
+    executor.shutdown()
+
+
+def test_sparse_page_is_split_into_text_regions():
+    pytest.importorskip("cv2")
+    image = Image.new("L", (1240, 1754), 255)
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((100, 100, 400, 115), fill=0)
+    draw.rectangle((700, 1400, 1000, 1415), fill=0)
+
+    regions = preprocessing.find_text_regions(image)
+    assert regions is not None and len(regions) == 2
+    (left, top, width, height), second = regions
+    assert left <= 100 and top <= 100 and left + width >= 400 and top + height >= 115
+    assert second[1] > top
+
+
+def test_dense_page_is_ocred_whole():
+    pytest.importorskip("cv2")
+    image = Image.new("L", (600, 800), 255)
+    draw = ImageDraw.Draw(image)
+    for y in range(20, 780, 20):
+        draw.rectangle((20, y, 580, y + 8), fill=0)
+    assert preprocessing.find_text_regions(image) is None
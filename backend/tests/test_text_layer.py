@@ -0,0 +1,72 @@
+import pytest
+
+pymupdf = pytest.importorskip("pymupdf")
+from utils import text_layer
+from utils.text_layer import open_text_layer, page_ocr_result
+
+
+def make_pdf(text=None, image_rect=None, rotate=0):
+    document = pymupdf.open()
+    page = document.new_page(width=600, height=800)
+    if text is not None:
+        page.insert_text((72, 100), text, fontsize=12)
+    if image_rect is not None:
+        pixmap = pymupdf.Pixmap(pymupdf.csRGB, pymupdf.IRect(0, 0, 40, 40), False)
+        pixmap.clear_with(200)
+        page.insert_image(pymupdf.Rect(image_rect), pixmap=pixmap)
+    page.set_rotation(rotate)
+    return document.tobytes()
+
+
+def test_words_and_boxes_in_image_pixels():
+    document = open_text_layer(make_pdf("Contact john@example.com or call 9876543210"))
+    # Rendered at twice the PDF resolution
+    result = page_ocr_result(document, 0, (1200, 1600))
+
+    assert result.words == ["Contact", "john@example.com", "or", "call", "9876543210"]
+    assert result.text == "Contact john@example.com or call 9876543210\n"
+    left, top, width, height = result.boxes[0]
+    assert 140 <= left <= 148
+    assert 160 <= top < 200 < top + height <= 210
+    assert all(confidence == 100.0 for confidence in result.confidences)
+
+
+def test_rotated_page_boxes_follow_the_displayed_page():
+    document = open_text_layer(make_pdf("Contact john@example.com or call 9876543210", rotate=90))
+    # Displayed landscape: the text runs down the right side of the image
+    result = page_ocr_result(document, 0, (800, 600))
+
+    left, top, width, height = result.boxes[0]
+    assert height > width
+    assert left > 600
+
+
+def test_scanned_page_needs_ocr():
+    document = open_text_layer(make_pdf("Page 1"))
+
+    assert page_ocr_result(document, 0, (600, 800)) is None
+
+
+def test_page_mostly_covered_by_an_image_needs_ocr():
+    document = open_text_layer(make_pdf("Scanned by OfficeScanner 3000, page 1 of 1", image_rect=(0, 150, 600, 800)))
+
+    assert page_ocr_result(document, 0, (600, 800)) is None
+
+
+def test_small_image_keeps_the_text_layer():
+    document = open_text_layer(make_pdf("Contact john@example.com or call 9876543210", image_rect=(500, 700, 540, 740)))
+
+    assert page_ocr_result(document, 0, (600, 800)) is not None
+
+
+def test_missing_page_or_document():
+    document = open_text_layer(make_pdf("Contact john@example.com or call 9876543210"))
+
+    assert page_ocr_result(document, 1, (600, 800)) is None
+    assert page_ocr_result(None, 0, (600, 800)) is None
+
+
+def test_disabled(monkeypatch):
+    monkeypatch.setattr(text_layer, "PDF_TEXT_LAYER", False)
+
+    assert open_text_layer(make_pdf("Contact john@example.com")) is None
@@ -0,0 +1,59 @@
+import io
+import json
+
+import pytest
+
+from utils.pii_detector import detect_spans, filter_spans_by_level, redact_spans
+from utils.text_stream import iter_text, redact_records, redact_text_stream
+
+from test_pii_detector import sample_text
+
+
+def redact_whole(text, level):
+    spans = filter_spans_by_level(detect_spans(text, ner=False, redaction_level=level), level)
+    return redact_spans(text, spans)
+
+
+def pieces(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+@pytest.mark.parametrize("level", ["basic", "intermediate", "critical"])
+@pytest.mark.parametrize("seed", range(3))
+def test_streamed_redaction_matches_whole_text(seed, level):
+    text = sample_text(seed, words=1500)
+    streamed = redact_text_stream(pieces(text, 97), level, ner=False, chunk_chars=200, overlap=64)
+    assert "".join(streamed) == redact_whole(text, level)
+
+
+@pytest.mark.parametrize("chunk_chars", [1, 7, 64])
+def test_values_across_window_boundaries_are_redacted(chunk_chars):
+    text = "Card: 4111 1111 1111 1111 mail john@example.com Aadhaar 1234 5678 9012 end"
+    streamed = "".join(redact_text_stream(pieces(text, 5), "critical", ner=False, chunk_chars=chunk_chars, overlap=40))
+    assert streamed == redact_whole(text, "critical")
+    assert "4111" not in streamed and "john@" not in streamed
+
+
+def test_iter_text_decodes_split_characters():
+    text = "नाम: राम " * 200 + "PAN ABCDE1234F"
+    assert "".join(iter_text(io.BytesIO(text.encode()), read_bytes=7)) == text
+
+
+def test_redact_records_keeps_order_ids_and_errors():
+    lines = [
+        json.dumps({"id": 1, "text": "mail john@example.com"}),
+        "",
+        "not json",
+        json.dumps("PAN ABCDE1234F"),
+        json.dumps({"id": "x", "body": "missing text"}),
+    ]
+    results = [json.loads(line) for line in redact_records(lines, "critical", ner=False, batch_size=1)]
+
+    assert results[0]["id"] == 1
+    assert results[0]["redacted_text"] == redact_whole("mail john@example.com", "critical")
+    assert results[0]["detected_pii"]["email"] == ["john@example.com"]
+    assert results[1]["line"] == 3 and "error" in results[1]
+    assert "id" not in results[2]
+    assert "ABCDE1234F" not in results[2]["redacted_text"]
+    assert results[3]["line"] == 5 and "error" in results[3]
+    assert len(results) == 4
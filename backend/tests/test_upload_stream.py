@@ -0,0 +1,74 @@
+import io
+import json
+
+import pytest
+from PIL import Image
+
+app_module = pytest.importorskip("app")
+from ocr import OCRResult
+from utils import pipeline
+
+
+def fake_ocr(image, config=None):
+    return OCRResult({
+        "text": ["Email:", "john@example.com"],
+        "block_num": [1, 1],
+        "par_num": [1, 1],
+        "line_num": [1, 1],
+        "left": [10, 80],
+        "top": [10, 10],
+        "width": [60, 100],
+        "height": [20, 20],
+        "conf": [90, 90],
+    })
+
+
+@pytest.fixture
+def client(monkeypatch):
+    pages = [Image.new("RGB", (300, 200), "white") for _ in range(3)]
+
+    def iter_pdf_windows(file_bytes, window, dpi=None, poppler_path=None):
+        for first_page in range(0, len(pages), window):
+            yield len(pages), pages[first_page:first_page + window]
+
+    monkeypatch.setattr(pipeline, "run_ocr", fake_ocr)
+    monkeypatch.setattr(pipeline, "iter_pdf_windows", iter_pdf_windows)
+    monkeypatch.setattr(pipeline, "PDF_MAX_INFLIGHT_PAGES", 1)
+    monkeypatch.setattr(pipeline, "PAGE_WORKERS", 1)
+    monkeypatch.setattr(app_module, "tesseract_available", lambda: True)
+    monkeypatch.setattr(app_module, "get_result_cache", lambda: None)
+    return app_module.app.test_client()
+
+
+def upload(client, **kwargs):
+    return client.post(
+        "/upload/stream",
+        data={"file": (io.BytesIO(b"%PDF-1.4"), "statement.pdf"), "redaction_level": "basic"},
+        content_type="multipart/form-data",
+        **kwargs,
+    )
+
+
+def test_page_results_come_before_masked_pages(client):
+    response = upload(client)
+    events = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+    assert [(event["event"], event.get("page")) for event in events] == [
+        ("page", 1), ("page", 2), ("page", 3),
+        ("masked_page", 1), ("masked_page", 2), ("masked_page", 3),
+        ("done", None),
+    ]
+    assert events[0]["pages_total"] == 3
+    assert events[0]["detected_pii"] == {"email": ["john@example.com"]}
+    assert events[0]["redacted_text"] == "Email: [REDACTED]\n"
+    assert client.get(events[3]["masked_page_url"]).status_code == 200
+    assert events[-1]["detected_pii"] == {"email": ["john@example.com"]}
+
+
+def test_server_sent_events(client):
+    response = upload(client, headers={"Accept": "text/event-stream"})
+    assert response.mimetype == "text/event-stream"
+    body = response.get_data(as_text=True)
+    assert body.startswith("event: page\ndata: ")
+    assert body.count("event: masked_page\n") == 3
+    assert "event: done\n" in body
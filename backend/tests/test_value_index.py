@@ -0,0 +1,57 @@
+from utils.pipeline import build_value_index, level_value_index, match_value_index, page_redactions
+
+from test_redaction_text import ocr_result
+
+
+def test_multi_token_values_are_indexed_longest_first():
+    index = build_value_index({"aadhaar": ["1234 5678 9012"], "phone": ["1234"], "email": ["a@b.com"]})
+
+    assert index == {
+        "1234": [("1234", "5678", "9012"), ("1234",)],
+        "a@b.com": [("a@b.com",)],
+    }
+
+
+def test_multi_token_value_matches_its_word_group():
+    page = ocr_result("Aadhaar 1234 5678 9012 and 1234 5678 0000")
+    index = build_value_index({"aadhaar": ["1234 5678 9012"]})
+
+    assert match_value_index(page, index) == {1, 2, 3}
+
+
+def test_partial_multi_token_value_is_not_matched():
+    page = ocr_result("Aadhaar 1234 5678 and more")
+
+    assert match_value_index(page, build_value_index({"aadhaar": ["1234 5678 9012"]})) == set()
+
+
+def test_punctuation_around_words_is_ignored():
+    page = ocr_result("Ph:9876543210, mail (john@example.com). card 1234 5678, 9012.")
+    index = build_value_index({
+        "phone": ["9876543210"],
+        "email": ["john@example.com"],
+        "credit_card": ["1234 5678 9012"],
+    })
+
+    assert match_value_index(page, index) == {0, 2, 4, 5, 6}
+
+
+def test_empty_index_matches_nothing():
+    assert match_value_index(ocr_result("john@example.com"), {}) == set()
+
+
+def test_level_index_keeps_only_the_level_types():
+    detected_pii = {"email": ["john@example.com"], "pan": ["ABCDE1234F"], "ifsc": ["SBIN0001234"]}
+
+    assert set(level_value_index(detected_pii, "basic")) == {"john@example.com"}
+    assert set(level_value_index(detected_pii, "intermediate")) == {"john@example.com", "ABCDE1234F"}
+    assert set(level_value_index(detected_pii, "critical")) == {"john@example.com", "ABCDE1234F", "SBIN0001234"}
+
+
+def test_page_redactions_box_every_matched_word():
+    page = ocr_result("Aadhaar 1234 5678 9012 email john@example.com")
+    boxes = page_redactions(page, {"aadhaar": ["1234 5678 9012"], "email": ["john@example.com"]}, "intermediate")
+
+    # One padded box per word, in word order
+    assert len(boxes) == 4
+    assert list(boxes[:, 0]) == sorted(boxes[:, 0])
@@ -0,0 +1,154 @@
+"""
+Storage for redacted output files.
+
+Every request gets its own artifact ID, so concurrent requests no longer
+overwrite each other's output. Artifacts are kept on disk (shared by all
+gunicorn workers) or in memory (single worker only, no disk I/O) and are
+removed once they are older than the retention period.
+"""
+import io
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+# "disk" or "memory"; memory artifacts are only visible to the worker
+# process that created them, so use it with a single gunicorn worker
+ARTIFACT_STORAGE = os.getenv("ARTIFACT_STORAGE", "disk").lower()
+ARTIFACT_TTL_SECONDS = int(os.getenv("ARTIFACT_TTL_SECONDS", "3600"))
+ARTIFACT_MAX_MEMORY_BYTES = int(os.getenv("ARTIFACT_MAX_MEMORY_MB", "256")) * 1024 * 1024
+# Minimum time between two retention sweeps
+ARTIFACT_CLEANUP_INTERVAL_SECONDS = 60
+
+_ARTIFACT_ID = re.compile(r"^[0-9a-f]{32}\.(pdf|png)$")
+
+# Filename offered to the browser for each artifact type
+DOWNLOAD_NAMES = {
+    "pdf": "redacted_document.pdf",
+    "png": "redacted_image.png",
+}
+
+
+class _MemoryArtifact(io.BytesIO):
+    """
+    BytesIO that hands its contents to the store when closed.
+    """
+
+    def __init__(self, store, artifact_id):
+        super().__init__()
+        self._store = store
+        self._artifact_id = artifact_id
+
+    def close(self):
+        if not self.closed:
+            self._store._put(self._artifact_id, self.getvalue())
+        super().close()
+
+
+class ArtifactStore:
+    """
+    Create, look up and expire per-request output files.
+    """
+
+    def __init__(self, folder, storage=ARTIFACT_STORAGE, ttl=ARTIFACT_TTL_SECONDS,
+                 max_memory_bytes=ARTIFACT_MAX_MEMORY_BYTES):
+        self.folder = folder
+        self.storage = storage
+        self.ttl = ttl
+        self.max_memory_bytes = max_memory_bytes
+        self.memory_size = 0
+        self._memory = OrderedDict()  # artifact_id -> (created_at, data)
+        self._lock = threading.Lock()
+        self._last_cleanup = 0
+        if storage == "disk":
+            os.makedirs(folder, exist_ok=True)
+
+    @staticmethod
+    def new_id(extension):
+        return f"{uuid.uuid4().hex}.{extension}"
+
+    @staticmethod
+    def url(artifact_id):
+        return f"/download/{artifact_id}"
+
+    def create(self, extension):
+        """
+        Return ``(artifact_id, file)`` for a new artifact. The artifact is
+        stored once the binary ``file`` is closed.
+        """
+        self.cleanup()
+        artifact_id = self.new_id(extension)
+        if self.storage == "memory":
+            return artifact_id, _MemoryArtifact(self, artifact_id)
+        return artifact_id, open(os.path.join(self.folder, artifact_id), "wb")
+
+    def save_bytes(self, data, extension):
+        """
+        Store ``data`` as a new artifact and return its ID.
+        """
+        artifact_id, f = self.create(extension)
+        with f:
+            f.write(data)
+        return artifact_id
+
+    def _put(self, artifact_id, data):
+        with self._lock:
+            self._memory[artifact_id] = (time.time(), data)
+            self.memory_size += len(data)
+            while self.memory_size > self.max_memory_bytes and len(self._memory) > 1:
+                _, (_, evicted) = self._memory.popitem(last=False)
+                self.memory_size -= len(evicted)
+
+    def open(self, artifact_id):
+        """
+        Return ``(file, download_name)`` for an artifact, or None if it does
+        not exist or has expired.
+        """
+        match = _ARTIFACT_ID.match(artifact_id)
+        if match is None:
+            return None
+        download_name = DOWNLOAD_NAMES[match.group(1)]
+
+        if self.storage == "memory":
+            with self._lock:
+                entry = self._memory.get(artifact_id)
+            if entry is None or entry[0] + self.ttl < time.time():
+                return None
+            return io.BytesIO(entry[1]), download_name
+
+        path = os.path.join(self.folder, artifact_id)
+        try:
+            if os.path.getmtime(path) + self.ttl < time.time():
+                return None
+            return open(path, "rb"), download_name
+        except OSError:
+            return None
+
+    def cleanup(self, force=False):
+        """
+        Remove artifacts older than the retention period.
+        """
+        now = time.time()
+        with self._lock:
+            if not force and now - self._last_cleanup < ARTIFACT_CLEANUP_INTERVAL_SECONDS:
+                return
+            self._last_cleanup = now
+            cutoff = now - self.ttl
+            while self._memory:
+                artifact_id, (created_at, data) = next(iter(self._memory.items()))
+                if created_at >= cutoff:
+                    break
+                del self._memory[artifact_id]
+                self.memory_size -= len(data)
+
+        if self.storage != "disk":
+            return
+        for name in os.listdir(self.folder):
+            path = os.path.join(self.folder, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,156 @@
+"""
+Batch redaction of many documents in one request.
+
+Documents come from an uploaded ZIP archive or from several uploaded files.
+A few are redacted at a time on threads, and their pages all go through the
+shared page pool. The redacted files are written to a ZIP stream as each
+document finishes, followed by ``report.json`` with the PII found in every
+document.
+"""
+import io
+import json
+import logging
+import os
+import posixpath
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import partial
+
+logger = logging.getLogger(__name__)
+
+# Documents redacted at the same time per request
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "4"))
+# Limits on archive input, checked before anything is extracted
+BATCH_MAX_DOCUMENTS = int(os.getenv("BATCH_MAX_DOCUMENTS", "100"))
+BATCH_MAX_BYTES = int(os.getenv("BATCH_MAX_BYTES", str(200 * 1024 * 1024)))
+
+DOCUMENT_EXTENSIONS = (".pdf", ".png", ".jpg", ".jpeg", ".tif", ".tiff", ".bmp", ".gif", ".webp")
+
+REPORT_NAME = "report.json"
+
+
+class BatchError(ValueError):
+    """Raised when a batch upload cannot be accepted."""
+
+
+def _is_document(name):
+    base = posixpath.basename(name)
+    return (
+        not base.startswith(".")
+        and not name.startswith("__MACOSX/")
+        and base.lower().endswith(DOCUMENT_EXTENSIONS)
+    )
+
+
+def archive_documents(archive_bytes):
+    """
+    Return ``[(name, load)]`` for the documents in a ZIP archive, where
+    ``load()`` reads the document. Raises BatchError for archives that are
+    unreadable, empty or over the limits.
+    """
+    try:
+        archive = zipfile.ZipFile(io.BytesIO(archive_bytes))
+    except zipfile.BadZipFile as e:
+        raise BatchError(f"Invalid ZIP archive: {e}") from e
+
+    entries = [info for info in archive.infolist() if not info.is_dir() and _is_document(info.filename)]
+    if not entries:
+        raise BatchError("The archive contains no PDF or image files")
+    if len(entries) > BATCH_MAX_DOCUMENTS:
+        raise BatchError(f"The archive holds {len(entries)} documents; the limit is {BATCH_MAX_DOCUMENTS}")
+    # Declared sizes are checked up front and enforced while reading, so a
+    # ZIP bomb cannot expand past the limit
+    if sum(info.file_size for info in entries) > BATCH_MAX_BYTES:
+        raise BatchError(f"The archive expands to more than {BATCH_MAX_BYTES} bytes")
+
+    def load(info):
+        with archive.open(info) as f:
+            data = f.read(info.file_size + 1)
+        if len(data) > info.file_size:
+            raise BatchError(f"{info.filename} is larger than its archive entry declares")
+        return data
+
+    return [(info.filename, partial(load, info)) for info in entries]
+
+
+def _output_name(name, extension, used):
+    stem = posixpath.splitext(name.replace("\\", "/").lstrip("/"))[0]
+    # Keep archive paths but never let them climb out of the output folder
+    stem = "/".join(part for part in stem.split("/") if part not in ("", ".", ".."))
+    candidate = f"{stem}_redacted.{extension}"
+    number = 1
+    while candidate in used:
+        number += 1
+        candidate = f"{stem}_redacted-{number}.{extension}"
+    used.add(candidate)
+    return candidate
+
+
+def write_batch_zip(documents, redact, output, workers=BATCH_WORKERS):
+    """
+    Redact ``[(name, load)]`` documents and write the results to ``output``
+    as a ZIP.
+
+    ``redact(file_bytes, filename)`` returns ``(result, status_code)`` where a
+    successful result holds the JSON ``response``, the redacted ``artifact``
+    bytes and its ``extension``; any other result is the error payload.
+    Entries are written in completion order; ``report.json`` comes last and
+    lists the documents in input order. Returns the per-document reports.
+    """
+    workers = max(1, workers)
+
+    def run(name, load):
+        try:
+            return redact(load(), posixpath.basename(name))
+        except BatchError as e:
+            return {"error": str(e)}, 400
+        except Exception as e:
+            logger.exception("Error redacting %s in batch", name)
+            return {"error": f"Cannot process file: {str(e)}"}, 500
+
+    reports = [None] * len(documents)
+    used_names = {REPORT_NAME}
+    pending = iter(enumerate(documents))
+    with zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED) as archive, \
+            ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch") as executor:
+
+        # future -> (index, name); documents are only loaded once a slot
+        # frees up, so at most ``workers`` of them are held in memory
+        running = {}
+
+        def submit_next():
+            for index, (name, load) in pending:
+                running[executor.submit(run, name, load)] = (index, name)
+                return
+
+        for _ in range(workers):
+            submit_next()
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                index, name = running.pop(future)
+                result, status_code = future.result()
+                if status_code == 200:
+                    entry = _output_name(name, result["extension"], used_names)
+                    # Images and PDFs are compressed already
+                    archive.writestr(entry, result["artifact"], compress_type=zipfile.ZIP_STORED)
+                    reports[index] = dict({"name": name, "status": "done", "output": entry}, **result["response"])
+                else:
+                    reports[index] = {"name": name, "status": "failed", "error": result.get("error")}
+                submit_next()
+
+        combined = {}
+        for report in reports:
+            for pii_type, values in report.get("detected_pii", {}).items():
+                combined.setdefault(pii_type, {}).update(dict.fromkeys(values))
+        archive.writestr(
+            REPORT_NAME,
+            json.dumps(
+                {
+                    "documents": reports,
+                    "detected_pii": {pii_type: list(values) for pii_type, values in combined.items()},
+                },
+                indent=2,
+            ),
+        )
+    return reports
@@ -0,0 +1,173 @@
+"""
+Content-addressed cache for upload results.
+
+Entries are keyed by the SHA-256 of the uploaded file plus the engine
+configuration, so re-uploading the same document skips OCR (and, for the
+same redaction level, everything else). Entries are evicted least recently
+used first once the size budget is exceeded, and expire after a TTL.
+
+The disk cache holds the extracted text of every document, unredacted, so
+its directory is created private to the server's user (mode 0700).
+"""
+import hashlib
+import logging
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+# "memory", "disk" or "none"
+RESULT_CACHE = os.getenv("RESULT_CACHE", "memory").lower()
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_MB", "256")) * 1024 * 1024
+RESULT_CACHE_TTL_SECONDS = int(os.getenv("RESULT_CACHE_TTL_SECONDS", "3600"))
+RESULT_CACHE_DIR = os.getenv("RESULT_CACHE_DIR", os.path.join("redacted_documents", ".cache"))
+# Assumed size of a cached value whose size the caller did not give
+DEFAULT_ENTRY_BYTES = 1024
+
+logger = logging.getLogger(__name__)
+
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+
+def content_hash(file_bytes):
+    """
+    Return the hex SHA-256 digest of the uploaded file.
+    """
+    return hashlib.sha256(file_bytes).hexdigest()
+
+
+class MemoryCache:
+    """
+    In-process LRU cache with a byte budget and a TTL.
+    """
+
+    def __init__(self, max_bytes=RESULT_CACHE_MAX_BYTES, ttl=RESULT_CACHE_TTL_SECONDS):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+        self._entries = OrderedDict()  # key -> (expires_at, size, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, size, value = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                self.size -= size
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, size=None):
+        """
+        Store ``value``, counting ``size`` bytes against the budget. Values
+        are kept as they are, so callers give their size (see
+        pipeline.analyses_size) rather than having them serialized.
+        """
+        if size is None:
+            size = DEFAULT_ENTRY_BYTES
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.size -= self._entries.pop(key)[1]
+            self._entries[key] = (time.time() + self.ttl, size, value)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self.size -= evicted_size
+
+
+class DiskCache:
+    """
+    LRU cache of pickled entries in a local directory, with a byte budget and
+    a TTL. A file's mtime is its last use.
+    """
+
+    def __init__(self, directory=RESULT_CACHE_DIR, max_bytes=RESULT_CACHE_MAX_BYTES, ttl=RESULT_CACHE_TTL_SECONDS):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # Entries hold unredacted text: readable by the server's user only
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        os.chmod(directory, 0o700)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha256(key.encode()).hexdigest() + ".pkl")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            if os.path.getmtime(path) + self.ttl < time.time():
+                os.remove(path)
+                return None
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+            os.utime(path)
+            return value
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+
+    def set(self, key, value, size=None):
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            total = 0
+            now = time.time()
+            for name in os.listdir(self.directory):
+                if not name.endswith(".pkl"):
+                    continue
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if stat.st_mtime + self.ttl < now:
+                    self._remove(path)
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                self._remove(path)
+                total -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def get_result_cache():
+    """
+    Return the configured result cache, or None when caching is disabled.
+    """
+    global _result_cache
+    if RESULT_CACHE not in ("memory", "disk"):
+        return None
+    with _result_cache_lock:
+        if _result_cache is None:
+            _result_cache = DiskCache() if RESULT_CACHE == "disk" else MemoryCache()
+            logger.info("Result cache enabled (%s)", RESULT_CACHE)
+        return _result_cache
@@ -0,0 +1,150 @@
+"""
+Background jobs for redacting large documents.
+
+Jobs run on a small thread pool (the CPU-heavy page work still goes to the
+page process pool). Job state is kept as JSON files in a shared folder so
+that any gunicorn worker can answer status and result requests.
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Jobs processed at the same time per worker process
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# Jobs allowed to wait for a free slot before new submissions are refused
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "16"))
+# How long finished jobs and their results are kept
+JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", "3600"))
+JOB_RETRY_AFTER_SECONDS = int(os.getenv("JOB_RETRY_AFTER_SECONDS", "10"))
+
+logger = logging.getLogger(__name__)
+
+_JOB_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+class QueueFullError(RuntimeError):
+    """Raised when the job queue has no room for another job."""
+
+
+class JobManager:
+    """
+    Run functions in the background and track their progress on disk.
+    """
+
+    def __init__(self, folder, workers=JOB_WORKERS, queue_size=JOB_QUEUE_SIZE, ttl=JOB_TTL_SECONDS):
+        self.folder = folder
+        self.workers = workers
+        self.capacity = workers + queue_size
+        self.ttl = ttl
+        self.pending = 0
+        self._lock = threading.Lock()
+        self._executor = None
+        os.makedirs(folder, exist_ok=True)
+
+    def _path(self, job_id, suffix):
+        return os.path.join(self.folder, f"{job_id}.{suffix}.json")
+
+    def _write(self, job_id, suffix, data):
+        path = self._path(job_id, suffix)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(temp_path, path)
+
+    def _read(self, job_id, suffix):
+        if not _JOB_ID.match(job_id):
+            return None
+        try:
+            with open(self._path(job_id, suffix)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _update(self, job, **changes):
+        job.update(changes, updated_at=time.time())
+        self._write(job["job_id"], "status", job)
+
+    def submit(self, fn, *args):
+        """
+        Queue ``fn(*args, progress=callback)`` and return the new job ID.
+
+        ``fn`` must return ``(payload, status_code)``. Raises QueueFullError
+        when the queue is full.
+        """
+        with self._lock:
+            if self.pending >= self.capacity:
+                raise QueueFullError("Too many documents are being processed, please retry shortly")
+            self.pending += 1
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job")
+
+        self.prune()
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        job = {
+            "job_id": job_id,
+            "status": "queued",
+            "stage": None,
+            "pages_done": 0,
+            "pages_total": None,
+            "created_at": now,
+            "updated_at": now,
+        }
+        self._write(job_id, "status", job)
+        try:
+            self._executor.submit(self._run, job, fn, args)
+        except Exception:
+            with self._lock:
+                self.pending -= 1
+            raise
+        return job_id
+
+    def _run(self, job, fn, args):
+        def progress(pages_done, pages_total, stage=None):
+            self._update(job, stage=stage, pages_done=pages_done, pages_total=pages_total)
+
+        try:
+            self._update(job, status="running")
+            try:
+                payload, status_code = fn(*args, progress=progress)
+            except Exception as e:
+                logger.exception("Job %s failed", job["job_id"])
+                payload, status_code = {"error": f"Upload failed: {str(e)}"}, 500
+            self._write(job["job_id"], "result", {"payload": payload, "status_code": status_code})
+            self._update(job, status="done" if status_code < 400 else "failed")
+        finally:
+            with self._lock:
+                self.pending -= 1
+
+    def status(self, job_id):
+        """
+        Return the job's status dict, or None for unknown jobs.
+        """
+        return self._read(job_id, "status")
+
+    def result(self, job_id):
+        """
+        Return ``(payload, status_code)`` of a finished job.
+        """
+        result = self._read(job_id, "result")
+        if result is None:
+            return {"error": "Job result not found"}, 404
+        return result["payload"], result["status_code"]
+
+    def prune(self):
+        """
+        Delete job files older than the TTL.
+        """
+        cutoff = time.time() - self.ttl
+        for name in os.listdir(self.folder):
+            path = os.path.join(self.folder, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
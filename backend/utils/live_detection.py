@@ -0,0 +1,108 @@
+"""
+Incremental PII detection over a growing transcript.
+
+A DetectionSession is fed text chunks as they arrive (typed text or the
+output of speech recognition) and returns the PII found in each. Only the
+new chunk plus the last LIVE_OVERLAP_CHARS of the transcript are scanned,
+so the cost of a chunk does not grow with the transcript; the overlap lets a
+value or its contextual keyword span two chunks. Values are reported once,
+keyed by their position in the transcript. A value that reaches the end of
+the transcript so far is held back until the next chunk (or the end of the
+session), since the next chunk may still extend it: "987654" followed by
+"3210" is one phone number, not a pincode.
+"""
+import os
+import re
+
+from utils import metrics
+from utils.pii_detector import PII_MAX_LENGTH, detect_spans, filter_spans_by_level
+
+# Transcript kept for rescanning with the next chunk; must exceed the
+# longest PII value plus its contextual keyword
+LIVE_OVERLAP_CHARS = int(os.getenv("LIVE_OVERLAP_CHARS", str(2 * PII_MAX_LENGTH)))
+# Run SpaCy NER on each chunk (adds a few ms per chunk)
+LIVE_NER = os.getenv("LIVE_NER", "true").lower() == "true"
+
+_WHITESPACE = re.compile(r"\s")
+
+
+class DetectionSession:
+    """
+    Detection state for one live transcript.
+
+    Chunks are concatenated as given, or joined with ``separator`` (e.g. a
+    space between recognised phrases) when neither side has whitespace.
+    """
+
+    def __init__(self, redaction_level="basic", ner=LIVE_NER, overlap=LIVE_OVERLAP_CHARS, separator=""):
+        self.redaction_level = redaction_level
+        self.ner = ner
+        self.overlap = overlap
+        self.separator = separator
+        # Last part of the transcript and its offset in the whole transcript
+        self.tail = ""
+        self.tail_start = 0
+        # (pii_type, start) of every value reported that the tail still holds
+        self.reported = set()
+        # Alerts for values touching the end of the transcript, not sent yet
+        self.pending = []
+
+    def push(self, chunk):
+        """
+        Add a chunk of text and return the PII it completes, as
+        ``[{"type", "value", "start", "end", "source", "score"}]`` with
+        offsets into the whole transcript.
+
+        Values ending where the chunk ends are held back; they are found
+        again with the next chunk, and flush returns them at the end.
+        """
+        if self.tail and self.separator and not (self.tail[-1].isspace() or chunk[:1].isspace()):
+            chunk = self.separator + chunk
+        window = self.tail + chunk
+
+        with metrics.stage("live_detection"):
+            spans = filter_spans_by_level(
+                detect_spans(window, ner=self.ner, redaction_level=self.redaction_level), self.redaction_level
+            )
+        alerts = []
+        self.pending = []
+        for span in sorted(spans, key=lambda span: (span.start, span.end)):
+            key = (span.pii_type, self.tail_start + span.start)
+            if key in self.reported:
+                continue
+            alert = {
+                "type": span.pii_type,
+                "value": window[span.start:span.end],
+                "start": self.tail_start + span.start,
+                "end": self.tail_start + span.end,
+                "source": span.source,
+                "score": span.score,
+            }
+            if span.end == len(window):
+                self.pending.append(alert)
+                continue
+            self.reported.add(key)
+            alerts.append(alert)
+
+        # Keep the overlap for the next chunk, starting on a word boundary,
+        # and never past a value that is held back
+        cut = max(0, len(window) - self.overlap)
+        if cut:
+            match = _WHITESPACE.search(window, cut)
+            cut = match.end() if match else cut
+        if self.pending:
+            cut = min(cut, min(alert["start"] for alert in self.pending) - self.tail_start)
+        self.tail = window[cut:]
+        self.tail_start += cut
+        self.reported = {key for key in self.reported if key[1] >= self.tail_start}
+        return alerts
+
+    def flush(self):
+        """
+        End the transcript and return the alerts held back by the last push.
+        """
+        alerts = self.pending
+        self.pending = []
+        for alert in alerts:
+            self.reported.add((alert["type"], alert["start"]))
+        return alerts
@@ -0,0 +1,218 @@
+"""
+Request and pipeline metrics in the Prometheus text format.
+
+Metrics are kept in the process that records them, so with several gunicorn
+workers each worker reports its own values on /metrics. Page work done in
+the page pool is timed from the request side, around the pool calls; the
+stages timed inside a pool worker (such as each detector) are collected
+there and recorded by the request's process.
+"""
+import contextvars
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+# Add a Server-Timing header with the per-stage breakdown to every response
+METRICS_TIMING_HEADERS = os.getenv("METRICS_TIMING_HEADERS", "false").lower() == "true"
+
+# Latency buckets in seconds, from a fast regex pass to a long PDF
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_registry = []
+# Stage durations of the request being handled on this thread
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+# Stage durations collected for another process instead of being recorded
+_collected_timings = contextvars.ContextVar("collected_timings", default=None)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for name, value in labels
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(labels[name] for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_value(list(zip(self.labelnames, key)), value))
+        return lines
+
+
+class Counter(_Metric):
+    """
+    Monotonically increasing count.
+    """
+
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _render_value(self, labels, value):
+        return [f"{self.name}{_format_labels(labels)} {value}"]
+
+
+class Histogram(_Metric):
+    """
+    Distribution of observed values over fixed buckets.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # Per-bucket counts (last one is +Inf), sum, count
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def _render_value(self, labels, value):
+        counts, total, count = value
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+            cumulative += bucket_count
+            lines.append(f"{self.name}_bucket{_format_labels(labels + [('le', bound)])} {cumulative}")
+        lines.append(f"{self.name}_sum{_format_labels(labels)} {total}")
+        lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+
+REQUESTS = Counter("pii_requests_total", "HTTP requests handled.", ("endpoint", "method", "status"))
+REQUEST_SECONDS = Histogram(
+    "pii_request_duration_seconds", "Time to produce a response (first byte for streams).", ("endpoint",)
+)
+STAGE_SECONDS = Histogram("pii_stage_duration_seconds", "Time spent in each pipeline stage.", ("stage",))
+PAGES = Counter("pii_pages_total", "Pages processed, by where their words came from.", ("source",))
+WORDS = Counter("pii_words_total", "Words read by OCR or from PDF text layers.")
+PII_HITS = Counter("pii_detections_total", "Distinct PII values detected per document at the requested redaction level.", ("pii_type",))
+RESULT_CACHE_LOOKUPS = Counter("pii_result_cache_lookups_total", "Result cache lookups.", ("result",))
+
+
+def render():
+    """
+    Return all metrics in the Prometheus text exposition format.
+    """
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def start_request():
+    """
+    Start collecting stage timings for the request on this thread.
+    """
+    _request_timings.set({})
+
+
+def request_timings():
+    """
+    Return ``{stage: seconds}`` for the current request, or None.
+    """
+    return _request_timings.get()
+
+
+def record_stage(name, seconds):
+    """
+    Record a stage duration for the stage histogram and the current request.
+    """
+    collected = _collected_timings.get()
+    if collected is not None:
+        collected[name] = collected.get(name, 0.0) + seconds
+        return
+    STAGE_SECONDS.observe(seconds, stage=name)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+@contextmanager
+def collect_stages():
+    """
+    Collect the stages timed inside the block into the yielded
+    ``{stage: seconds}`` dict instead of recording them, so that a page pool
+    worker can hand them back to the request's process for record_stage.
+    """
+    collected = {}
+    token = _collected_timings.set(collected)
+    try:
+        yield collected
+    finally:
+        _collected_timings.reset(token)
+
+
+@contextmanager
+def stage(name):
+    """
+    Time a pipeline stage, for the stage histogram and the current request.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+
+def timed_iter(iterable, name):
+    """
+    Yield from ``iterable``, timing each step as stage ``name``.
+    """
+    iterator = iter(iterable)
+    while True:
+        with stage(name):
+            item = next(iterator, StopIteration)
+        if item is StopIteration:
+            return
+        yield item
+
+
+def server_timing(timings, total=None):
+    """
+    Format stage timings as a Server-Timing header value.
+    """
+    entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items()]
+    if total is not None:
+        entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
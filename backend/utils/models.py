@@ -0,0 +1,116 @@
+"""
+Registry of the models and engines the app depends on.
+
+Each model is registered with a loader and loaded on first use, once per
+process. With MODEL_PRELOAD=true they are all loaded at import time instead,
+which combined with gunicorn's preload_app loads them once in the master so
+that workers share them copy-on-write. Disabled models are never loaded.
+"""
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+MODEL_PRELOAD = os.getenv("MODEL_PRELOAD", "false").lower() == "true"
+
+
+class _Entry:
+    def __init__(self, name, loader, enabled, required):
+        self.name = name
+        self.loader = loader
+        self.enabled = enabled
+        self.required = required
+        self.state = "not_loaded" if enabled else "disabled"
+        self.model = None
+        self.error = None
+        self.load_seconds = None
+        self.lock = threading.Lock()
+
+
+class ModelRegistry:
+    """
+    Lazily load named models and report their state.
+    """
+
+    def __init__(self):
+        self._entries = {}
+
+    def register(self, name, loader, enabled=True, required=False):
+        """
+        Register ``loader()``, which returns the model or raises if it cannot
+        be loaded. Required models decide readiness; optional ones only
+        degrade the app when missing.
+        """
+        self._entries[name] = _Entry(name, loader, enabled, required)
+
+    def get(self, name):
+        """
+        Return the model, loading it on first use, or None if it is disabled
+        or failed to load.
+        """
+        entry = self._entries[name]
+        if entry.state == "not_loaded":
+            with entry.lock:
+                if entry.state == "not_loaded":
+                    self._load(entry)
+        return entry.model
+
+    def _load(self, entry):
+        start = time.perf_counter()
+        try:
+            entry.model = entry.loader()
+        except Exception as e:
+            entry.error = str(e)
+            entry.state = "failed"
+            log = logger.error if entry.required else logger.warning
+            log("%s not available: %s", entry.name, e)
+            return
+        entry.load_seconds = round(time.perf_counter() - start, 3)
+        entry.state = "loaded"
+        logger.info("Loaded %s in %.2fs", entry.name, entry.load_seconds)
+
+    def enabled(self, name):
+        """
+        Return True unless the model is disabled (it may still fail to load).
+        """
+        return self._entries[name].enabled
+
+    def available(self, name):
+        return self.get(name) is not None
+
+    def preload(self):
+        """
+        Load every enabled model now.
+        """
+        for name in self._entries:
+            self.get(name)
+
+    def ready(self):
+        """
+        Return True when every required model has loaded (loading them if
+        needed).
+        """
+        return all(
+            self.get(name) is not None
+            for name, entry in self._entries.items()
+            if entry.required and entry.enabled
+        )
+
+    def status(self):
+        """
+        Return the state of every registered model, for /health.
+        """
+        return {
+            name: {
+                "state": entry.state,
+                "required": entry.required,
+                "load_seconds": entry.load_seconds,
+                "error": entry.error,
+            }
+            for name, entry in self._entries.items()
+        }
+
+
+model_registry = ModelRegistry()
@@ -0,0 +1,214 @@
+"""
+Minimal streaming PDF writer for redacted page images.
+
+Pages are encoded straight from memory (JPEG, CCITT Group 4 or Flate) and
+written to the output as soon as they are added, so a PDF can be sent to
+the client while later pages are still being processed. Only sequential
+``write`` calls are made on the output, so non-seekable sinks work too.
+"""
+import io
+import logging
+import os
+import queue
+import time
+import zlib
+
+logger = logging.getLogger(__name__)
+
+# "jpeg", "flate" (lossless) or "ccitt" (1-bit, smallest for scanned text)
+PDF_IMAGE_FORMAT = os.getenv("PDF_IMAGE_FORMAT", "jpeg").lower()
+PDF_JPEG_QUALITY = int(os.getenv("PDF_JPEG_QUALITY", "85"))
+# Written chunks buffered for a streamed response before the writer waits
+PDF_STREAM_BUFFER_CHUNKS = int(os.getenv("PDF_STREAM_BUFFER_CHUNKS", "64"))
+# Seconds a write may wait for the client to read before the stream is given up
+PDF_STREAM_WRITE_TIMEOUT = float(os.getenv("PDF_STREAM_WRITE_TIMEOUT", "300"))
+
+# A4 in points, with the page image 10mm from the top-left corner and 190mm
+# wide, as in the original FPDF layout
+MM = 72 / 25.4
+PAGE_WIDTH = 210 * MM
+PAGE_HEIGHT = 297 * MM
+IMAGE_MARGIN = 10 * MM
+IMAGE_WIDTH = 190 * MM
+
+
+def _encode_jpeg(image, quality):
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality)
+    color_space = "/DeviceRGB" if image.mode == "RGB" else "/DeviceGray"
+    return buffer.getvalue(), f"/Filter /DCTDecode /ColorSpace {color_space} /BitsPerComponent 8"
+
+
+def _encode_flate(image):
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    color_space = "/DeviceRGB" if image.mode == "RGB" else "/DeviceGray"
+    return zlib.compress(image.tobytes(), 6), f"/Filter /FlateDecode /ColorSpace {color_space} /BitsPerComponent 8"
+
+
+def _encode_ccitt(image):
+    from PIL import Image
+
+    image = image.convert("1")
+    buffer = io.BytesIO()
+    # A single strip so that the TIFF payload is exactly one CCITT stream
+    image.save(buffer, format="TIFF", compression="group4", tiffinfo={278: image.height})
+    tiff = Image.open(buffer)
+    offsets, byte_counts = tiff.tag_v2[273], tiff.tag_v2[279]
+    # Pillow writes BlackIsZero (PhotometricInterpretation 1) bilevel TIFFs,
+    # whose fax runs PDF readers only render the right way round with BlackIs1
+    black_is_1 = "true" if tiff.tag_v2.get(262, 1) == 1 else "false"
+    data = buffer.getvalue()[offsets[0]:offsets[0] + byte_counts[0]]
+    params = f"<< /K -1 /Columns {image.width} /Rows {image.height} /BlackIs1 {black_is_1} >>"
+    return data, f"/Filter /CCITTFaxDecode /DecodeParms {params} /ColorSpace /DeviceGray /BitsPerComponent 1"
+
+
+class PDFWriter:
+    """
+    Write one image per page to ``output`` as the pages arrive.
+    """
+
+    def __init__(self, output, image_format=PDF_IMAGE_FORMAT, quality=PDF_JPEG_QUALITY):
+        self.output = output
+        self.image_format = image_format
+        self.quality = quality
+        self.position = 0
+        self.offsets = {}
+        self.page_ids = []
+        # Objects 1 and 2 (catalog and page tree) are written last
+        self.next_id = 3
+        self._write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def _write(self, data):
+        self.output.write(data)
+        self.position += len(data)
+
+    def _write_object(self, object_id, body, stream=None):
+        self.offsets[object_id] = self.position
+        self._write(f"{object_id} 0 obj\n".encode())
+        if stream is None:
+            self._write(body.encode() + b"\nendobj\n")
+        else:
+            self._write(body.encode() + b"\nstream\n")
+            self._write(stream)
+            self._write(b"\nendstream\nendobj\n")
+
+    def _encode(self, image):
+        if self.image_format == "ccitt":
+            try:
+                return _encode_ccitt(image)
+            except Exception as e:
+                # Pillow built without libtiff
+                logger.warning("CCITT encoding unavailable, using Flate: %s", e)
+                self.image_format = "flate"
+        if self.image_format == "flate":
+            return _encode_flate(image)
+        return _encode_jpeg(image, self.quality)
+
+    def add_page(self, image):
+        """
+        Encode a PIL image and write it out as the next page.
+        """
+        data, image_params = self._encode(image)
+        image_id, content_id, page_id = self.next_id, self.next_id + 1, self.next_id + 2
+        self.next_id += 3
+
+        self._write_object(
+            image_id,
+            f"<< /Type /XObject /Subtype /Image /Width {image.width} /Height {image.height} "
+            f"{image_params} /Length {len(data)} >>",
+            data,
+        )
+        height = IMAGE_WIDTH * image.height / image.width
+        content = (
+            f"q {IMAGE_WIDTH:.2f} 0 0 {height:.2f} {IMAGE_MARGIN:.2f} "
+            f"{PAGE_HEIGHT - IMAGE_MARGIN - height:.2f} cm /Im0 Do Q"
+        ).encode()
+        self._write_object(content_id, f"<< /Length {len(content)} >>", content)
+        self._write_object(
+            page_id,
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH:.2f} {PAGE_HEIGHT:.2f}] "
+            f"/Resources << /XObject << /Im0 {image_id} 0 R >> >> /Contents {content_id} 0 R >>",
+        )
+        self.page_ids.append(page_id)
+
+    def close(self):
+        """
+        Write the page tree, catalog and cross-reference table.
+        """
+        kids = " ".join(f"{page_id} 0 R" for page_id in self.page_ids)
+        self._write_object(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(self.page_ids)} >>")
+        self._write_object(1, "<< /Type /Catalog /Pages 2 0 R >>")
+
+        xref_position = self.position
+        lines = [f"xref\n0 {self.next_id}\n", "0000000000 65535 f \n"]
+        lines.extend(f"{self.offsets[object_id]:010d} 00000 n \n" for object_id in range(1, self.next_id))
+        lines.append(f"trailer\n<< /Size {self.next_id} /Root 1 0 R >>\nstartxref\n{xref_position}\n%%EOF\n")
+        self._write("".join(lines).encode())
+
+
+class ChunkStream:
+    """
+    File-like sink that hands written chunks to a consumer on another thread,
+    for streaming a PDF (or ZIP) to the client while it is being written.
+
+    The producer calls ``write`` and finally ``close``; the consumer iterates
+    over the stream and calls ``cancel`` when it stops, whether or not it
+    started reading (use it as the response's close hook). After that, or
+    when the consumer has not taken a chunk for ``write_timeout`` seconds,
+    ``write`` raises BrokenPipeError so the producer does not block forever.
+    """
+
+    _END = object()
+
+    def __init__(self, max_chunks=PDF_STREAM_BUFFER_CHUNKS, write_timeout=PDF_STREAM_WRITE_TIMEOUT):
+        self._chunks = queue.Queue(max_chunks)
+        self._cancelled = False
+        self.write_timeout = write_timeout
+
+    def _put(self, item):
+        deadline = time.monotonic() + self.write_timeout
+        while not self._cancelled:
+            try:
+                self._chunks.put(item, timeout=max(0, min(1, deadline - time.monotonic())))
+                return
+            except queue.Full:
+                if time.monotonic() >= deadline:
+                    self._cancelled = True
+                    raise BrokenPipeError("Client did not read the stream in time")
+        raise BrokenPipeError("Client stopped reading the stream")
+
+    def write(self, data):
+        self._put(data)
+        return len(data)
+
+    def flush(self):
+        # Chunks are handed over as they are written
+        pass
+
+    def close(self):
+        """
+        End the stream (producer side).
+        """
+        try:
+            self._put(self._END)
+        except BrokenPipeError:
+            pass
+
+    def cancel(self):
+        """
+        Stop the producer (consumer side).
+        """
+        self._cancelled = True
+
+    def __iter__(self):
+        try:
+            while True:
+                chunk = self._chunks.get()
+                if chunk is self._END:
+                    return
+                yield chunk
+        finally:
+            self._cancelled = True
@@ -1,14 +1,40 @@
+import logging
+import os
 import re
 
-# Load SpaCy's English language model (optional)
-try:
+from utils import metrics
+from utils.models import model_registry
+
+# Only the NER component is used; the rest of the pipeline is never loaded
+SPACY_EXCLUDE = [
+    name for name in os.getenv(
+        "SPACY_EXCLUDE", "tagger,parser,attribute_ruler,lemmatizer,senter"
+    ).split(",") if name
+]
+# nlp.pipe settings for batched NER
+SPACY_BATCH_SIZE = int(os.getenv("SPACY_BATCH_SIZE", "32"))
+SPACY_N_PROCESS = int(os.getenv("SPACY_N_PROCESS", "1"))
+
+logger = logging.getLogger(__name__)
+
+# SpaCy's English model is optional and loaded on first use
+SPACY_ENABLED = os.getenv("SPACY_ENABLED", "true").lower() == "true"
+
+
+def _load_spacy():
     import spacy
-    nlp = spacy.load("en_core_web_sm")
-    SPACY_AVAILABLE = True
-except Exception as e:
-    print(f"⚠️ spaCy not available: {e}")
-    nlp = None
-    SPACY_AVAILABLE = False
+
+    return spacy.load("en_core_web_sm", exclude=SPACY_EXCLUDE)
+
+
+model_registry.register("spacy", _load_spacy, enabled=SPACY_ENABLED)
+
+
+def spacy_available():
+    """
+    Return True if the SpaCy model is loaded (loading it on first call).
+    """
+    return model_registry.available("spacy")
 
 # Define regex patterns for PII detection
 PII_PATTERNS = {
@@ -35,6 +61,12 @@ PII_PATTERNS = {
     "dob": r"\b\d{2}[-/]\d{2}[-/]\d{4}\b",  # Date of Birth (DD-MM-YYYY or similar)
 }
 
+# Every pattern above matches a digit or an "@" (the anchor characters, as a
+# regex character class body); text further than PII_MAX_LENGTH characters
+# from one cannot hold PII and is not scanned
+PII_ANCHOR_CHARS = r"\d@"
+PII_MAX_LENGTH = 128
+
 # Contextual keywords for each PII type
 CONTEXTUAL_KEYWORDS = {
     "aadhaar": ["aadhaar", "uid", "unique identification"],
@@ -85,51 +117,515 @@ PII_LEVEL_MAPPING = {
     'tin': 'critical',
     'vehicle_registration': 'critical',
 }
+
+
+LEVELS_ORDER = ["basic", "intermediate", "critical"]
+
+# Score reported for spaCy entities; regex and contextual hits score 1.0
+SPACY_SCORE = 0.85
+
+# PERSON = Name, DATE = Date, GPE = Location. DATE is a basic-level type, so
+# spaCy runs at every level unless it is left out here
+NER_LABELS = tuple(
+    label.strip().upper()
+    for label in os.getenv("NER_LABELS", "PERSON,DATE,GPE").split(",")
+    if label.strip()
+)
+
+
+class PIISpan:
+    """
+    A detected PII value located by its character offsets in the page text.
+    """
+
+    __slots__ = ("pii_type", "start", "end", "page", "source", "score")
+
+    def __init__(self, pii_type, start, end, page=0, source="regex", score=1.0):
+        self.pii_type = pii_type
+        self.start = start
+        self.end = end
+        self.page = page
+        self.source = source
+        self.score = score
+
+    def shifted(self, offset):
+        """
+        Return a copy of the span moved by ``offset`` characters.
+        """
+        return PIISpan(
+            self.pii_type, self.start + offset, self.end + offset, self.page, self.source, self.score
+        )
+
+    def __repr__(self):
+        return f"PIISpan({self.pii_type!r}, {self.start}, {self.end}, page={self.page}, source={self.source!r})"
+
+
+def _keyword_trie_pattern(keywords):
+    """
+    Build a regex alternation of the keywords factored into a prefix trie.
+    """
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+
+class PIIDetector:
+    """
+    Regex and contextual PII detector with every pattern compiled once.
+
+    Each distinct pattern is scanned once (credit and debit cards share a
+    scan). Contextual keywords are found in a single pass with a trie-shaped
+    prefilter, and a type's contextual pattern is only tried right after one
+    of its keyword hits instead of rescanning the text per keyword. Only the
+    regions around the ``anchor_chars`` are scanned at all (None scans the
+    whole text).
+    """
+
+    def __init__(self, patterns=PII_PATTERNS, keywords=CONTEXTUAL_KEYWORDS, anchor_chars=PII_ANCHOR_CHARS, max_length=PII_MAX_LENGTH):
+        # pattern -> (compiled pattern, PII types using it)
+        self.pattern_groups = {}
+        for pii_type, pattern in patterns.items():
+            if pattern not in self.pattern_groups:
+                self.pattern_groups[pattern] = (re.compile(pattern), [])
+            self.pattern_groups[pattern][1].append(pii_type)
+        self.pii_types = list(patterns)
+
+        # "<keyword>[:\s]*(<pattern>)" with the keyword matched separately
+        self.context_patterns = {
+            pii_type: re.compile(rf"[:\s]*({patterns[pii_type]})", re.IGNORECASE)
+            for pii_type in keywords
+        }
+
+        # keyword (lowercase) -> PII types it introduces
+        self.keyword_types = {}
+        for pii_type, type_keywords in keywords.items():
+            for keyword in type_keywords:
+                self.keyword_types.setdefault(keyword.lower(), []).append(pii_type)
+        self.keywords_by_initial = {}
+        for keyword in sorted(self.keyword_types, key=len, reverse=True):
+            self.keywords_by_initial.setdefault(keyword[0], []).append(keyword)
+
+        # Zero-width so that every keyword start is reported, even overlapping ones
+        trie_pattern = f"(?={_keyword_trie_pattern(self.keyword_types)})"
+        self.keyword_prefilter = re.compile(trie_pattern)
+        # Fallback for text whose lowercase form changes length
+        self.keyword_prefilter_ignorecase = re.compile(trie_pattern, re.IGNORECASE)
+
+        # Runs of anchors close enough for their regions to overlap
+        self.anchor_clusters = None
+        if anchor_chars is not None:
+            self.anchor_clusters = re.compile(
+                rf"[{anchor_chars}](?:[^{anchor_chars}]{{0,{2 * max_length}}}[{anchor_chars}])*"
+            )
+        self.max_length = max_length
+        # Rest of the token, the whitespace after it and the next token
+        self.next_token = re.compile(r"\S*\s+\S*")
+
+    def candidate_regions(self, text):
+        """
+        Yield ``(start, end)`` of the parts of the text that can hold PII.
+
+        Regions start on whitespace and end after the token following them,
+        so word boundaries and lookarounds see the same neighbours as in the
+        full text.
+        """
+        if self.anchor_clusters is None:
+            yield 0, len(text)
+            return
+        region_start = region_end = None
+        for cluster in self.anchor_clusters.finditer(text):
+            start = cluster.start() - self.max_length
+            if start > 0:
+                space = max(text.rfind(" ", 0, start), 0)
+                start = max(space, text.rfind("\n", space, start), text.rfind("\t", space, start))
+            else:
+                start = 0
+            end = cluster.end() + self.max_length
+            token = self.next_token.match(text, end) if end < len(text) else None
+            end = token.end() if token else len(text)
+            if region_end is not None and start <= region_end:
+                region_end = max(region_end, end)
+                continue
+            if region_end is not None:
+                yield region_start, region_end
+            region_start, region_end = start, end
+        if region_end is not None:
+            yield region_start, region_end
+
+    def detect_contextual(self, text, page=0, pii_types=None):
+        """
+        Detect PII introduced by a contextual keyword, grouped by type.
+
+        Returns ``{type: [PIISpan]}``, for ``pii_types`` only if given.
+        """
+        detected_spans = {}
+        lowered = text.lower()
+        if len(lowered) == len(text):
+            hits = self.keyword_prefilter.finditer(lowered)
+        else:
+            lowered = None
+            hits = self.keyword_prefilter_ignorecase.finditer(text)
+
+        for hit in hits:
+            pos = hit.start()
+            for keyword in self.keywords_by_initial.get(text[pos].lower(), ()):
+                if lowered is not None:
+                    if not lowered.startswith(keyword, pos):
+                        continue
+                elif text[pos:pos + len(keyword)].lower() != keyword:
+                    continue
+                for pii_type in self.keyword_types[keyword]:
+                    if pii_types is not None and pii_type not in pii_types:
+                        continue
+                    match = self.context_patterns[pii_type].match(text, pos + len(keyword))
+                    if match:
+                        detected_spans.setdefault(pii_type, []).append(
+                            PIISpan(pii_type, match.start(1), match.end(1), page, "context")
+                        )
+        return detected_spans
+
+    def detect_spans(self, text, page=0, pii_types=None, regex=True, contextual=True):
+        """
+        Detect regex and contextual PII as a list of PIISpan.
+
+        ``pii_types`` limits detection to those types: patterns used by no
+        other type are not scanned at all.
+        """
+        wanted = set(self.pii_types if pii_types is None else pii_types)
+        pattern_groups = []
+        if regex:
+            for pattern, group_types in self.pattern_groups.values():
+                group_types = [pii_type for pii_type in group_types if pii_type in wanted]
+                if group_types:
+                    pattern_groups.append((pattern, group_types))
+        contextual = contextual and any(pii_type in self.context_patterns for pii_type in wanted)
+        if not pattern_groups and not contextual:
+            return []
+
+        regex_spans = {pii_type: [] for pii_type in self.pii_types}
+        contextual_spans = {}
+        for region_start, region_end in self.candidate_regions(text):
+            region = text if region_end - region_start == len(text) else text[region_start:region_end]
+            for pattern, group_types in pattern_groups:
+                matches = [m.span() for m in pattern.finditer(region)]
+                for pii_type in group_types:
+                    regex_spans[pii_type].extend(
+                        PIISpan(pii_type, region_start + start, region_start + end, page, "regex")
+                        for start, end in matches
+                    )
+            if not contextual:
+                continue
+            for pii_type, spans in self.detect_contextual(region, page, wanted).items():
+                contextual_spans.setdefault(pii_type, []).extend(
+                    span.shifted(region_start) if region_start else span for span in spans
+                )
+
+        spans = []
+        for pii_type in self.pii_types:
+            spans.extend(regex_spans[pii_type])
+            spans.extend(contextual_spans.get(pii_type, ()))
+        return spans
+
+    def detect(self, text):
+        """
+        Detect regex and contextual PII, returning ``{type: [values]}``.
+        """
+        return spans_to_dict(text, self.detect_spans(text))
+
+
+# Shared detector, compiled once at import time
+pii_detector = PIIDetector()
+
+
 def detect_with_context(text, pii_type):
     """
     Detect PII using contextual keywords.
     """
-    detected_pii = []
-    for keyword in CONTEXTUAL_KEYWORDS[pii_type]:
-        # Look for the keyword followed by the PII pattern
-        pattern = rf"{keyword}[:\s]*({PII_PATTERNS[pii_type]})"
-        matches = re.findall(pattern, text, re.IGNORECASE)
-        if matches:
-            detected_pii.extend(matches)
-    return detected_pii
+    spans = pii_detector.detect_contextual(text).get(pii_type, [])
+    return [text[span.start:span.end] for span in spans]
+
+
+def _detect_regex(texts, pages, pii_types, **options):
+    return [pii_detector.detect_spans(text, page, pii_types, contextual=False) for text, page in zip(texts, pages)]
+
+
+def _detect_contextual(texts, pages, pii_types, **options):
+    return [pii_detector.detect_spans(text, page, pii_types, regex=False) for text, page in zip(texts, pages)]
+
+
+def _detect_spacy(texts, pages, pii_types, batch_size=SPACY_BATCH_SIZE, n_process=SPACY_N_PROCESS):
+    entity_spans = [[] for _ in texts]
+    nlp = model_registry.get("spacy")
+    if nlp is None:
+        return entity_spans
+
+    try:
+        docs = nlp.pipe(texts, batch_size=batch_size, n_process=n_process)
+        for spans, page, doc in zip(entity_spans, pages, docs):
+            for ent in doc.ents:
+                if ent.label_ in pii_types:
+                    spans.append(
+                        PIISpan(ent.label_, ent.start_char, ent.end_char, page, "spacy", SPACY_SCORE)
+                    )
+    except Exception as e:
+        logger.warning("Error using spaCy: %s", e)
+    return entity_spans
+
+
+# Presidio is optional and off by default: the detectors above cover the same
+# entities, and its AnalyzerEngine costs seconds of startup and a large share
+# of each worker's memory
+PRESIDIO_ENABLED = os.getenv("PRESIDIO_ENABLED", "false").lower() == "true"
+PRESIDIO_SCORE_THRESHOLD = float(os.getenv("PRESIDIO_SCORE_THRESHOLD", "0.5"))
+
+# Presidio entity -> PII type
+PRESIDIO_ENTITIES = {
+    "PERSON": "PERSON",
+    "LOCATION": "GPE",
+    "DATE_TIME": "DATE",
+    "EMAIL_ADDRESS": "email",
+    "PHONE_NUMBER": "phone",
+    "CREDIT_CARD": "credit_card",
+    "IN_AADHAAR": "aadhaar",
+    "IN_PAN": "pan",
+    "IN_PASSPORT": "passport",
+    "IN_VOTER": "voter_id",
+    "IN_VEHICLE_REGISTRATION": "vehicle_registration",
+}
+
+
+def _load_presidio():
+    from presidio_analyzer import AnalyzerEngine
+
+    return AnalyzerEngine()
+
+
+model_registry.register("presidio", _load_presidio, enabled=PRESIDIO_ENABLED)
+
+
+def _detect_presidio(texts, pages, pii_types, **options):
+    entity_spans = [[] for _ in texts]
+    analyzer = model_registry.get("presidio")
+    if analyzer is None:
+        return entity_spans
+
+    entities = [entity for entity, pii_type in PRESIDIO_ENTITIES.items() if pii_type in pii_types]
+    try:
+        for spans, text, page in zip(entity_spans, texts, pages):
+            for result in analyzer.analyze(
+                text=text, language="en", entities=entities, score_threshold=PRESIDIO_SCORE_THRESHOLD
+            ):
+                spans.append(PIISpan(
+                    PRESIDIO_ENTITIES[result.entity_type], result.start, result.end, page, "presidio", result.score
+                ))
+    except Exception as e:
+        logger.warning("Error using Presidio: %s", e)
+    return entity_spans
+
+
+def _allowed_levels(redaction_level):
+    return LEVELS_ORDER[: LEVELS_ORDER.index(redaction_level) + 1]
+
+
+class Detector:
+    """
+    A PII detection method with the PII types it finds and its relative cost.
+
+    ``detect(texts, pages, pii_types, **options)`` returns one list of
+    PIISpan per text, restricted to ``pii_types``. Model-based detectors
+    (``ner=True``) are run over many texts at once and are skipped when NER
+    is turned off or their ``model`` is disabled in the model registry.
+    """
+
+    def __init__(self, name, detect, pii_types, cost, ner=False, model=None):
+        self.name = name
+        self.detect = detect
+        self.pii_types = tuple(pii_types)
+        self.cost = cost
+        self.ner = ner
+        self.model = model
+
+    @property
+    def levels(self):
+        """
+        The redaction levels that need this detector.
+        """
+        return [
+            level for level in LEVELS_ORDER
+            if any(PII_LEVEL_MAPPING.get(pii_type, "basic") == level for pii_type in self.pii_types)
+        ]
+
+
+class DetectorRegistry:
+    """
+    Run the registered detectors needed for a redaction level, cheapest
+    first, timing each one as the ``detector_<name>`` stage.
+    """
+
+    def __init__(self):
+        self._detectors = {}
+
+    def register(self, detector):
+        self._detectors[detector.name] = detector
+
+    def plan(self, redaction_level=None, ner=True, rules=True):
+        """
+        Return ``[(detector, pii_types)]`` for the detectors a redaction
+        level needs (every detector if it is None), cheapest first.
+
+        ``ner`` and ``rules`` select model-based and rule-based detectors.
+        """
+        allowed_levels = LEVELS_ORDER if redaction_level is None else _allowed_levels(redaction_level)
+        plan = []
+        for detector in sorted(self._detectors.values(), key=lambda detector: detector.cost):
+            if not (ner if detector.ner else rules):
+                continue
+            if detector.model is not None and not model_registry.enabled(detector.model):
+                continue
+            pii_types = [
+                pii_type for pii_type in detector.pii_types
+                if PII_LEVEL_MAPPING.get(pii_type, "basic") in allowed_levels
+            ]
+            if pii_types:
+                plan.append((detector, pii_types))
+        return plan
+
+    def detect(self, texts, pages=None, redaction_level=None, ner=True, rules=True, **options):
+        """
+        Detect PII in many texts, returning one list of PIISpan per text.
+        """
+        texts = list(texts)
+        pages = list(pages) if pages is not None else list(range(len(texts)))
+        results = [[] for _ in texts]
+        if not texts:
+            return results
+        for detector, pii_types in self.plan(redaction_level, ner, rules):
+            with metrics.stage(f"detector_{detector.name}"):
+                for spans, found in zip(results, detector.detect(texts, pages, pii_types, **options)):
+                    spans.extend(found)
+        return results
+
+    def fingerprint(self):
+        """
+        Return the detectors and their PII types, for engine_fingerprint.
+        """
+        return sorted(
+            (detector.name, detector.pii_types)
+            for detector in self._detectors.values()
+            if detector.model is None or model_registry.enabled(detector.model)
+        )
+
+
+detector_registry = DetectorRegistry()
+detector_registry.register(Detector("regex", _detect_regex, PII_PATTERNS, cost=1))
+detector_registry.register(Detector("contextual", _detect_contextual, CONTEXTUAL_KEYWORDS, cost=2))
+detector_registry.register(Detector("spacy", _detect_spacy, NER_LABELS, cost=100, ner=True, model="spacy"))
+detector_registry.register(
+    Detector("presidio", _detect_presidio, dict.fromkeys(PRESIDIO_ENTITIES.values()), cost=1000, ner=True, model="presidio")
+)
+
+
+def detect_entity_spans(texts, pages=None, batch_size=SPACY_BATCH_SIZE, n_process=SPACY_N_PROCESS, redaction_level=None):
+    """
+    Run the model-based detectors (SpaCy NER with nlp.pipe, and Presidio if
+    enabled) over many texts at once.
+
+    Returns one list of PIISpan per text (empty lists if no model is
+    available or the redaction level needs none).
+    """
+    return detector_registry.detect(
+        texts, pages, redaction_level, rules=False, batch_size=batch_size, n_process=n_process
+    )
+
+
+def detect_spans(text, page=0, ner=True, redaction_level=None):
+    """
+    Detect PII in the given text as PIISpan objects using regex, contextual
+    rules, and SpaCy (unless ``ner`` is False).
+
+    Only the detectors needed for ``redaction_level`` run (all of them if it
+    is None).
+    """
+    return detector_registry.detect([text], [page], redaction_level, ner)[0]
+
+
+def detect_spans_batch(texts, pages=None, batch_size=SPACY_BATCH_SIZE, n_process=SPACY_N_PROCESS,
+                       redaction_level=None, ner=True):
+    """
+    Detect PII in many texts (pages of a document, or texts from several
+    requests), running SpaCy over all of them in batches.
+    """
+    return detector_registry.detect(
+        texts, pages, redaction_level, ner, batch_size=batch_size, n_process=n_process
+    )
+
+
+def spans_to_dict(text, spans):
+    """
+    Collapse spans into the ``{type: [values]}`` form, de-duplicating values.
+    """
+    detected_pii = {}
+    for span in spans:
+        detected_pii.setdefault(span.pii_type, {})[text[span.start:span.end]] = None
+    return {pii_type: list(values) for pii_type, values in detected_pii.items()}
+
+
+def filter_spans_by_level(spans, redaction_level):
+    """
+    Keep only the spans whose PII type is covered by the redaction level.
+    """
+    allowed_levels = _allowed_levels(redaction_level)
+    return [
+        span for span in spans
+        if PII_LEVEL_MAPPING.get(span.pii_type, "basic") in allowed_levels
+    ]
+
+
+def redact_spans(text, spans, replacement="[REDACTED]"):
+    """
+    Replace every span in the text in a single linear pass.
+
+    Overlapping spans are merged into one replacement.
+    """
+    pieces = []
+    position = 0
+    for start, end in sorted((span.start, span.end) for span in spans):
+        if start < position:
+            # Overlaps the previous replacement: extend it if needed
+            position = max(position, end)
+            continue
+        pieces.append(text[position:start])
+        pieces.append(replacement)
+        position = end
+    pieces.append(text[position:])
+    return "".join(pieces)
 
 
 def detect_pii(text):
     """
     Detect PII in the given text using regex, contextual rules, and SpaCy.
     """
-    detected_pii = {}
+    return spans_to_dict(text, detect_spans(text))
 
-    # Detect PII using regex and contextual rules
-    for pii_type in PII_PATTERNS:
-        # Detect using regex
-        regex_matches = re.findall(PII_PATTERNS[pii_type], text)
-        # Detect using contextual rules
-        contextual_matches = detect_with_context(text, pii_type)
-        # Combine results
-        matches = list(set(regex_matches + contextual_matches))  # Remove duplicates
-        if matches:
-            detected_pii[pii_type] = matches
-
-    # Detect PII using SpaCy (if available)
-    if SPACY_AVAILABLE and nlp:
-        try:
-            doc = nlp(text)
-            for ent in doc.ents:
-                if ent.label_ in [
-                    "PERSON",
-                    "DATE",
-                    "GPE",
-                ]:  # PERSON = Name, DATE = Date, GPE = Location
-                    if ent.label_ not in detected_pii:
-                        detected_pii[ent.label_] = []
-                    detected_pii[ent.label_].append(ent.text)
-        except Exception as e:
-            print(f"⚠️ Error using spaCy: {e}")
-
-    return detected_pii
\ No newline at end of file
+
+def detect_pii_batch(texts, batch_size=SPACY_BATCH_SIZE, n_process=SPACY_N_PROCESS):
+    """
+    Batched detect_pii: one ``{type: [values]}`` dict per text.
+    """
+    texts = list(texts)
+    return [
+        spans_to_dict(text, spans)
+        for text, spans in zip(texts, detect_spans_batch(texts, batch_size=batch_size, n_process=n_process))
+    ]
@@ -0,0 +1,715 @@
+"""
+Page-level processing pipeline for uploaded documents.
+
+The stage functions live here rather than in app.py so that page worker
+processes can import them without re-running the app's startup checks.
+"""
+import logging
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+
+from ocr import run_ocr, run_ocr_regions
+from utils.pii_detector import (
+    PIISpan,
+    detect_entity_spans,
+    detect_spans,
+    detect_spans_batch,
+    filter_spans_by_level,
+    redact_spans,
+    spans_to_dict,
+)
+from utils.metrics import PAGES, WORDS, collect_stages, record_stage, stage, timed_iter
+from utils.pdf_writer import PDFWriter
+from utils.preprocessing import boxes_to_original, find_text_regions, preprocess
+from utils.redaction import redact_image, redaction_boxes, render_fingerprint
+from utils.text_layer import open_text_layer, page_ocr_result
+
+# Number of worker processes used to process PDF pages in parallel.
+# 1 (or 0) keeps everything on the request thread.
+PAGE_WORKERS = int(os.getenv("PAGE_WORKERS", str(os.cpu_count() or 1)))
+# Fewer pages than this run on the calling thread rather than paying for the
+# pool round trip; the ASGI mode sets 1 to keep OCR off its few view threads
+PAGE_POOL_MIN_PAGES = max(1, int(os.getenv("PAGE_POOL_MIN_PAGES", "2")))
+# Page workers are never forked straight from a request process: gunicorn's
+# gthread workers and the ASGI view threads may hold a lock at fork time,
+# which would stay locked forever in the child. A forkserver starts them
+# from a clean single-threaded process (spawn where it is unavailable).
+PAGE_POOL_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+# Resolution PDF pages are rasterized at (pdf2image's default is 200)
+PDF_DPI = int(os.getenv("PDF_DPI", "200"))
+
+# PDFs are rasterized and processed at most PDF_MAX_INFLIGHT_PAGES pages at a
+# time, so memory stays bounded by the window size. By default this takes two
+# passes: every window is read and searched for PII first, keeping only the
+# OCR results, then rasterized again and masked with the PII of the whole
+# document. Streaming mode masks and writes each window in a single pass, so
+# /redact/pdf sends pages early and nothing is rasterized twice, but each
+# window is masked with the PII found so far only: a value first seen on a
+# later page stays visible on the pages already written.
+PDF_STREAMING = os.getenv("PDF_STREAMING", "false").lower() == "true"
+PDF_MAX_INFLIGHT_PAGES = max(1, int(os.getenv("PDF_MAX_INFLIGHT_PAGES", str(max(PAGE_WORKERS, 1)))))
+
+# Approximate cache footprint of one OCR word (box, offsets, line) and of
+# one detected span, beside the text itself
+OCR_WORD_BYTES = 48
+PII_SPAN_BYTES = 32
+
+logger = logging.getLogger(__name__)
+
+_page_pool = None
+_page_pool_lock = threading.Lock()
+
+
+class OCRError(RuntimeError):
+    """Raised when Tesseract fails on a page."""
+
+
+def ocr_page(image):
+    """
+    Preprocess and OCR a page image.
+
+    Sparse pages are OCRed only in their detected text regions. The returned
+    OCRResult's boxes are in the coordinates of ``image``, so the same result
+    drives both detection and masking.
+    """
+    processed_image, matrix = preprocess(image)
+    regions = find_text_regions(processed_image)
+    if regions is None:
+        ocr_result = run_ocr(processed_image)
+    else:
+        ocr_result = run_ocr_regions(processed_image, regions)
+    ocr_result.boxes = boxes_to_original(ocr_result.boxes, matrix, image.size)
+    return ocr_result
+
+
+# Punctuation OCR tends to glue to the front or back of a value ("Ph:98765...")
+_WORD_EDGE_CHARS = ".,;:()[]{}<>\"'"
+_WORD_SPLIT = re.compile(r"[:=,;()\[\]{}<>\"']+")
+
+
+def _word_keys(word):
+    """
+    Return the normalized lookup keys for one OCR word.
+    """
+    stripped = word.strip(_WORD_EDGE_CHARS)
+    keys = {stripped}
+    keys.update(part for part in _WORD_SPLIT.split(stripped) if part)
+    return keys
+
+
+def build_value_index(detected_pii):
+    """
+    Index detected PII values by their first whitespace-separated token.
+
+    Returns ``{first_token: [token tuples]}`` with longer values first, so a
+    multi-token value such as ``1234 5678 9012`` is matched as one word group.
+    """
+    index = {}
+    for values in detected_pii.values():
+        for value in values:
+            tokens = tuple(value.split())
+            if tokens:
+                index.setdefault(tokens[0], set()).add(tokens)
+    return {
+        first_token: sorted(sequences, key=len, reverse=True)
+        for first_token, sequences in index.items()
+    }
+
+
+def match_value_index(ocr_result, index):
+    """
+    Return the indices of the OCR words that make up an indexed PII value.
+    """
+    word_indices = set()
+    if not index:
+        return word_indices
+
+    stripped_words = [word.strip(_WORD_EDGE_CHARS) for word in ocr_result.words]
+    for i, word in enumerate(ocr_result.words):
+        for key in _word_keys(word):
+            for tokens in index.get(key, ()):
+                if len(tokens) == 1:
+                    word_indices.add(i)
+                    break
+                end = i + len(tokens)
+                if tuple(stripped_words[i + 1:end]) == tokens[1:]:
+                    word_indices.update(range(i, end))
+                    break
+    return word_indices
+
+
+def level_value_index(detected_pii, redaction_level):
+    """
+    Build the value index of the ``detected_pii`` types covered by the
+    redaction level.
+    """
+    from utils.pii_detector import LEVELS_ORDER, PII_LEVEL_MAPPING
+
+    allowed_levels = LEVELS_ORDER[: LEVELS_ORDER.index(redaction_level) + 1]
+    return build_value_index({
+        pii_type: values
+        for pii_type, values in detected_pii.items()
+        if PII_LEVEL_MAPPING.get(pii_type, "basic") in allowed_levels
+    })
+
+
+def page_redactions(ocr_result, detected_pii, redaction_level, spans=(), size=None):
+    """
+    Return the redaction boxes of a page as an (N, 4) array of padded
+    ``[x0, y0, x1, y1]`` pixel corners.
+
+    Values are matched through a token index built once per call; ``spans``
+    from the page's OCR text are mapped to words directly.
+    """
+    word_indices = match_value_index(ocr_result, level_value_index(detected_pii, redaction_level))
+    for span in spans:
+        word_indices.update(ocr_result.word_indices(span.start, span.end))
+    return redaction_boxes([ocr_result.boxes[i] for i in sorted(word_indices)], size)
+
+
+def mask_image(image, detected_pii, redaction_level, ocr_result=None, spans=()):
+    """
+    Mask sensitive information in the image based on the selected redaction level.
+
+    ``ocr_result`` is the page's OCRResult from text extraction; the image is
+    only OCR'd again when it is not supplied.
+    """
+    if ocr_result is None:
+        try:
+            ocr_result = ocr_page(image)
+        except Exception as e:
+            logger.error("OCR error in mask_image: %s", e)
+            # Return original image if OCR fails
+            return image
+
+    return redact_image(image, page_redactions(ocr_result, detected_pii, redaction_level, spans, image.size))
+
+
+def mask_spans(image, spans, ocr_result=None):
+    """
+    Mask the OCR words covered by the given PII spans.
+
+    Spans are mapped straight to word indices through the OCR word offsets,
+    so no value/word search is needed. ``spans`` must come from this page's
+    ``ocr_result.text``.
+    """
+    if ocr_result is None:
+        try:
+            ocr_result = ocr_page(image)
+        except Exception as e:
+            logger.error("OCR error in mask_spans: %s", e)
+            # Return original image if OCR fails
+            return image
+
+    word_indices = set()
+    for span in spans:
+        word_indices.update(ocr_result.word_indices(span.start, span.end))
+    return redact_image(image, redaction_boxes([ocr_result.boxes[i] for i in sorted(word_indices)], image.size))
+
+
+def process_page(image, page=0, ner=True, ocr_result=None, redaction_level=None):
+    """
+    Preprocess, OCR and run PII detection on a single page.
+
+    With ``ner=False`` only regex and contextual detection run, so the caller
+    can batch SpaCy NER over several pages with detect_entity_spans. When
+    ``ocr_result`` is given (words read from a PDF text layer), preprocessing
+    and OCR are skipped. Only the detectors needed for ``redaction_level``
+    run (all of them if it is None).
+
+    Returns ``(text, spans, ocr_result)``, with spans located in the page
+    text. ``text`` is None when the
+    page failed for any reason other than OCR; OCR failures raise OCRError.
+    """
+    try:
+        if ocr_result is None:
+            try:
+                ocr_result = ocr_page(image)
+            except Exception as ocr_error:
+                raise OCRError(str(ocr_error)) from ocr_error
+
+        extracted_text = ocr_result.text
+        # Page text contains the PII being redacted, so only at debug level
+        logger.debug("Extracted text from page %d: %s", page + 1, extracted_text)
+        return extracted_text, detect_spans(extracted_text, page, ner, redaction_level), ocr_result
+    except OCRError:
+        raise
+    except Exception as e:
+        logger.exception("Error processing PDF page %d", page + 1)
+        return None, [], ocr_result
+
+
+def process_page_timed(*args):
+    """
+    Run process_page and return ``(result, timings)`` with the stages it
+    timed (each detector), so that a page processed in the page pool is
+    recorded in the request's process rather than the worker's.
+    """
+    with collect_stages() as timings:
+        result = process_page(*args)
+    return result, timings
+
+
+def merge_detected_pii(all_detected_pii, detected_pii):
+    """
+    Merge one page's detected PII into the document-wide result in place.
+    """
+    for pii_type, values in detected_pii.items():
+        if pii_type in all_detected_pii:
+            all_detected_pii[pii_type].extend(v for v in values if v not in all_detected_pii[pii_type])
+        else:
+            all_detected_pii[pii_type] = values.copy()
+    return all_detected_pii
+
+
+def get_page_pool():
+    """
+    Return the shared page worker pool, or None when pages run in-process.
+    """
+    global _page_pool
+    if PAGE_WORKERS <= 1:
+        return None
+    with _page_pool_lock:
+        if _page_pool is None:
+            context = multiprocessing.get_context(PAGE_POOL_START_METHOD)
+            if PAGE_POOL_START_METHOD == "forkserver":
+                # Imported once in the server, so each worker forks with it loaded
+                context.set_forkserver_preload([__name__])
+            _page_pool = ProcessPoolExecutor(max_workers=PAGE_WORKERS, mp_context=context)
+            logger.info("Page worker pool started with %d %s processes", PAGE_WORKERS, PAGE_POOL_START_METHOD)
+        return _page_pool
+
+
+def map_pages(fn, *iterables, on_result=None):
+    """
+    Apply ``fn`` to every page, fanning out across the page pool.
+
+    Results come back in page order; ``on_result(result)`` is called for
+    each one as soon as it and the pages before it are done.
+    """
+    pool = get_page_pool()
+    iterables = [list(it) for it in iterables]
+    if pool is None or len(iterables[0]) < PAGE_POOL_MIN_PAGES:
+        results = map(fn, *iterables)
+    else:
+        results = pool.map(fn, *iterables)
+    if on_result is None:
+        return list(results)
+    collected = []
+    for result in results:
+        collected.append(result)
+        on_result(result)
+    return collected
+
+
+class PageProgress:
+    """
+    Count the finished pages of one pass over a document and report them
+    as ``progress(pages_done, pages_total, stage)``.
+    """
+
+    def __init__(self, progress, stage, pages_total=None):
+        self.progress = progress
+        self.stage = stage
+        self.pages_done = 0
+        self.pages_total = None
+        if pages_total is not None:
+            self.total(pages_total)
+
+    def total(self, pages_total):
+        """
+        Report the page count once it is known.
+        """
+        if self.progress is not None and pages_total != self.pages_total:
+            self.pages_total = pages_total
+            self.progress(self.pages_done, pages_total, self.stage)
+
+    def page_done(self, *args):
+        """
+        Report one more finished page; takes and ignores a page's result.
+        """
+        self.pages_done += 1
+        if self.progress is not None:
+            self.progress(self.pages_done, self.pages_total, self.stage)
+
+
+def process_pages(images, first_page=0, ocr_results=None, redaction_level=None, on_page_done=None):
+    """
+    Run process_page over all pages of a document in parallel.
+
+    ``ocr_results`` optionally holds a text-layer OCRResult per page (None
+    for pages that need OCR); those pages are handled in-process since they
+    are cheap. SpaCy NER is then run once over all page texts with nlp.pipe
+    rather than separately inside each page. ``on_page_done(result)`` is
+    called as each page's OCR and rule-based detection finish.
+    """
+    images = list(images)
+    pages = list(range(first_page, first_page + len(images)))
+    if ocr_results is None:
+        ocr_results = [None] * len(images)
+
+    def scanned_page_done(timed_result):
+        result, timings = timed_result
+        for name, seconds in timings.items():
+            record_stage(name, seconds)
+        if on_page_done is not None:
+            on_page_done(result)
+
+    page_results = [None] * len(images)
+    scanned_pages = [i for i, ocr_result in enumerate(ocr_results) if ocr_result is None]
+    # Pool pages are timed as a whole: preprocessing, OCR and regex detection
+    with stage("ocr"):
+        scanned_results = map_pages(
+            process_page_timed,
+            [images[i] for i in scanned_pages],
+            [pages[i] for i in scanned_pages],
+            [False] * len(scanned_pages),
+            [None] * len(scanned_pages),
+            [redaction_level] * len(scanned_pages),
+            on_result=scanned_page_done,
+        )
+    for i, (result, _) in zip(scanned_pages, scanned_results):
+        page_results[i] = result
+    with stage("detection"):
+        for i, ocr_result in enumerate(ocr_results):
+            if ocr_result is not None:
+                page_results[i] = process_page(images[i], pages[i], False, ocr_result, redaction_level)
+                if on_page_done is not None:
+                    on_page_done(page_results[i])
+
+    text_pages = [i for i, (text, _, _) in enumerate(page_results) if text is not None]
+    with stage("ner"):
+        entity_spans = detect_entity_spans(
+            [page_results[i][0] for i in text_pages], [pages[i] for i in text_pages],
+            redaction_level=redaction_level,
+        )
+    for i, spans in zip(text_pages, entity_spans):
+        page_results[i][1].extend(spans)
+
+    PAGES.inc(len(scanned_pages), source="ocr")
+    PAGES.inc(len(images) - len(scanned_pages), source="text_layer")
+    WORDS.inc(sum(len(ocr_result) for _, _, ocr_result in page_results if ocr_result is not None))
+    return page_results
+
+
+def mask_pages(images, page_spans, ocr_results, detected_pii, redaction_level, on_page_done=None):
+    """
+    Run mask_image over all pages of a document in parallel.
+
+    Each page is masked with its own spans plus every ``detected_pii`` value
+    found elsewhere in the document. ``on_page_done(masked_image)`` is
+    called as each page is masked.
+    """
+    images = list(images)
+    count = len(images)
+    return map_pages(
+        mask_image, images, [detected_pii] * count, [redaction_level] * count,
+        ocr_results, page_spans, on_result=on_page_done,
+    )
+
+
+def iter_pdf_windows(file_bytes, window, dpi=PDF_DPI, poppler_path=None):
+    """
+    Yield ``(page_count, images)`` for each window of at most ``window``
+    pages of a PDF, where ``page_count`` is the document's total.
+
+    Only one window is rasterized at a time, using pdf2image's
+    first_page/last_page, so memory stays bounded by the window size.
+    """
+    from pdf2image import convert_from_path, pdfinfo_from_path
+
+    poppler_kwarg = {"poppler_path": poppler_path} if poppler_path else {}
+    with tempfile.NamedTemporaryFile(suffix=".pdf") as pdf_file:
+        # Write the upload once rather than once per window
+        pdf_file.write(file_bytes)
+        pdf_file.flush()
+
+        page_count = int(pdfinfo_from_path(pdf_file.name, **poppler_kwarg)["Pages"])
+        for first_page in range(1, page_count + 1, window):
+            last_page = min(first_page + window - 1, page_count)
+            yield page_count, convert_from_path(
+                pdf_file.name, dpi=dpi, first_page=first_page, last_page=last_page, **poppler_kwarg
+            )
+
+
+def detect_pages(page_analyses, redaction_level):
+    """
+    Run detection again over the pages of earlier ``(text, spans,
+    ocr_result)`` analyses, keeping their OCR, for a redaction level their
+    spans do not cover.
+    """
+    text_pages = [i for i, (text, _, _) in enumerate(page_analyses) if text is not None]
+    with stage("detection"):
+        page_spans = detect_spans_batch(
+            [page_analyses[i][0] for i in text_pages], text_pages, redaction_level=redaction_level
+        )
+    analyses = list(page_analyses)
+    for i, spans in zip(text_pages, page_spans):
+        analyses[i] = (analyses[i][0], spans, analyses[i][2])
+    return analyses
+
+
+def redact_page_text(text, spans, ocr_result, value_index):
+    """
+    Redact a page's text: its own ``spans`` plus every OCR word that
+    ``value_index`` matches, i.e. the same words mask_image masks.
+    """
+    if ocr_result is not None:
+        spans = list(spans) + [
+            PIISpan("value", *ocr_result.offsets[i]) for i in match_value_index(ocr_result, value_index)
+        ]
+    return redact_spans(text, spans)
+
+
+def redact_document_text(page_analyses, detected_pii, redaction_level):
+    """
+    Return the redacted text of a document in the form process_pdf returns
+    its text (pages followed by a newline), with each page redacted like its
+    image: its own spans plus every ``detected_pii`` value of the document.
+    """
+    value_index = level_value_index(detected_pii, redaction_level)
+    return "".join(
+        redact_page_text(text, filter_spans_by_level(spans, redaction_level), ocr_result, value_index) + "\n"
+        for text, spans, ocr_result in page_analyses
+        if text is not None
+    )
+
+
+def document_redactions(page_analyses, detected_pii, redaction_level):
+    """
+    Return the redaction boxes of every page of a document as
+    ``[{"page", "boxes": [[x0, y0, x1, y1], ...]}]`` in page pixels.
+
+    Each page gets its own spans plus every ``detected_pii`` value found
+    elsewhere in the document, as mask_pages would mask them.
+    """
+    redactions = []
+    for page, (_, spans, ocr_result) in enumerate(page_analyses):
+        boxes = []
+        if ocr_result is not None:
+            spans = filter_spans_by_level(spans, redaction_level)
+            boxes = page_redactions(ocr_result, detected_pii, redaction_level, spans)
+            boxes = [[int(value) for value in box] for box in boxes]
+        redactions.append({"page": page, "boxes": boxes})
+    return redactions
+
+
+def analyses_size(page_analyses):
+    """
+    Return the approximate size in bytes of per-page ``(text, spans,
+    ocr_result)`` analyses, for the result cache's budget.
+    """
+    return sum(
+        len(text or "") + PII_SPAN_BYTES * len(spans) + (OCR_WORD_BYTES * len(ocr_result) if ocr_result is not None else 0)
+        for text, spans, ocr_result in page_analyses
+    )
+
+
+def output_fingerprint():
+    """
+    Return the settings that change the redacted file for the same
+    analyses: the redaction renderer, the PDF encoder and, in streaming
+    mode, the windows that decide which PII each page is masked with.
+    """
+    from utils import pdf_writer
+
+    streaming = f"stream{PDF_MAX_INFLIGHT_PAGES}" if PDF_STREAMING else "document"
+    return f"{render_fingerprint()}:{pdf_writer.PDF_IMAGE_FORMAT}-{pdf_writer.PDF_JPEG_QUALITY}:{streaming}"
+
+
+@lru_cache(maxsize=1)
+def engine_fingerprint():
+    """
+    Return a short digest of the settings that affect OCR and detection
+    output, used to key cached results.
+    """
+    import hashlib
+
+    from ocr import TESSERACT_CONFIG
+    from utils import pii_detector, preprocessing, text_layer
+
+    settings = (
+        TESSERACT_CONFIG,
+        PDF_DPI,
+        preprocessing.CV2_AVAILABLE and preprocessing.PREPROCESS_STEPS,
+        preprocessing.PREPROCESS_TARGET_DPI,
+        preprocessing.PREPROCESS_ADAPTIVE_BLOCK_SIZE,
+        preprocessing.PREPROCESS_ADAPTIVE_C,
+        preprocessing.OCR_REGIONS and (preprocessing.OCR_REGION_MAX_COVERAGE, preprocessing.OCR_REGION_MAX_INK),
+        sorted(pii_detector.PII_PATTERNS.items()),
+        sorted((k, tuple(v)) for k, v in pii_detector.CONTEXTUAL_KEYWORDS.items()),
+        pii_detector.spacy_available(),
+        pii_detector.detector_registry.fingerprint(),
+        text_layer.PDF_TEXT_LAYER and text_layer.PYMUPDF_AVAILABLE,
+        text_layer.PDF_TEXT_LAYER_MIN_CHARS,
+        text_layer.PDF_TEXT_LAYER_MAX_IMAGE_AREA,
+    )
+    return hashlib.sha256(repr(settings).encode()).hexdigest()[:16]
+
+
+def analyse_window(document, images, first_page, redaction_level, on_page_done=None):
+    """
+    Read or OCR one window of rasterized PDF pages and detect their PII.
+
+    Pages with a usable text layer in ``document`` are read directly; only
+    scanned pages are OCRed.
+    """
+    with stage("text_layer"):
+        text_layers = [
+            page_ocr_result(document, page, image.size)
+            for page, image in enumerate(images, start=first_page)
+        ]
+    return process_pages(images, first_page, text_layers, redaction_level, on_page_done)
+
+
+def report_analyses(on_analysis, window_results, first_page, pages_total, redaction_level):
+    """
+    Call ``on_analysis(page, pages_total, text, spans)`` for each analysed
+    page, with its spans filtered to the redaction level.
+    """
+    if on_analysis is None:
+        return
+    for page, (extracted_text, spans, _) in enumerate(window_results, start=first_page):
+        on_analysis(page, pages_total, extracted_text or "", filter_spans_by_level(spans, redaction_level))
+
+
+def analyse_pdf(file_bytes, redaction_level, poppler_path=None, on_analysis=None, progress=None):
+    """
+    First pass of process_pdf: read or OCR every page of a PDF and detect
+    its PII, one window of PDF_MAX_INFLIGHT_PAGES pages at a time.
+
+    Only the per-page ``(text, spans, ocr_result)`` analyses are kept; each
+    window's images are dropped before the next one is rasterized.
+    ``on_analysis`` is called for each page of a window as soon as the
+    window's detection finishes (see report_analyses), and ``progress``
+    with the ``"analysis"`` stage as each page is read (see PageProgress).
+    """
+    analyses = []
+    document = open_text_layer(file_bytes)
+    tracker = PageProgress(progress, "analysis", document.page_count if document is not None else None)
+    try:
+        windows = iter_pdf_windows(file_bytes, PDF_MAX_INFLIGHT_PAGES, poppler_path=poppler_path)
+        for pages_total, images in timed_iter(windows, "rasterize"):
+            tracker.total(pages_total)
+            window_results = analyse_window(document, images, len(analyses), redaction_level, tracker.page_done)
+            report_analyses(on_analysis, window_results, len(analyses), pages_total, redaction_level)
+            analyses.extend(window_results)
+    finally:
+        if document is not None:
+            document.close()
+    return analyses
+
+
+def process_pdf(file_bytes, redaction_level, output, poppler_path=None, streaming=PDF_STREAMING,
+                page_analyses=None, progress=None, on_page=None, on_analysis=None):
+    """
+    Extract text, detect PII and write the masked PDF to the binary file
+    object ``output``.
+
+    Pages are rasterized PDF_MAX_INFLIGHT_PAGES at a time. By default the
+    whole document is analysed first (see analyse_pdf), then every window is
+    rasterized again and masked with the PII of the whole document. In
+    streaming mode each window is analysed, masked and written before the
+    next one is rendered, and its pages are masked with the PII found so far.
+
+    ``page_analyses`` is the per-page ``(text, spans, ocr_result)`` list of a
+    previous run on the same file at this redaction level or a higher one
+    (see detect_pages); when given, the first pass is skipped and pages are
+    only rasterized and masked. ``progress(pages_done, pages_total, stage)``
+    is called as each page is analysed (stage ``"analysis"``) and as each
+    page is masked (stage ``"masking"``), counting the pages of each pass
+    separately; in streaming mode only masked pages are counted.
+    ``on_analysis(page, pages_total,
+    text, spans)`` is called for each page as soon as its detection finishes
+    (right away for ``page_analyses``), and ``on_page(page, pages_total,
+    text, spans, masked_image)`` once it is masked, with the page's filtered
+    spans relative to its own text.
+
+    With ``output=None`` nothing is masked or written: only the analyses are
+    produced, for callers that want redaction coordinates rather than pixels
+    (see document_redactions), and pages that were analysed before are not
+    even rasterized.
+
+    Returns ``(text, detected_pii, spans, page_analyses)``. PII and spans are
+    filtered to the redaction level, with span offsets relative to the
+    returned document text; ``page_analyses`` holds every span found by the
+    detectors the redaction level needed, for caching.
+    """
+    if page_analyses is None and (output is None or not streaming):
+        # First pass: find the PII of the whole document before any page is masked
+        page_analyses = analyse_pdf(file_bytes, redaction_level, poppler_path, on_analysis, progress)
+    elif page_analyses is not None:
+        report_analyses(on_analysis, page_analyses, 0, len(page_analyses), redaction_level)
+
+    text = ""
+    all_detected_pii = {}
+    document_spans = []
+    page_spans = []
+
+    def add_pages(window_results):
+        nonlocal text
+        for extracted_text, spans, _ in window_results:
+            spans = filter_spans_by_level(spans, redaction_level)
+            page_spans.append(spans)
+            if extracted_text is None:
+                continue
+            merge_detected_pii(all_detected_pii, spans_to_dict(extracted_text, spans))
+            document_spans.extend(span.shifted(len(text)) for span in spans)
+            text += extracted_text + "\n"
+
+    if page_analyses is not None:
+        analyses = list(page_analyses)
+        add_pages(analyses)
+        if output is None:
+            if progress is not None:
+                progress(len(analyses), len(analyses), "analysis")
+            return text, all_detected_pii, document_spans, analyses
+        document = None
+    else:
+        analyses = []
+        document = open_text_layer(file_bytes)
+
+    page_count = 0
+    tracker = PageProgress(progress, "masking", len(analyses) if page_analyses is not None else None)
+    writer = PDFWriter(output)
+    try:
+        windows = iter_pdf_windows(file_bytes, PDF_MAX_INFLIGHT_PAGES, poppler_path=poppler_path)
+        for pages_total, images in timed_iter(windows, "rasterize"):
+            tracker.total(pages_total)
+            first_page = page_count
+            page_count += len(images)
+            if page_analyses is None:
+                window_results = analyse_window(document, images, first_page, redaction_level)
+                report_analyses(on_analysis, window_results, first_page, pages_total, redaction_level)
+                analyses.extend(window_results)
+                add_pages(window_results)
+            else:
+                window_results = analyses[first_page:page_count]
+
+            with stage("masking"):
+                masked_images = mask_pages(
+                    images, page_spans[first_page:page_count], [ocr_result for _, _, ocr_result in window_results],
+                    all_detected_pii, redaction_level, tracker.page_done,
+                )
+            if on_page is not None:
+                for page, ((extracted_text, _, _), spans, redacted_image) in enumerate(
+                    zip(window_results, page_spans[first_page:page_count], masked_images), start=first_page
+                ):
+                    on_page(page, pages_total, extracted_text or "", spans, redacted_image)
+            with stage("encode"):
+                for redacted_image in masked_images:
+                    writer.add_page(redacted_image)
+
+        with stage("encode"):
+            writer.close()
+    finally:
+        if document is not None:
+            document.close()
+    return text, all_detected_pii, document_spans, analyses
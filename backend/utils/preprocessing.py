@@ -0,0 +1,261 @@
+"""
+Image preprocessing before OCR.
+
+Preprocessing is a list of named steps (PREPROCESS_STEPS) applied in place
+to a single grayscale NumPy buffer per page. Steps that move pixels
+(downscale, deskew) record an affine transform, so OCR boxes found on the
+processed image can be mapped back onto the original for masking.
+
+find_text_regions is a quick layout pass that locates the text blocks of a
+processed page, so sparse pages can be OCRed region by region.
+"""
+import os
+
+from PIL import Image
+
+# cv2 and numpy are optional - without them images are OCRed as-is
+try:
+    import cv2
+    import numpy as np
+    CV2_AVAILABLE = True
+except ImportError:
+    CV2_AVAILABLE = False
+
+# Comma-separated steps, applied in order after conversion to grayscale:
+# downscale, deskew, blur, otsu, adaptive
+PREPROCESS_STEPS = tuple(
+    step.strip()
+    for step in os.getenv("PREPROCESS_STEPS", "downscale,blur,otsu").lower().split(",")
+    if step.strip()
+)
+# Images are shrunk to at most this resolution, assuming an A4 page
+PREPROCESS_TARGET_DPI = int(os.getenv("PREPROCESS_TARGET_DPI", "300"))
+PREPROCESS_MAX_SKEW_DEGREES = float(os.getenv("PREPROCESS_MAX_SKEW_DEGREES", "5"))
+PREPROCESS_ADAPTIVE_BLOCK_SIZE = int(os.getenv("PREPROCESS_ADAPTIVE_BLOCK_SIZE", "31"))
+PREPROCESS_ADAPTIVE_C = int(os.getenv("PREPROCESS_ADAPTIVE_C", "15"))
+
+# OCR only the detected text regions of sparse pages
+OCR_REGIONS = os.getenv("OCR_REGIONS", "true").lower() == "true"
+# Pages whose text regions cover more than this share of the page are OCRed
+# whole, as splitting them would save little
+OCR_REGION_MAX_COVERAGE = float(os.getenv("OCR_REGION_MAX_COVERAGE", "0.5"))
+# Near-solid areas (photos, filled graphics) above this ink share are skipped
+OCR_REGION_MAX_INK = float(os.getenv("OCR_REGION_MAX_INK", "0.9"))
+# Pixels added around each region so that no glyph is cut off
+OCR_REGION_PADDING = 12
+
+# Long side of an A4 page in inches
+A4_LONG_SIDE_INCHES = 11.69
+# Width the skew estimate is computed at, and its angular resolution
+DESKEW_SAMPLE_WIDTH = 800
+DESKEW_STEP_DEGREES = 0.25
+
+
+def _scale_matrix(factor):
+    return np.array([[factor, 0, 0], [0, factor, 0], [0, 0, 1]], dtype=np.float64)
+
+
+def _downscale(buffer):
+    limit = PREPROCESS_TARGET_DPI * A4_LONG_SIDE_INCHES
+    factor = limit / max(buffer.shape)
+    if factor >= 1:
+        return buffer, None
+    buffer = cv2.resize(buffer, None, fx=factor, fy=factor, interpolation=cv2.INTER_AREA)
+    return buffer, _scale_matrix(factor)
+
+
+def estimate_skew(buffer):
+    """
+    Return the text skew of a grayscale page in degrees, found by picking the
+    rotation whose row profile has the sharpest lines.
+    """
+    factor = min(1.0, DESKEW_SAMPLE_WIDTH / buffer.shape[1])
+    sample = cv2.resize(buffer, None, fx=factor, fy=factor, interpolation=cv2.INTER_AREA)
+    _, ink = cv2.threshold(sample, 0, 1, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    ink = ink.astype(np.float32)
+    height, width = ink.shape
+    center = (width / 2, height / 2)
+
+    angles = np.arange(
+        -PREPROCESS_MAX_SKEW_DEGREES, PREPROCESS_MAX_SKEW_DEGREES + DESKEW_STEP_DEGREES / 2, DESKEW_STEP_DEGREES
+    )
+    best_angle, best_score = 0.0, -1.0
+    for angle in angles:
+        matrix = cv2.getRotationMatrix2D(center, angle, 1.0)
+        rotated = cv2.warpAffine(ink, matrix, (width, height), flags=cv2.INTER_NEAREST)
+        score = float(np.var(rotated.sum(axis=1)))
+        if score > best_score:
+            best_angle, best_score = float(angle), score
+    return best_angle
+
+
+def _deskew(buffer):
+    angle = estimate_skew(buffer)
+    if abs(angle) < DESKEW_STEP_DEGREES / 2:
+        return buffer, None
+    height, width = buffer.shape
+    matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+    buffer = cv2.warpAffine(
+        buffer, matrix, (width, height), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT, borderValue=255
+    )
+    return buffer, np.vstack([matrix, [0, 0, 1]])
+
+
+def _blur(buffer):
+    cv2.GaussianBlur(buffer, (5, 5), 0, dst=buffer)
+    return buffer, None
+
+
+def _otsu(buffer):
+    cv2.threshold(buffer, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU, dst=buffer)
+    return buffer, None
+
+
+def _adaptive(buffer):
+    cv2.adaptiveThreshold(
+        buffer, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY,
+        PREPROCESS_ADAPTIVE_BLOCK_SIZE, PREPROCESS_ADAPTIVE_C, dst=buffer,
+    )
+    return buffer, None
+
+
+# Each step takes the page buffer and returns it (modified in place where
+# possible) with the 3x3 transform it applied to coordinates, or None
+STEPS = {
+    "downscale": _downscale,
+    "deskew": _deskew,
+    "blur": _blur,
+    "otsu": _otsu,
+    "adaptive": _adaptive,
+}
+
+
+def _grayscale(image):
+    if image.mode == "L":
+        return np.array(image)
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGB")
+    code = cv2.COLOR_RGBA2GRAY if image.mode == "RGBA" else cv2.COLOR_RGB2GRAY
+    return cv2.cvtColor(np.asarray(image), code)
+
+
+def preprocess(image, steps=PREPROCESS_STEPS):
+    """
+    Run the preprocessing steps on a PIL image.
+
+    Returns ``(processed_image, matrix)``, where ``matrix`` is the 3x3
+    transform from original to processed coordinates, or None if pixels
+    were not moved.
+    """
+    if not CV2_AVAILABLE:
+        return image, None
+
+    buffer = _grayscale(image)
+    matrix = None
+    for step in steps:
+        if step not in STEPS:
+            raise ValueError(f"Unknown preprocessing step: {step}")
+        buffer, step_matrix = STEPS[step](buffer)
+        if step_matrix is not None:
+            matrix = step_matrix if matrix is None else step_matrix @ matrix
+    return Image.fromarray(buffer), matrix
+
+
+def boxes_to_original(boxes, matrix, size):
+    """
+    Map ``(left, top, width, height)`` boxes found on a preprocessed image
+    back onto the original image of the given size.
+    """
+    if matrix is None or not boxes:
+        return list(boxes)
+    boxes = np.asarray(boxes, dtype=np.float64)
+    left, top = boxes[:, 0], boxes[:, 1]
+    right, bottom = left + boxes[:, 2], top + boxes[:, 3]
+    # Corners of every box, shape (boxes, 4 corners, xy1)
+    corners = np.stack(
+        [
+            np.stack([left, top, np.ones_like(left)], axis=1),
+            np.stack([right, top, np.ones_like(left)], axis=1),
+            np.stack([left, bottom, np.ones_like(left)], axis=1),
+            np.stack([right, bottom, np.ones_like(left)], axis=1),
+        ],
+        axis=1,
+    )
+    mapped = corners @ np.linalg.inv(matrix).T
+    width, height = size
+    x0 = np.clip(np.floor(mapped[..., 0].min(axis=1)), 0, width)
+    y0 = np.clip(np.floor(mapped[..., 1].min(axis=1)), 0, height)
+    x1 = np.clip(np.ceil(mapped[..., 0].max(axis=1)), 0, width)
+    y1 = np.clip(np.ceil(mapped[..., 1].max(axis=1)), 0, height)
+    return [
+        (int(l), int(t), int(r - l), int(b - t))
+        for l, t, r, b in zip(x0, y0, x1, y1)
+    ]
+
+
+def _merge_overlapping(boxes):
+    """
+    Merge ``(x0, y0, x1, y1)`` boxes until none overlap.
+    """
+    boxes = list(boxes)
+    merged = True
+    while merged:
+        merged = False
+        result = []
+        for box in boxes:
+            for i, other in enumerate(result):
+                if box[0] < other[2] and other[0] < box[2] and box[1] < other[3] and other[1] < box[3]:
+                    result[i] = (
+                        min(box[0], other[0]), min(box[1], other[1]),
+                        max(box[2], other[2]), max(box[3], other[3]),
+                    )
+                    merged = True
+                    break
+            else:
+                result.append(box)
+        boxes = result
+    return boxes
+
+
+def find_text_regions(image):
+    """
+    Locate the text blocks of a preprocessed page.
+
+    Ink is smeared horizontally into lines and blocks with a dilation, and
+    each connected blob becomes a region. Returns ``(left, top, width,
+    height)`` regions in reading order, or None when the page should be
+    OCRed whole: region OCR is disabled, OpenCV is missing, no text was
+    found, or the regions cover most of the page.
+    """
+    if not (OCR_REGIONS and CV2_AVAILABLE):
+        return None
+    buffer = np.asarray(image.convert("L") if image.mode != "L" else image)
+    height, width = buffer.shape
+    _, ink = cv2.threshold(buffer, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+
+    # Wide enough to bridge the gaps between words, tall enough to join
+    # neighbouring lines of a paragraph
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (max(3, width // 60), max(3, height // 250)))
+    blobs = cv2.dilate(ink, kernel)
+    count, _, stats, _ = cv2.connectedComponentsWithStats(blobs, connectivity=8)
+
+    min_height = max(4, height // 400)
+    boxes = []
+    for left, top, box_width, box_height, _ in stats[1:count].tolist():
+        if box_height < min_height:
+            continue
+        if cv2.countNonZero(ink[top:top + box_height, left:left + box_width]) > OCR_REGION_MAX_INK * box_width * box_height:
+            continue
+        boxes.append((
+            max(0, left - OCR_REGION_PADDING),
+            max(0, top - OCR_REGION_PADDING),
+            min(width, left + box_width + OCR_REGION_PADDING),
+            min(height, top + box_height + OCR_REGION_PADDING),
+        ))
+    boxes = _merge_overlapping(boxes)
+    if not boxes:
+        return None
+    if sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in boxes) > OCR_REGION_MAX_COVERAGE * width * height:
+        return None
+    boxes.sort(key=lambda box: (box[1], box[0]))
+    return [(x0, y0, x1 - x0, y1 - y0) for x0, y0, x1, y1 in boxes]
@@ -0,0 +1,182 @@
+"""
+Redaction renderer: paints redaction boxes over a page image.
+
+Boxes are padded and clipped as one NumPy array and rendered in place on the
+page buffer, touching only the pixels inside them. Solid boxes are filled
+with one slice assignment each; for the other styles overlapping boxes are
+merged first so no pixel is processed twice. The solid style is the only
+one that destroys the text; pixelate and blur keep the page readable around
+it but may leave short values guessable, so they are meant for previews and
+review copies.
+"""
+import logging
+import os
+
+from PIL import Image, ImageDraw, ImageFilter
+
+# numpy is optional - without it boxes are drawn with PIL one at a time
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+REDACTION_STYLES = ("solid", "pixelate", "blur")
+REDACTION_STYLE = os.getenv("REDACTION_STYLE", "solid").lower()
+if REDACTION_STYLE not in REDACTION_STYLES:
+    logger.warning("Unknown REDACTION_STYLE %r, using solid", REDACTION_STYLE)
+    REDACTION_STYLE = "solid"
+# Pixels added around each word box
+REDACTION_PADDING = int(os.getenv("REDACTION_PADDING", "0"))
+# Gray level (0-255) of solid boxes
+REDACTION_COLOR = int(os.getenv("REDACTION_COLOR", "0"))
+# Block size of the pixelate style and radius of the blur style, in pixels
+REDACTION_PIXEL_SIZE = max(1, int(os.getenv("REDACTION_PIXEL_SIZE", "12")))
+REDACTION_BLUR_RADIUS = max(1, int(os.getenv("REDACTION_BLUR_RADIUS", "12")))
+
+
+def redaction_boxes(boxes, size=None, padding=REDACTION_PADDING):
+    """
+    Convert (left, top, width, height) word boxes to padded
+    ``[x0, y0, x1, y1]`` corners, clipped to the image ``size`` if given.
+
+    Returns an (N, 4) integer array (a list of lists without numpy) without
+    empty boxes.
+    """
+    if not NUMPY_AVAILABLE:
+        width, height = size if size is not None else (float("inf"), float("inf"))
+        corners = [
+            [max(0, left - padding), max(0, top - padding),
+             min(width, left + box_width + padding), min(height, top + box_height + padding)]
+            for left, top, box_width, box_height in boxes
+        ]
+        return [box for box in corners if box[2] > box[0] and box[3] > box[1]]
+
+    boxes = np.asarray(boxes, dtype=np.int64).reshape(-1, 4)
+    corners = np.empty_like(boxes)
+    corners[:, :2] = boxes[:, :2] - padding
+    corners[:, 2:] = boxes[:, :2] + boxes[:, 2:] + padding
+    np.maximum(corners, 0, out=corners)
+    if size is not None:
+        width, height = size
+        np.minimum(corners[:, 0::2], width, out=corners[:, 0::2])
+        np.minimum(corners[:, 1::2], height, out=corners[:, 1::2])
+    return corners[(corners[:, 2] > corners[:, 0]) & (corners[:, 3] > corners[:, 1])]
+
+
+def _pixelate(region, block):
+    height, width = region.shape[:2]
+    rows = np.arange(0, height, block)
+    cols = np.arange(0, width, block)
+    sums = np.add.reduceat(np.add.reduceat(region, rows, axis=0, dtype=np.uint32), cols, axis=1)
+    counts = np.outer(np.diff(np.append(rows, height)), np.diff(np.append(cols, width)))
+    if region.ndim == 3:
+        counts = counts[:, :, None]
+    means = (sums // counts).astype(region.dtype)
+    region[...] = np.repeat(np.repeat(means, block, axis=0)[:height], block, axis=1)[:, :width]
+
+
+def _blur(array, x0, y0, x1, y1, radius):
+    # Box blur from a summed-area table over the box and its surroundings
+    height, width = array.shape[:2]
+    top, left = max(0, y0 - radius), max(0, x0 - radius)
+    bottom, right = min(height, y1 + radius), min(width, x1 + radius)
+    context = array[top:bottom, left:right].astype(np.int64)
+    table = np.zeros((bottom - top + 1, right - left + 1) + context.shape[2:], dtype=np.int64)
+    table[1:, 1:] = context.cumsum(axis=0).cumsum(axis=1)
+
+    rows = np.arange(y0 - top, y1 - top)
+    cols = np.arange(x0 - left, x1 - left)
+    r0 = np.clip(rows - radius, 0, bottom - top)[:, None]
+    r1 = np.clip(rows + radius + 1, 0, bottom - top)[:, None]
+    c0 = np.clip(cols - radius, 0, right - left)[None, :]
+    c1 = np.clip(cols + radius + 1, 0, right - left)[None, :]
+    sums = table[r1, c1] - table[r0, c1] - table[r1, c0] + table[r0, c0]
+    counts = (r1 - r0) * (c1 - c0)
+    if array.ndim == 3:
+        counts = counts[:, :, None]
+    array[y0:y1, x0:x1] = (sums // counts).astype(array.dtype)
+
+
+def merge_boxes(boxes):
+    """
+    Merge overlapping ``[x0, y0, x1, y1]`` boxes into their bounding boxes
+    until none overlap. Merging can only grow the redacted area.
+    """
+    merged = [list(box) for box in boxes]
+    changed = True
+    while changed:
+        changed = False
+        result = []
+        for box in merged:
+            for other in result:
+                if box[0] < other[2] and other[0] < box[2] and box[1] < other[3] and other[1] < box[3]:
+                    other[:] = [min(box[0], other[0]), min(box[1], other[1]), max(box[2], other[2]), max(box[3], other[3])]
+                    changed = True
+                    break
+            else:
+                result.append(box)
+        merged = result
+    return merged
+
+
+def render_redactions(array, boxes, style=REDACTION_STYLE, color=REDACTION_COLOR):
+    """
+    Redact the ``[x0, y0, x1, y1]`` boxes of an (H, W) or (H, W, C) uint8
+    image array in place and return it.
+    """
+    if len(boxes) == 0:
+        return array
+    if style == "solid":
+        for x0, y0, x1, y1 in boxes:
+            array[y0:y1, x0:x1] = color
+        return array
+    for x0, y0, x1, y1 in merge_boxes(boxes):
+        if style == "pixelate":
+            _pixelate(array[y0:y1, x0:x1], REDACTION_PIXEL_SIZE)
+        else:
+            _blur(array, x0, y0, x1, y1, REDACTION_BLUR_RADIUS)
+    return array
+
+
+def _draw_redactions(image, boxes, style):
+    draw = ImageDraw.Draw(image)
+    for x0, y0, x1, y1 in (boxes if style == "solid" else merge_boxes(boxes)):
+        box = (x0, y0, x1, y1)
+        if style == "pixelate":
+            region = image.crop(box)
+            blocks = (-(-region.width // REDACTION_PIXEL_SIZE), -(-region.height // REDACTION_PIXEL_SIZE))
+            image.paste(region.resize(blocks, Image.BOX).resize(region.size, Image.NEAREST), box)
+        elif style == "blur":
+            image.paste(image.crop(box).filter(ImageFilter.BoxBlur(REDACTION_BLUR_RADIUS)), box)
+        else:
+            draw.rectangle((x0, y0, x1 - 1, y1 - 1), fill=REDACTION_COLOR if image.mode == "L" else (REDACTION_COLOR,) * 3)
+
+
+def redact_image(image, boxes, style=REDACTION_STYLE):
+    """
+    Return a copy of the PIL image with the ``[x0, y0, x1, y1]`` boxes
+    redacted. The page is copied into one NumPy buffer, which is rendered in
+    place and handed back to PIL; without numpy the boxes are drawn on a
+    copy of the image with PIL.
+    """
+    if len(boxes) == 0:
+        return image
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    if not NUMPY_AVAILABLE:
+        image = image.copy()
+        _draw_redactions(image, boxes, style)
+        return image
+    array = np.array(image)
+    render_redactions(array, boxes, style)
+    return Image.fromarray(array)
+
+
+def render_fingerprint():
+    """
+    Return the renderer settings as a string, used to key cached artifacts.
+    """
+    return f"{REDACTION_STYLE}-{REDACTION_PADDING}-{REDACTION_COLOR}-{REDACTION_PIXEL_SIZE}-{REDACTION_BLUR_RADIUS}"
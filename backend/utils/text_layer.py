@@ -0,0 +1,107 @@
+"""
+Text-layer extraction for born-digital PDFs.
+
+Pages that already carry text (statements, exported forms, previously OCRed
+scans) are read directly with PyMuPDF: words and their boxes come out of the
+PDF in milliseconds and are wrapped in an OCRResult, so detection and masking
+treat them exactly like Tesseract output. Pages without enough text fall back
+to OCR, and so do pages with large images: a scan carrying only a small text
+overlay (page number, watermark, scanner stamp) would otherwise be read from
+the overlay alone and the PII in the scanned image never seen.
+"""
+import logging
+import math
+import os
+
+from ocr import OCRResult
+
+logger = logging.getLogger(__name__)
+
+# PyMuPDF is optional - without it every PDF page goes through OCR
+try:
+    import pymupdf
+    PYMUPDF_AVAILABLE = True
+except ImportError:
+    PYMUPDF_AVAILABLE = False
+    logger.warning("PyMuPDF not available - PDF text layers will not be used")
+
+PDF_TEXT_LAYER = os.getenv("PDF_TEXT_LAYER", "true").lower() == "true"
+# Pages with fewer extractable characters than this are treated as scanned
+PDF_TEXT_LAYER_MIN_CHARS = int(os.getenv("PDF_TEXT_LAYER_MIN_CHARS", "20"))
+# Pages whose images cover more than this fraction of the page are OCRed,
+# since the images may hold text the text layer does not
+PDF_TEXT_LAYER_MAX_IMAGE_AREA = float(os.getenv("PDF_TEXT_LAYER_MAX_IMAGE_AREA", "0.05"))
+
+
+def open_text_layer(file_bytes):
+    """
+    Open a PDF for text-layer extraction, or return None if the fast path is
+    disabled or unavailable.
+    """
+    if not (PDF_TEXT_LAYER and PYMUPDF_AVAILABLE):
+        return None
+    try:
+        return pymupdf.open(stream=file_bytes, filetype="pdf")
+    except Exception as e:
+        logger.warning("Could not read PDF text layer: %s", e)
+        return None
+
+
+def image_area_fraction(page):
+    """
+    Return the fraction of the page covered by images (overlapping images
+    are counted twice, which only errs towards OCR).
+    """
+    page_rect = page.rect
+    page_area = page_rect.width * page_rect.height
+    if page_area <= 0:
+        return 1.0
+    covered = 0.0
+    for info in page.get_image_info():
+        bbox = pymupdf.Rect(info["bbox"]) & page_rect
+        if not bbox.is_empty:
+            covered += bbox.width * bbox.height
+    return covered / page_area
+
+
+def page_ocr_result(document, page_number, image_size):
+    """
+    Return an OCRResult built from the text layer of a page, with boxes in
+    the pixel coordinates of its rendered image, or None if the page has too
+    little text or too much of it is covered by images, and needs OCR.
+    """
+    if document is None or page_number >= document.page_count:
+        return None
+    try:
+        page = document[page_number]
+        words = page.get_text("words")
+        if sum(len(word[4].strip()) for word in words) < PDF_TEXT_LAYER_MIN_CHARS:
+            return None
+        if image_area_fraction(page) > PDF_TEXT_LAYER_MAX_IMAGE_AREA:
+            return None
+    except Exception as e:
+        logger.warning("Could not read text layer of page %d: %s", page_number + 1, e)
+        return None
+
+    # Text coordinates ignore /Rotate; map them onto the page as displayed
+    # and scale to the rendered image
+    width, height = image_size
+    scale_x = width / page.rect.width
+    scale_y = height / page.rect.height
+    matrix = page.rotation_matrix
+
+    data = {key: [] for key in ("text", "block_num", "par_num", "line_num", "left", "top", "width", "height", "conf")}
+    for x0, y0, x1, y1, word, block_num, line_num, _ in words:
+        rect = pymupdf.Rect(x0, y0, x1, y1) * matrix
+        left = max(0, math.floor(rect.x0 * scale_x))
+        top = max(0, math.floor(rect.y0 * scale_y))
+        data["text"].append(word)
+        data["block_num"].append(block_num)
+        data["par_num"].append(0)
+        data["line_num"].append(line_num)
+        data["left"].append(left)
+        data["top"].append(top)
+        data["width"].append(min(width, math.ceil(rect.x1 * scale_x)) - left)
+        data["height"].append(min(height, math.ceil(rect.y1 * scale_y)) - top)
+        data["conf"].append(100.0)
+    return OCRResult(data)
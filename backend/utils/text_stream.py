@@ -0,0 +1,168 @@
+"""
+Streaming redaction of plain text and NDJSON records, without OCR.
+
+Plain text is read in pieces and redacted in windows of TEXT_CHUNK_CHARS.
+Each window is scanned together with TEXT_CHUNK_OVERLAP characters of the
+text on either side, so a value crossing a window boundary is still seen
+whole: the window is extended to the end of any match starting inside it,
+and matches starting in the trailing overlap are left to the next window.
+Memory stays bounded by the window size whatever the length of the body.
+
+NDJSON bodies hold one record per line, either a JSON string or an object
+with a ``text`` field (and an optional ``id`` echoed back). Records are
+detected in batches so spaCy can run over them with nlp.pipe.
+"""
+import codecs
+import json
+import os
+import re
+
+from utils import metrics
+from utils.pii_detector import (
+    PIISpan,
+    detect_spans,
+    detect_spans_batch,
+    filter_spans_by_level,
+    redact_spans,
+    spans_to_dict,
+)
+
+TEXT_CHUNK_CHARS = int(os.getenv("TEXT_CHUNK_CHARS", "65536"))
+# Context scanned on each side of a window; must exceed the longest PII value
+TEXT_CHUNK_OVERLAP = int(os.getenv("TEXT_CHUNK_OVERLAP", "256"))
+TEXT_READ_BYTES = int(os.getenv("TEXT_READ_BYTES", "65536"))
+TEXT_BATCH_RECORDS = int(os.getenv("TEXT_BATCH_RECORDS", "64"))
+
+_WHITESPACE = re.compile(r"\s")
+
+
+def iter_text(stream, read_bytes=TEXT_READ_BYTES):
+    """
+    Yield the body of a binary stream as text, decoding UTF-8 incrementally.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    while True:
+        data = stream.read(read_bytes)
+        if not data:
+            break
+        text = decoder.decode(data)
+        if text:
+            yield text
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+def _count_hits(detected_pii):
+    for pii_type, values in detected_pii.items():
+        metrics.PII_HITS.inc(len(values), pii_type=pii_type)
+
+
+def _redact_window(window, offset, cut, redaction_level, ner):
+    """
+    Redact ``window[offset:cut]``, using the rest of the window as context.
+
+    ``cut`` is moved forward past any match that starts before it. Returns
+    the redacted text and the final cut.
+    """
+    with metrics.stage("detection"):
+        spans = filter_spans_by_level(detect_spans(window, ner=ner, redaction_level=redaction_level), redaction_level)
+    spans = [span for span in spans if span.end > offset]
+    extended = max([cut] + [span.end for span in spans if span.start < cut])
+    while extended != cut:
+        cut = extended
+        extended = max([cut] + [span.end for span in spans if span.start < cut])
+
+    # Spans reaching back into text that was already sent are clipped to it
+    kept = [
+        PIISpan(span.pii_type, max(span.start, offset) - offset, span.end - offset, 0, span.source, span.score)
+        for span in spans
+        if span.start < cut
+    ]
+    text = window[offset:cut]
+    _count_hits(spans_to_dict(text, kept))
+    return redact_spans(text, kept), cut
+
+
+def redact_text_stream(pieces, redaction_level, ner=True, chunk_chars=TEXT_CHUNK_CHARS, overlap=TEXT_CHUNK_OVERLAP):
+    """
+    Redact a text given as an iterable of pieces, yielding the redacted text
+    window by window.
+    """
+    # window[:offset] has been sent already and is kept as left context
+    window = ""
+    offset = 0
+    pending = []
+    pending_chars = 0
+    for piece in pieces:
+        pending.append(piece)
+        pending_chars += len(piece)
+        if len(window) - offset + pending_chars < chunk_chars + overlap:
+            continue
+        window += "".join(pending)
+        pending = []
+        pending_chars = 0
+        while len(window) - offset >= chunk_chars + overlap:
+            end = offset + chunk_chars + overlap
+            redacted, cut = _redact_window(window[:end], offset, offset + chunk_chars, redaction_level, ner)
+            yield redacted
+            # Start the next window's left context on a word boundary so the
+            # regexes do not match the tail of a longer token
+            match = _WHITESPACE.search(window, max(0, cut - overlap), cut)
+            start = match.end() if match else max(0, cut - overlap)
+            window = window[start:]
+            offset = cut - start
+
+    window += "".join(pending)
+    if offset < len(window):
+        redacted, _ = _redact_window(window, offset, len(window), redaction_level, ner)
+        yield redacted
+
+
+def _parse_record(line):
+    record = json.loads(line)
+    if isinstance(record, str):
+        return None, record
+    if isinstance(record, dict) and isinstance(record.get("text"), str):
+        return record.get("id"), record["text"]
+    raise ValueError('expected a JSON string or an object with a "text" string')
+
+
+def _redact_batch(batch, redaction_level, ner):
+    texts = [text for _, text in batch]
+    with metrics.stage("detection"):
+        batch_spans = detect_spans_batch(texts, redaction_level=redaction_level, ner=ner)
+
+    for (record_id, text), spans in zip(batch, batch_spans):
+        spans = filter_spans_by_level(spans, redaction_level)
+        detected_pii = spans_to_dict(text, spans)
+        _count_hits(detected_pii)
+        result = {"redacted_text": redact_spans(text, spans), "detected_pii": detected_pii}
+        if record_id is not None:
+            result["id"] = record_id
+        yield json.dumps(result) + "\n"
+
+
+def redact_records(lines, redaction_level, ner=True, batch_size=TEXT_BATCH_RECORDS):
+    """
+    Redact NDJSON records, yielding one NDJSON result line per record.
+
+    Lines that cannot be parsed produce ``{"line": n, "error": ...}``.
+    """
+    batch = []
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            record_id, text = _parse_record(line)
+        except ValueError as e:
+            # Flush first so results stay in input order
+            yield from _redact_batch(batch, redaction_level, ner)
+            batch = []
+            yield json.dumps({"line": line_number, "error": f"Invalid record: {e}"}) + "\n"
+            continue
+        batch.append((record_id, text))
+        if len(batch) >= batch_size:
+            yield from _redact_batch(batch, redaction_level, ner)
+            batch = []
+    yield from _redact_batch(batch, redaction_level, ner)
@@ -2,16 +2,18 @@
 Production WSGI entry point for the PII Redaction WebApp
 Use with: gunicorn --worker-class sync --threads 4 -w 1 --bind 0.0.0.0:5000 wsgi:application
 """
+import logging
 import os
 
-# Print environment info for debugging
-print(f"🔧 PORT environment variable: {os.getenv('PORT', 'NOT SET')}")
-print(f"🔧 FLASK_ENV: {os.getenv('FLASK_ENV', 'NOT SET')}")
-
 from app import app
 
+logger = logging.getLogger(__name__)
+
+# Log environment info for debugging
+logger.info("PORT environment variable: %s", os.getenv("PORT", "NOT SET"))
+logger.info("FLASK_ENV: %s", os.getenv("FLASK_ENV", "NOT SET"))
+
 # For production with gunicorn
 application = app
 
-print("✅ WSGI application loaded successfully")
-
+logger.info("WSGI application loaded successfully")